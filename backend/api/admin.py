@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import User, CandidateProfile, LinkedRepository, Assessment, AssessmentAttempt
+from .models import User, CandidateProfile, LinkedRepository, Assessment, AssessmentAttempt, AnalysisJob
 
 # Register your models here.
 admin.site.register(User)
@@ -7,3 +7,4 @@ admin.site.register(CandidateProfile)
 admin.site.register(LinkedRepository)
 admin.site.register(Assessment)
 admin.site.register(AssessmentAttempt)
+admin.site.register(AnalysisJob)
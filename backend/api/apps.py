@@ -1,6 +1,22 @@
+import sys
+import threading
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        # The development server clears out clones left behind by crashed
+        # workers, and reclaims mirror space if it is due, when it starts.
+        # Deployed servers (gunicorn, scripts calling django.setup()) do not:
+        # run `manage.py maintain_workspaces` from cron there instead
+        command = sys.argv[1] if len(sys.argv) > 1 and sys.argv[0].endswith('manage.py') else None
+        if settings.WORKSPACE_GC_ON_STARTUP and command == 'runserver':
+            from .services.workspace_manager import workspace_manager
+            threading.Thread(target=workspace_manager.collect_garbage_once, daemon=True).start()
+            if settings.GIT_MIRROR_CACHE:
+                from .services.git_clone import MirrorCache
+                MirrorCache().maybe_maintain()
@@ -0,0 +1,33 @@
+import signal
+import threading
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from api.services.analysis_jobs import AnalysisWorker
+
+class Command(BaseCommand):
+    help = 'Run queued analysis jobs; start one or more on every host that shares the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, help='Jobs run at once (default: ANALYSIS_WORKERS)')
+        parser.add_argument('--once', action='store_true', help='Run the jobs that are ready, then exit')
+
+    def handle(self, *args, **options):
+        worker = AnalysisWorker()
+        if options['once']:
+            self.stdout.write(f'Ran {worker.run_pending()} analysis jobs')
+            return
+        # SIGTERM stops claiming new jobs and lets the running ones finish;
+        # a second one exits at once and leaves their leases to expire
+        stop = threading.Event()
+
+        def shutdown(signum, frame):
+            if stop.is_set():
+                raise SystemExit(1)
+            self.stdout.write('Finishing running analysis jobs before exiting')
+            stop.set()
+
+        signal.signal(signal.SIGTERM, shutdown)
+        try:
+            worker.serve_forever(options['threads'] or settings.ANALYSIS_WORKERS, stop)
+        except KeyboardInterrupt:
+            self.stdout.write('Analysis worker stopped')
@@ -0,0 +1,14 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from api.services.git_clone import MirrorCache
+from api.services.workspace_manager import workspace_manager
+
+class Command(BaseCommand):
+    help = 'Remove abandoned clones, evict workspaces and mirrors over quota and repack the object cache; run from cron'
+
+    def handle(self, *args, **options):
+        workspace_manager.collect_garbage_once()
+        workspace_manager.enforce_quota()
+        if settings.GIT_MIRROR_CACHE:
+            MirrorCache().maintain()
+        self.stdout.write('Workspace maintenance finished')
@@ -0,0 +1,30 @@
+from concurrent.futures import wait
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from api.services.refresh_scheduler import RefreshScheduler
+from api.views import update_candidate_skills
+
+class Command(BaseCommand):
+    help = 'Periodically re-analyze linked repositories whose default branch has new commits'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Run one cycle and exit, after its analyses when they run in this process')
+        parser.add_argument('--interval', type=float, help='Seconds between cycles (default: REFRESH_INTERVAL_SECONDS)')
+        parser.add_argument('--jitter', type=float, help='Random spread of the interval, as a fraction (default: REFRESH_JITTER)')
+        parser.add_argument('--max-per-cycle', type=int, help='Re-analyses queued per cycle (default: REFRESH_MAX_PER_CYCLE)')
+
+    def handle(self, *args, **options):
+        scheduler = RefreshScheduler(options['max_per_cycle'], on_complete=update_candidate_skills)
+        if options['once']:
+            futures = scheduler.run_cycle()
+            if settings.ANALYSIS_QUEUE != 'local':
+                # The analyses run on analysis_worker processes; there is nothing here to wait for
+                self.stdout.write(f'Queued {len(futures)} repositories for re-analysis')
+                return
+            wait(futures)
+            self.stdout.write(f'Re-analyzed {len(futures)} repositories')
+            return
+        try:
+            scheduler.run_forever(options['interval'], options['jitter'])
+        except KeyboardInterrupt:
+            self.stdout.write('Refresh scheduler stopped')
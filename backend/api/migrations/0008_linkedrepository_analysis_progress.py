@@ -0,0 +1,18 @@
+# Generated by Django 5.0.3 on 2026-10-19 00:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_candidateprofile_overall_score'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='linkedrepository',
+            name='analysis_progress',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.0.3 on 2026-10-19 00:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_linkedrepository_analysis_progress'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GitHubRateLimit',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token_key', models.CharField(max_length=64)),
+                ('resource', models.CharField(default='core', max_length=32)),
+                ('limit', models.IntegerField(blank=True, null=True)),
+                ('remaining', models.IntegerField(blank=True, null=True)),
+                ('reset_at', models.DateTimeField(blank=True, null=True)),
+                ('blocked_until', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'unique_together': {('token_key', 'resource')},
+            },
+        ),
+    ]
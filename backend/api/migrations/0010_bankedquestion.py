@@ -0,0 +1,28 @@
+# Generated by Django 5.0.3 on 2026-10-19 00:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_githubratelimit'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BankedQuestion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('commit', models.CharField(db_index=True, max_length=40)),
+                ('topic', models.CharField(db_index=True, default='project', max_length=100)),
+                ('fingerprint', models.CharField(max_length=64, unique=True)),
+                ('text', models.TextField()),
+                ('options', models.JSONField()),
+                ('correct_answer', models.IntegerField()),
+                ('explanation', models.TextField(blank=True)),
+                ('times_served', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
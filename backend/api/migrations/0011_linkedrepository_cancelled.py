@@ -0,0 +1,18 @@
+# Generated by Django 5.0.3 on 2026-10-19 00:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_bankedquestion'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='linkedrepository',
+            name='analysis_status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('analyzing', 'Analyzing'), ('complete', 'Complete'), ('failed', 'Failed'), ('cancelled', 'Cancelled')], default='pending', max_length=20),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.3 on 2026-10-19 01:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_analysisjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='analysisjob',
+            name='commit',
+            field=models.CharField(blank=True, max_length=40),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.0.3 on 2026-10-19 01:03
+
+from django.db import migrations, models
+
+
+def key_existing_assessments(apps, schema_editor):
+    # Assessments did not record their commit: credit them to the commit the
+    # repository was last analyzed at, keep the first as the one for that
+    # commit and mark the later ones as the retakes they were
+    Assessment = apps.get_model('api', 'Assessment')
+    seen = set()
+    for assessment in Assessment.objects.select_related('repository').order_by('created_at', 'id'):
+        results = assessment.repository.analysis_results or {}
+        assessment.commit = (results.get('project_info') or {}).get('commit') or ''
+        assessment.retake = assessment.repository_id in seen
+        seen.add(assessment.repository_id)
+        assessment.save(update_fields=['commit', 'retake'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_analysisjob_commit'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='assessment',
+            name='commit',
+            field=models.CharField(blank=True, max_length=40),
+        ),
+        migrations.AddField(
+            model_name='assessment',
+            name='retake',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(key_existing_assessments, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='assessment',
+            constraint=models.UniqueConstraint(condition=models.Q(('retake', False)), fields=('repository', 'commit'), name='one_assessment_per_commit'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.0.3 on 2026-10-19 01:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_assessment_commit'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='bankedquestion',
+            name='fingerprint',
+            field=models.CharField(db_index=True, max_length=64),
+        ),
+        migrations.AlterUniqueTogether(
+            name='bankedquestion',
+            unique_together={('commit', 'fingerprint')},
+        ),
+    ]
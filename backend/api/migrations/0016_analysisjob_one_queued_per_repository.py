@@ -0,0 +1,28 @@
+# Generated by Django 5.0.3 on 2026-10-19 01:26
+
+from django.db import migrations, models
+
+
+def cancel_duplicate_queued_jobs(apps, schema_editor):
+    # Keep each repository's newest queued job, which has its latest commit
+    AnalysisJob = apps.get_model('api', 'AnalysisJob')
+    seen = set()
+    for job in AnalysisJob.objects.filter(status='queued').order_by('-created_at', '-id'):
+        if job.repository_id in seen:
+            AnalysisJob.objects.filter(id=job.id).update(status='cancelled', last_error='Superseded by a newer job')
+        seen.add(job.repository_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_bankedquestion_per_commit'),
+    ]
+
+    operations = [
+        migrations.RunPython(cancel_duplicate_queued_jobs, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='analysisjob',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'queued')), fields=('repository',), name='one_queued_job_per_repository'),
+        ),
+    ]
@@ -1,6 +1,7 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser
 from django.db.models import JSONField
+from django.utils import timezone
 
 class User(AbstractUser):
     ROLE_CHOICES = (
@@ -51,16 +52,31 @@ class LinkedRepository(models.Model):
             ('pending', 'Pending'),
             ('analyzing', 'Analyzing'),
             ('complete', 'Complete'),
-            ('failed', 'Failed')
+            ('failed', 'Failed'),
+            ('cancelled', 'Cancelled')
         ],
         default='pending'
     )
     analysis_results = JSONField(default=dict, null=True, blank=True)
+    # Per-stage status, timestamps and partial results of the current or last analysis
+    analysis_progress = JSONField(default=dict, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    def scored_assessment(self):
+        """The assessment employers see: the first one completed, so retakes and re-analyses cannot replace its score"""
+        first_assessments = self.assessments.filter(retake=False)
+        return (
+            first_assessments.filter(completed_at__isnull=False).order_by('completed_at').first()
+            or first_assessments.order_by('-created_at').first()
+        )
+
 class Assessment(models.Model):
     repository = models.ForeignKey(LinkedRepository, on_delete=models.CASCADE, related_name='assessments')
+    # The analyzed commit the questions were drawn for; a re-analysis of new
+    # code gets a new assessment, and each commit has one that is not a retake
+    commit = models.CharField(max_length=40, blank=True)
+    retake = models.BooleanField(default=False)
     questions = JSONField()
     correct_answers = models.IntegerField(null=True, blank=True)
     score = models.IntegerField(null=True, blank=True)
@@ -68,6 +84,15 @@ class Assessment(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['repository', 'commit'],
+                condition=models.Q(retake=False),
+                name='one_assessment_per_commit'
+            )
+        ]
+
 class AssessmentAttempt(models.Model):
     assessment = models.ForeignKey(Assessment, on_delete=models.CASCADE, related_name='attempts')
     candidate = models.ForeignKey(CandidateProfile, on_delete=models.CASCADE)
@@ -75,4 +100,75 @@ class AssessmentAttempt(models.Model):
     correct_answers = models.IntegerField()
     score = models.IntegerField()
     time_spent = models.IntegerField()
-    completed_at = models.DateTimeField(auto_now_add=True)
\ No newline at end of file
+    completed_at = models.DateTimeField(auto_now_add=True)
+
+class GitHubRateLimit(models.Model):
+    # Last known GitHub budget of one token (by hash) and API resource, shared by every worker
+    token_key = models.CharField(max_length=64)
+    resource = models.CharField(max_length=32, default='core')
+    limit = models.IntegerField(null=True, blank=True)
+    remaining = models.IntegerField(null=True, blank=True)
+    reset_at = models.DateTimeField(null=True, blank=True)
+    blocked_until = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('token_key', 'resource')
+
+class BankedQuestion(models.Model):
+    # A validated assessment question kept for reuse: project questions by the
+    # commit they were written for, technology questions by their technology
+    commit = models.CharField(max_length=40, db_index=True)
+    topic = models.CharField(max_length=100, default='project', db_index=True)
+    fingerprint = models.CharField(max_length=64, db_index=True)
+    text = models.TextField()
+    options = JSONField()
+    correct_answer = models.IntegerField()
+    explanation = models.TextField(blank=True)
+    times_served = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        # A question asked of two commits is banked for each of them
+        unique_together = ('commit', 'fingerprint')
+
+class AnalysisJob(models.Model):
+    # One queued or running analysis of a repository. A worker owns a running
+    # job only while its lease is current; heartbeats extend the lease, and an
+    # expired one is handed to another worker
+    repository = models.ForeignKey(LinkedRepository, on_delete=models.CASCADE, related_name='analysis_jobs')
+    mode = models.CharField(max_length=10, default='full')
+    # The commit to analyze, recorded when the job is queued; blank for the head at run time
+    commit = models.CharField(max_length=40, blank=True)
+    status = models.CharField(
+        max_length=20,
+        choices=[
+            ('queued', 'Queued'),
+            ('running', 'Running'),
+            ('complete', 'Complete'),
+            ('failed', 'Failed'),
+            ('cancelled', 'Cancelled')
+        ],
+        default='queued',
+        db_index=True
+    )
+    # Dotted path of the function called with the repository after a successful analysis
+    callback = models.CharField(max_length=255, blank=True)
+    attempts = models.IntegerField(default=0)
+    worker = models.CharField(max_length=255, blank=True)
+    available_at = models.DateTimeField(default=timezone.now)
+    lease_expires_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            # Pushes that race to queue a repository's analysis share one job
+            models.UniqueConstraint(
+                fields=['repository'],
+                condition=models.Q(status='queued'),
+                name='one_queued_job_per_repository'
+            )
+        ]
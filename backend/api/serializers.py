@@ -34,7 +34,7 @@ class EmployerProfileSerializer(serializers.ModelSerializer):
 class LinkedRepositorySerializer(serializers.ModelSerializer):
     class Meta:
         model = LinkedRepository
-        fields = ('id', 'repo_name', 'repo_url', 'description', 'languages', 'analysis_status', 'analysis_results')
+        fields = ('id', 'repo_name', 'repo_url', 'description', 'languages', 'analysis_status', 'analysis_results', 'analysis_progress')
 
 class AssessmentSerializer(serializers.ModelSerializer):
     class Meta:
@@ -138,10 +138,10 @@ class CandidateDetailSerializer(serializers.ModelSerializer):
         count = 0
         
         for repo in repositories:
-            # Get latest assessment
-            latest_assessment = repo.assessments.order_by('-created_at').first()
-            if latest_assessment and latest_assessment.score:
-                total_score += latest_assessment.score
+            # The first completed assessment counts; retakes do not replace it
+            scored_assessment = repo.scored_assessment()
+            if scored_assessment and scored_assessment.score:
+                total_score += scored_assessment.score
                 count += 1
                 
             # Consider analysis results if available
@@ -0,0 +1,300 @@
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import timedelta
+from typing import Callable, Dict, Optional
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from loguru import logger
+from api.models import AnalysisJob, LinkedRepository
+from api.services.resource_limits import lower_thread_priority
+
+def callback_path(callback: Optional[Callable]) -> str:
+    """The dotted path a worker in another process imports the callback from"""
+    if callback is None:
+        return ''
+    path = f"{callback.__module__}.{callback.__qualname__}"
+    if '<locals>' in path:
+        raise ValueError(f"{path} cannot be imported by a worker; pass a module-level function")
+    return path
+
+def enqueue(
+    repository: LinkedRepository,
+    mode: str,
+    on_complete: Optional[Callable] = None,
+    commit: Optional[str] = None,
+    delay: float = 0
+) -> AnalysisJob:
+    """Queue an analysis of repository at commit (its head if None), ready to run after delay seconds.
+
+    A job already waiting for the repository is reused: it takes the new
+    mode and commit, and a delay restarts its wait. If a worker claims that
+    job first, a new one is queued; the one_queued_job_per_repository
+    constraint makes two enqueues that race end up with the same job.
+    """
+    repository.analysis_status = 'analyzing'
+    repository.save(update_fields=['analysis_status', 'updated_at'])
+    callback = callback_path(on_complete)
+    while True:
+        now = timezone.now()
+        job = AnalysisJob.objects.filter(repository=repository, status='queued').first()
+        if job:
+            fields = {'mode': mode, 'commit': commit or '', 'callback': callback or job.callback, 'updated_at': now}
+            if delay:
+                fields['available_at'] = now + timedelta(seconds=delay)
+            if AnalysisJob.objects.filter(id=job.id, status='queued').update(**fields):
+                for name, value in fields.items():
+                    setattr(job, name, value)
+                return job
+            # Claimed since we looked; it runs the old commit, so this one needs a job of its own
+        try:
+            with transaction.atomic():
+                return AnalysisJob.objects.create(
+                    repository=repository, mode=mode, commit=commit or '', callback=callback,
+                    available_at=now + timedelta(seconds=delay)
+                )
+        except IntegrityError:
+            # Another enqueue created the job since we looked; reuse it
+            continue
+
+def cancel_queued(repository_id) -> int:
+    return AnalysisJob.objects.filter(repository_id=repository_id, status='queued').update(
+        status='cancelled', updated_at=timezone.now()
+    )
+
+def ready_jobs():
+    """Queued jobs that can run now: past their delay, with no job of their repository running"""
+    # A repository's next job waits until its running one has finished
+    running = AnalysisJob.objects.filter(status='running').values('repository')
+    return AnalysisJob.objects.filter(status='queued', available_at__lte=timezone.now()).exclude(repository__in=running)
+
+def requeue_expired() -> int:
+    """Hand the jobs of workers that stopped heartbeating to the next worker.
+
+    A job keeps its attempt count across workers. Once it has been
+    attempted ANALYSIS_JOB_MAX_ATTEMPTS times it fails, and so does its
+    repository, instead of crashing workers forever. Each requeue waits a
+    little longer before the job can be claimed again.
+    """
+    now = timezone.now()
+    requeued = 0
+    for job in AnalysisJob.objects.filter(status='running', lease_expires_at__lt=now):
+        # Conditional on the lease we saw, so a late heartbeat or another worker's requeue wins
+        current = AnalysisJob.objects.filter(
+            id=job.id, status='running', worker=job.worker, lease_expires_at=job.lease_expires_at
+        )
+        error = f"Worker {job.worker} stopped renewing its lease (attempt {job.attempts})"
+        if job.attempts >= settings.ANALYSIS_JOB_MAX_ATTEMPTS:
+            if current.update(status='failed', last_error=error, lease_expires_at=None, updated_at=now):
+                logger.error(f"Analysis job {job.id} failed: {error}; giving up")
+                LinkedRepository.objects.filter(id=job.repository_id, analysis_status='analyzing').update(
+                    analysis_status='failed', updated_at=now
+                )
+            continue
+        # Never sooner than the next heartbeat, so a worker that is only slow
+        # finds out it lost the job and cancels its run before another claims it
+        delay = max(
+            settings.ANALYSIS_JOB_RETRY_DELAY_SECONDS * 2 ** (job.attempts - 1),
+            settings.ANALYSIS_JOB_HEARTBEAT_SECONDS
+        )
+        try:
+            with transaction.atomic():
+                requeued_job = current.update(
+                    status='queued', worker='', last_error=error, lease_expires_at=None,
+                    available_at=now + timedelta(seconds=delay), updated_at=now
+                )
+        except IntegrityError:
+            # A push queued a newer job for the repository meanwhile, and that one runs instead
+            if current.update(
+                status='cancelled', last_error=f"{error}; superseded by a newer job",
+                lease_expires_at=None, updated_at=now
+            ):
+                logger.warning(f"Analysis job {job.id}: {error}; a newer job replaces it")
+            continue
+        if requeued_job:
+            logger.warning(f"Analysis job {job.id}: {error}; requeued")
+            requeued += 1
+    return requeued
+
+class AnalysisWorker:
+    """Claims queued analysis jobs and runs them under a lease.
+
+    Any number of workers, on any number of hosts, can share the database.
+    A claim is a conditional update, so exactly one worker wins each job.
+    While a job runs, a heartbeat thread renews its lease every
+    ANALYSIS_JOB_HEARTBEAT_SECONDS. If the worker dies, the lease lapses
+    after ANALYSIS_JOB_LEASE_SECONDS, and the next worker to look requeues
+    the job; stage checkpoints let the new attempt resume where the old one
+    stopped. A worker that finds its lease taken cancels its own run,
+    so a job never keeps two workers busy, and a requeued job waits at
+    least one heartbeat first. The lease, not repository_lock, is what
+    keeps workers on different hosts apart: that lock is an flock, which
+    only spans hosts when ANALYSIS_LOCK_DIR is on shared storage. A run
+    that lost its lease anyway does not store its results.
+    """
+
+    def __init__(self, worker_id: Optional[str] = None):
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.held: Dict[int, int] = {}  # job id -> repository id
+        self.lock = threading.Lock()
+        self.heartbeat_thread: Optional[threading.Thread] = None
+
+    def claim(self, job_id: Optional[int] = None) -> Optional[AnalysisJob]:
+        """The oldest job that is ready to run, or job_id if it is, now leased to this worker"""
+        now = timezone.now()
+        ready = ready_jobs() if job_id is None else ready_jobs().filter(id=job_id)
+        candidates = list(ready.order_by('available_at', 'id').values_list('id', flat=True)[:10])
+        for job_id in candidates:
+            claimed = AnalysisJob.objects.filter(id=job_id, status='queued').update(
+                status='running',
+                worker=self.worker_id,
+                attempts=F('attempts') + 1,
+                lease_expires_at=now + timedelta(seconds=settings.ANALYSIS_JOB_LEASE_SECONDS),
+                heartbeat_at=now,
+                updated_at=now
+            )
+            if claimed:
+                job = AnalysisJob.objects.select_related('repository').get(id=job_id)
+                with self.lock:
+                    self.held[job.id] = job.repository_id
+                self._start_heartbeat()
+                return job
+        return None
+
+    def run_next(self) -> bool:
+        """Requeue expired jobs, then run the next ready one; False if there was none"""
+        try:
+            requeue_expired()
+            job = self.claim()
+            if job is None:
+                return False
+            self.execute(job)
+            return True
+        finally:
+            # Worker threads are reused, so give back their database connection
+            close_old_connections()
+
+    def run_pending(self) -> int:
+        """Run ready jobs until there are none; returns how many ran"""
+        ran = 0
+        while self.run_next():
+            ran += 1
+        return ran
+
+    def serve_forever(self, concurrency: int, stop: threading.Event):
+        """Run up to concurrency jobs at a time until stop is set, then let the running ones finish"""
+        def loop():
+            lower_thread_priority()
+            while not stop.is_set():
+                try:
+                    ran = self.run_next()
+                except Exception as e:
+                    logger.error(f"Analysis worker {self.worker_id} failed to poll for jobs: {e}")
+                    ran = False
+                if not ran:
+                    stop.wait(settings.ANALYSIS_JOB_POLL_SECONDS)
+
+        logger.info(f"Analysis worker {self.worker_id} started with {concurrency} thread(s)")
+        threads = [
+            threading.Thread(target=loop, name=f'analysis-worker-{index}', daemon=True)
+            for index in range(concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def execute(self, job: AnalysisJob):
+        """Run a claimed job, record how it ended, and return the run's result or ErrorResponse"""
+        from api.services.analysis_runner import run_analysis
+        from api.services.repo_analyzer import ErrorResponse
+
+        repository = job.repository
+        logger.info(f"Worker {self.worker_id} running analysis job {job.id} (attempt {job.attempts})")
+        try:
+            # The job before this one may have completed the repository since; only a cancel stops it
+            if LinkedRepository.objects.filter(id=repository.id, analysis_status='cancelled').exists():
+                logger.info(f"Analysis of {repository.repo_url} was cancelled before it started")
+                self._finish(job, 'cancelled', 'Cancelled before it started')
+                return ErrorResponse(error="Analysis Cancelled", details="Cancelled before it started")
+            lease = AnalysisJob.objects.filter(id=job.id, worker=self.worker_id, status='running')
+            result = run_analysis(repository, job.mode, job.commit or None, lease=lease)
+            if isinstance(result, ErrorResponse):
+                outcome = 'cancelled' if result.error == 'Analysis Cancelled' else 'failed'
+                self._finish(job, outcome, f"{result.error}: {result.details}")
+                return result
+            self._finish(job, 'complete')
+        except Exception as e:
+            logger.error(f"Background analysis of {repository.repo_url} failed: {e}")
+            LinkedRepository.objects.filter(id=repository.id, analysis_status='analyzing').update(
+                analysis_status='failed', updated_at=timezone.now()
+            )
+            self._finish(job, 'failed', str(e))
+            return ErrorResponse(error="Analysis Failed", details=str(e))
+        finally:
+            with self.lock:
+                self.held.pop(job.id, None)
+
+        if job.callback:
+            try:
+                import_string(job.callback)(repository)
+            except Exception as e:
+                logger.error(f"Completion callback {job.callback} for {repository.repo_url} failed: {e}")
+        return result
+
+    def heartbeat(self):
+        """Renew the leases of the held jobs; cancel the runs whose lease was lost"""
+        from api.services.analysis_runner import cancel_run
+
+        with self.lock:
+            held = dict(self.held)
+        now = timezone.now()
+        for job_id, repository_id in held.items():
+            renewed = AnalysisJob.objects.filter(id=job_id, worker=self.worker_id, status='running').update(
+                lease_expires_at=now + timedelta(seconds=settings.ANALYSIS_JOB_LEASE_SECONDS),
+                heartbeat_at=now
+            )
+            if not renewed:
+                with self.lock:
+                    still_held = self.held.pop(job_id, None) is not None
+                if still_held:
+                    logger.warning(f"Worker {self.worker_id} lost the lease on analysis job {job_id}; stopping it")
+                    cancel_run(repository_id, 'The analysis job was handed to another worker')
+
+    def _finish(self, job: AnalysisJob, status: str, error: str = ''):
+        finished = AnalysisJob.objects.filter(id=job.id, worker=self.worker_id, status='running').update(
+            status=status, last_error=error, lease_expires_at=None, updated_at=timezone.now()
+        )
+        if not finished:
+            logger.warning(f"Analysis job {job.id} finished after its lease passed to another worker")
+
+    def _start_heartbeat(self):
+        with self.lock:
+            if self.heartbeat_thread and self.heartbeat_thread.is_alive():
+                return
+            self.heartbeat_thread = threading.Thread(
+                target=self._heartbeat_loop, name='analysis-heartbeat', daemon=True
+            )
+            self.heartbeat_thread.start()
+
+    def _heartbeat_loop(self):
+        while True:
+            time.sleep(settings.ANALYSIS_JOB_HEARTBEAT_SECONDS)
+            with self.lock:
+                if not self.held:
+                    self.heartbeat_thread = None
+                    return
+            try:
+                self.heartbeat()
+            except Exception as e:
+                logger.warning(f"Analysis heartbeat failed: {e}")
+            finally:
+                close_old_connections()
+
+# Runs jobs on this process's analysis threads when ANALYSIS_QUEUE is 'local'
+local_worker = AnalysisWorker()
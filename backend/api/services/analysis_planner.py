@@ -0,0 +1,271 @@
+import fnmatch
+import heapq
+import os
+from dataclasses import asdict, dataclass, field
+from typing import Dict, Iterable, List, Optional, Tuple
+from django.conf import settings
+from loguru import logger
+from api.services.github_client import GitHubClient, GitHubError
+from api.services.quick_metrics import SKIP_DIRS
+from api.services.workspace_manager import split_repo_url
+
+SOURCE_LANGUAGES = {
+    '.py': 'Python', '.js': 'JavaScript', '.jsx': 'JavaScript', '.mjs': 'JavaScript', '.cjs': 'JavaScript',
+    '.ts': 'TypeScript', '.tsx': 'TypeScript', '.java': 'Java', '.kt': 'Kotlin', '.scala': 'Scala',
+    '.go': 'Go', '.rs': 'Rust', '.rb': 'Ruby', '.php': 'PHP', '.cs': 'C#', '.c': 'C', '.h': 'C',
+    '.cpp': 'C++', '.cc': 'C++', '.hpp': 'C++', '.swift': 'Swift', '.m': 'Objective-C',
+    '.dart': 'Dart', '.vue': 'Vue', '.svelte': 'Svelte', '.html': 'HTML', '.css': 'CSS', '.scss': 'CSS',
+}
+
+# Files that say the most about a project per byte, so sampled ingests always start with them
+MANIFESTS = (
+    'README.md', 'README.rst', 'README', 'package.json', 'requirements.txt', 'pyproject.toml', 'setup.py',
+    'setup.cfg', 'Pipfile', 'pom.xml', 'build.gradle', 'build.gradle.kts', 'go.mod', 'Cargo.toml',
+    'Gemfile', 'composer.json', 'Dockerfile', 'docker-compose.yml', 'tsconfig.json', 'manage.py',
+)
+
+TEST_DIRS = {'test', 'tests', '__tests__', 'spec', 'specs', 'e2e', 'fixtures', 'testdata'}
+
+# A directory holding more than this share of the source is split rather than scoped as a whole
+DOMINANT_SHARE = 0.8
+
+# sonar.sources goes on the scanner's command line, so keep the scope list short
+MAX_SCOPE_ENTRIES = 200
+
+@dataclass
+class AnalysisPlan:
+    """How much of a repository one analysis looks at, and why.
+
+    full: everything goes to the AI summary and the scanner.
+    sampled: the scanner sees everything, the AI summary a capped set of files.
+    scoped: both only see the largest source directories that fit the limits.
+    """
+    strategy: str
+    reason: str
+    source: str                                  # where the file listing came from: github or checkout
+    file_count: int = 0
+    source_file_count: int = 0
+    source_bytes: int = 0
+    repo_size_kb: Optional[int] = None
+    languages: Dict[str, int] = field(default_factory=dict)
+    ingest_paths: Optional[List[str]] = None     # None: ingest everything
+    scan_paths: Optional[List[str]] = None       # None: scan the whole repository
+    limits: Dict = field(default_factory=dict)
+
+    @property
+    def ingest_max_file_bytes(self) -> int:
+        return self.limits.get('ingest_max_file_bytes', settings.ANALYSIS_PLAN_INGEST_MAX_FILE_BYTES)
+
+    def to_json(self) -> Dict:
+        return asdict(self)
+
+def is_checked_out(path: str) -> bool:
+    """Whether a path survives the sparse checkout and the directories analysis skips anyway"""
+    parts = path.split('/')
+    for directory in parts[:-1]:
+        if directory in SKIP_DIRS or directory.startswith('.'):
+            return False
+    for pattern in settings.GIT_SPARSE_EXCLUDES:
+        if pattern.endswith('/'):
+            if pattern.rstrip('/') in parts[:-1]:
+                return False
+        elif fnmatch.fnmatch(parts[-1], pattern):
+            return False
+    return True
+
+def source_language(path: str) -> Optional[str]:
+    return SOURCE_LANGUAGES.get(os.path.splitext(path)[1].lower())
+
+def scope_directories(files: List[Tuple[str, int]], max_bytes: int, max_files: int) -> List[str]:
+    """The largest source directories that together fit in max_bytes and max_files.
+
+    Directories too big to fit on their own are split into their
+    subdirectories, and finally into their files, so a monorepo still gets
+    its biggest packages scanned.
+    """
+    stats: Dict[str, List[int]] = {}
+    children: Dict[str, set] = {}
+    for path, size in files:
+        parts = path.split('/')
+        for depth in range(1, len(parts) + 1):
+            entry_path = '/'.join(parts[:depth])
+            entry = stats.setdefault(entry_path, [0, 0])
+            entry[0] += size
+            entry[1] += 1
+            children.setdefault('/'.join(parts[:depth - 1]), set()).add(entry_path)
+
+    # Walk down through wrappers like src/ or packages/ that hold nearly everything
+    top = ''
+    total = sum(size for _, size in files) or 1
+    while True:
+        dominant = [d for d in children.get(top, ()) if stats[d][0] > DOMINANT_SHARE * total]
+        if len(dominant) != 1 or not children.get(dominant[0]):
+            break
+        top = dominant[0]
+
+    heap = [(-stats[d][0], d) for d in children.get(top, ())]
+    heapq.heapify(heap)
+    chosen, used_bytes, used_files = [], 0, 0
+    while heap and len(chosen) < MAX_SCOPE_ENTRIES:
+        _, directory = heapq.heappop(heap)
+        size, count = stats[directory]
+        if used_bytes + size <= max_bytes and used_files + count <= max_files:
+            chosen.append(directory)
+            used_bytes += size
+            used_files += count
+        else:
+            for child in children.get(directory, ()):
+                heapq.heappush(heap, (-stats[child][0], child))
+    return sorted(chosen)
+
+def sample_files(
+    files: List[Tuple[str, int]],
+    scope: Optional[List[str]],
+    primary_language: Optional[str],
+    max_files: int,
+    max_bytes: int,
+    max_file_bytes: int
+) -> List[str]:
+    """Pick the files the AI summary sees: manifests first, then shallow source files of the main language"""
+    def in_scope(path: str) -> bool:
+        return not scope or any(path == entry or path.startswith(entry + '/') for entry in scope)
+
+    def rank(item: Tuple[str, int]):
+        path, size = item
+        parts = path.split('/')
+        is_manifest = parts[-1] in MANIFESTS
+        return (
+            not is_manifest,
+            len(parts),
+            source_language(path) != primary_language,
+            size,
+            path
+        )
+
+    candidates = []
+    for path, size in files:
+        parts = path.split('/')
+        if size > max_file_bytes:
+            continue
+        if any(part.lower() in TEST_DIRS for part in parts[:-1]):
+            continue
+        if parts[-1] in MANIFESTS:
+            # Root manifests, and those of the scoped packages
+            if len(parts) == 1 or in_scope(path):
+                candidates.append((path, size))
+        elif source_language(path) and in_scope(path):
+            candidates.append((path, size))
+
+    chosen, used_bytes = [], 0
+    for path, size in sorted(candidates, key=rank):
+        if len(chosen) >= max_files:
+            break
+        if used_bytes + size > max_bytes:
+            continue
+        chosen.append(path)
+        used_bytes += size
+    return chosen
+
+class AnalysisPlanner:
+    """Chooses a bounded analysis strategy for a repository before it is analyzed.
+
+    The file listing comes from GitHub's recursive tree API, which costs
+    one request and no clone, or from the checkout when GitHub cannot
+    answer. Repositories whose text fits the LLM budget are analyzed in
+    full. Larger ones get a sampled AI ingest. Repositories too big for the
+    scanner are scoped to their largest source directories, so the work
+    any one analysis does is capped by the ANALYSIS_PLAN_* limits.
+    """
+
+    def __init__(self, github: Optional[GitHubClient] = None):
+        self.github = github or GitHubClient()
+
+    def plan_from_github(self, repo_url: str, ref: Optional[str] = None) -> Optional[AnalysisPlan]:
+        owner, name = split_repo_url(repo_url)
+        try:
+            metadata = self.github.get_repository(f'{owner}/{name}')
+            tree = self.github.get_tree(f'{owner}/{name}', ref or metadata['default_branch'])
+        except (GitHubError, KeyError, ValueError) as e:
+            logger.warning(f"Could not plan {repo_url} from GitHub ({e}); planning from the checkout")
+            return None
+        if tree.get('truncated'):
+            # More entries than the API lists; the checkout has the full picture
+            logger.info(f"GitHub tree listing for {repo_url} is truncated; planning from the checkout")
+            return None
+        files = [
+            (entry['path'], entry.get('size', 0))
+            for entry in tree.get('tree', [])
+            if entry.get('type') == 'blob'
+        ]
+        return self.plan(files, source='github', repo_size_kb=metadata.get('size'))
+
+    def plan_from_checkout(self, repo_dir: str) -> AnalysisPlan:
+        files = []
+        for dirpath, dirnames, filenames in os.walk(repo_dir):
+            dirnames[:] = [d for d in dirnames if d != '.git']
+            for filename in filenames:
+                full_path = os.path.join(dirpath, filename)
+                try:
+                    size = os.path.getsize(full_path)
+                except OSError:
+                    continue
+                files.append((os.path.relpath(full_path, repo_dir).replace(os.sep, '/'), size))
+        return self.plan(files, source='checkout')
+
+    def plan(self, files: Iterable[Tuple[str, int]], source: str, repo_size_kb: Optional[int] = None) -> AnalysisPlan:
+        limits = {
+            'ingest_max_files': settings.ANALYSIS_PLAN_INGEST_MAX_FILES,
+            'ingest_max_bytes': settings.ANALYSIS_PLAN_INGEST_MAX_BYTES,
+            'ingest_max_file_bytes': settings.ANALYSIS_PLAN_INGEST_MAX_FILE_BYTES,
+            'scan_max_files': settings.ANALYSIS_PLAN_SCAN_MAX_FILES,
+            'scan_max_bytes': settings.ANALYSIS_PLAN_SCAN_MAX_BYTES,
+            'scan_timeout_seconds': settings.SONAR_SCANNER_TIMEOUT,
+        }
+        files = [(path, size) for path, size in files if is_checked_out(path)]
+        sources = [(path, size) for path, size in files if source_language(path)]
+        languages: Dict[str, int] = {}
+        for path, size in sources:
+            language = source_language(path)
+            languages[language] = languages.get(language, 0) + size
+        primary_language = max(languages, key=languages.get) if languages else None
+        text_bytes = sum(size for path, size in files if size <= limits['ingest_max_file_bytes'])
+        source_bytes = sum(size for _, size in sources)
+
+        plan = AnalysisPlan(
+            strategy='full',
+            reason='',
+            source=source,
+            file_count=len(files),
+            source_file_count=len(sources),
+            source_bytes=source_bytes,
+            repo_size_kb=repo_size_kb,
+            languages=dict(sorted(languages.items(), key=lambda item: -item[1])),
+            limits=limits
+        )
+
+        if len(files) <= limits['ingest_max_files'] and text_bytes <= limits['ingest_max_bytes']:
+            plan.reason = 'Repository fits the AI summary budget'
+            return plan
+
+        if len(sources) <= limits['scan_max_files'] and source_bytes <= limits['scan_max_bytes']:
+            plan.strategy = 'sampled'
+            plan.reason = (
+                f"{len(files)} files / {text_bytes} bytes exceed the AI summary budget; "
+                f"summarizing a sample"
+            )
+        else:
+            plan.strategy = 'scoped'
+            plan.scan_paths = scope_directories(sources, limits['scan_max_bytes'], limits['scan_max_files']) or None
+            plan.reason = (
+                f"{len(sources)} source files / {source_bytes} bytes exceed the scanner budget; "
+                f"analyzing {len(plan.scan_paths or [])} of the largest source paths"
+            )
+            if plan.scan_paths is None:
+                # Only happens when every source file is bigger than the scan budget
+                plan.reason += '; nothing fits, scanning everything'
+
+        plan.ingest_paths = sample_files(
+            files, plan.scan_paths, primary_language,
+            limits['ingest_max_files'], limits['ingest_max_bytes'], limits['ingest_max_file_bytes']
+        )
+        return plan
@@ -0,0 +1,279 @@
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Union
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import QuerySet
+from django.utils import timezone
+from loguru import logger
+from api.models import AnalysisJob, LinkedRepository
+from api.services.analysis_jobs import cancel_queued, enqueue, local_worker, ready_jobs, requeue_expired
+from api.services.assessment_prewarm import prewarm_assessment
+from api.services.cancellation import CancelToken
+from api.services.git_clone import GitCloner
+from api.services.progress import STAGES, AnalysisProgress
+from api.services.resource_limits import lower_thread_priority
+from api.services.repo_analyzer import ErrorResponse, RepoAnalyzer
+from api.services.single_flight import LockTimeout, SingleFlight, repository_lock
+
+analysis_flight = SingleFlight()
+# Analysis threads run at a lower CPU and I/O priority than the threads serving requests
+analysis_executor = ThreadPoolExecutor(
+    max_workers=settings.ANALYSIS_WORKERS, thread_name_prefix='analysis', initializer=lower_thread_priority
+)
+
+# Progress of each in-flight analysis, so requests that join it publish the same
+# stages, and the token that cancels it
+_progress: Dict[str, AnalysisProgress] = {}
+_cancel_tokens: Dict[str, CancelToken] = {}
+_progress_lock = threading.Lock()
+
+def normalize_repo_url(repo_url: str) -> str:
+    return repo_url.rstrip('/').removesuffix('.git').lower()
+
+def find_completed_analysis(repo_url: str, commit: Optional[str], mode: str = 'full') -> Optional[Dict]:
+    """Results another request already produced for this exact commit.
+
+    A quick request is happy with any results, but a full request only
+    reuses results that came from SonarQube.
+    """
+    if not commit:
+        return None
+    matches = LinkedRepository.objects.filter(
+        repo_url__iexact=repo_url,
+        analysis_status='complete',
+        analysis_results__project_info__commit=commit
+    ).only('analysis_results')
+    for match in matches:
+        engine = match.analysis_results.get('code_quality', {}).get('engine', 'sonar')
+        if mode == 'quick' or engine == 'sonar':
+            return match.analysis_results
+    return None
+
+def analyze_repository_url(
+    repo_url: str,
+    commit: Optional[str] = None,
+    mode: str = 'full',
+    repository_id=None
+) -> Union[Dict, ErrorResponse]:
+    """Analyze a repository at its current HEAD, sharing the work with every concurrent request.
+
+    Requests for the same repository and commit inside this process join a
+    single in-flight analysis. Across processes, a per-repository file lock
+    lets only one worker analyze at a time. The others wait, then pick up
+    the stored results for that commit instead of repeating the work.
+    Results only count once code quality metrics are present. mode='quick'
+    uses the built-in metrics engine instead of the AI review and SonarQube.
+    Stage progress is published to repository_id, and to the repositories
+    of every request that joins the run.
+    """
+    commit = commit or GitCloner().remote_head(repo_url)
+    key = f"{normalize_repo_url(repo_url)}@{commit or 'HEAD'}:{mode}"
+
+    with _progress_lock:
+        progress = _progress.get(key)
+        if progress is None:
+            progress = _progress[key] = AnalysisProgress(mode)
+            _cancel_tokens[key] = CancelToken(lambda: list(progress.repository_ids))
+        cancel_token = _cancel_tokens[key]
+    if repository_id is not None:
+        progress.attach(repository_id)
+
+    def run() -> Union[Dict, ErrorResponse]:
+        try:
+            with repository_lock(normalize_repo_url(repo_url)):
+                existing = find_completed_analysis(repo_url, commit, mode)
+                if existing:
+                    logger.info(f"Reusing completed analysis of {key}")
+                    for stage in STAGES:
+                        if progress.state["stages"][stage]["status"] == "pending":
+                            progress.finish(stage, {"reused": True})
+                    return existing
+
+                analyzer = RepoAnalyzer(
+                    github_token=settings.GITHUB_TOKEN,
+                    huggingface_token=settings.HUGGINGFACE_TOKEN,
+                    sonar_token=settings.SONAR_TOKEN,
+                    progress=progress,
+                    cancel_token=cancel_token,
+                )
+                # The commit the key and the reuse check were based on, even if the branch moved since
+                review_data = analyzer.analyze_repository(repo_url, mode, commit)
+                if isinstance(review_data, ErrorResponse):
+                    return review_data
+
+                analysis_json = review_data.to_json()
+                if not analysis_json.get('code_quality', {}).get('metrics'):
+                    return ErrorResponse(
+                        error="SonarQube Analysis Failed",
+                        details="Analysis finished without SonarQube metrics"
+                    )
+                return analysis_json
+        except LockTimeout as e:
+            return ErrorResponse(error="Analysis Busy", details=str(e))
+
+    try:
+        return analysis_flight.do(key, run)
+    finally:
+        with _progress_lock:
+            if _progress.get(key) is progress:
+                del _progress[key]
+                del _cancel_tokens[key]
+
+def _tokens_for(repository_id) -> List[CancelToken]:
+    with _progress_lock:
+        return [
+            _cancel_tokens[key] for key, progress in _progress.items()
+            if repository_id in progress.repository_ids
+        ]
+
+def cancel_analysis(repository: LinkedRepository) -> bool:
+    """Stop a repository's analysis; False if it was not being analyzed.
+
+    The repository stops waiting at once. The run itself is cancelled
+    when no other repository is waiting for it: right away if it runs in
+    this process, and at its next cancellation poll if it runs elsewhere.
+    """
+    cancelled = LinkedRepository.objects.filter(id=repository.id, analysis_status='analyzing').update(
+        analysis_status='cancelled', updated_at=timezone.now()
+    )
+    if not cancelled:
+        return False
+    cancel_queued(repository.id)
+    for token in _tokens_for(repository.id):
+        token.poll()
+    return True
+
+def cancel_run(repository_id, reason: str):
+    """Cancel this process's runs for a repository, whoever else is waiting for them"""
+    for token in _tokens_for(repository_id):
+        token.cancel(reason)
+
+def run_analysis(
+    repository: LinkedRepository,
+    mode: Optional[str] = None,
+    commit: Optional[str] = None,
+    lease: Optional[QuerySet] = None
+) -> Union[Dict, ErrorResponse]:
+    """Analyze a linked repository, at commit or its current head, and store the outcome on it.
+
+    lease, when given, is the running job's row; the results are only
+    stored while it still exists, that is while this worker holds the job.
+    """
+    repository.analysis_status = 'analyzing'
+    repository.save(update_fields=['analysis_status', 'updated_at'])
+
+    result = analyze_repository_url(
+        repository.repo_url, commit, mode=mode or settings.ANALYSIS_DEFAULT_MODE, repository_id=repository.id
+    )
+    # Only a repository still waiting for the result takes it; a cancelled
+    # or deleted one is left alone, and so is one whose job another worker
+    # took over after this run lost its lease
+    waiting = LinkedRepository.objects.filter(id=repository.id, analysis_status='analyzing')
+    if lease is not None and not lease.exists():
+        return ErrorResponse(error="Analysis Cancelled", details="The analysis job was handed to another worker")
+    if isinstance(result, ErrorResponse):
+        if result.error != "Analysis Cancelled" and waiting.update(analysis_status='failed', updated_at=timezone.now()):
+            repository.analysis_status = 'failed'
+        return result
+
+    if not waiting.update(analysis_results=result, analysis_status='complete', updated_at=timezone.now()):
+        return ErrorResponse(error="Analysis Cancelled", details="The repository was cancelled or deleted")
+    repository.analysis_results = result
+    repository.analysis_status = 'complete'
+    prewarm_assessment(repository)
+    return result
+
+def submit_analysis(
+    repository: LinkedRepository,
+    mode: Optional[str] = None,
+    on_complete: Optional[Callable[[LinkedRepository], None]] = None,
+    commit: Optional[str] = None,
+    delay: float = 0
+) -> Future:
+    """Queue an analysis job for commit, or the head when it runs; clients follow it through analysis_progress.
+
+    With ANALYSIS_QUEUE='local' this process's analysis threads run the
+    queue, and the future resolves once they have drained it. With
+    'workers', jobs wait for an analysis_worker process on any host, and
+    the future resolves at once with the queued job, as it does for a job
+    delayed by delay seconds. on_complete must be a module-level function,
+    since the job may run in another process.
+    """
+    job = enqueue(repository, mode or settings.ANALYSIS_DEFAULT_MODE, on_complete, commit, delay)
+    if settings.ANALYSIS_QUEUE == 'local':
+        if not delay:
+            return analysis_executor.submit(local_worker.run_pending)
+        # Only a wake-up call: the job itself waits in the database
+        timer = threading.Timer(delay, analysis_executor.submit, args=(local_worker.run_pending,))
+        timer.daemon = True
+        timer.start()
+    future = Future()
+    future.set_result(job)
+    return future
+
+def analyze_now(
+    repository: LinkedRepository,
+    mode: Optional[str] = None,
+    on_complete: Optional[Callable[[LinkedRepository], None]] = None
+) -> Union[Dict, ErrorResponse]:
+    """Queue an analysis job and wait for its result, for requests that answer with it.
+
+    The job runs on the calling thread, under a lease like any other, so a
+    process that dies mid-run leaves the job to be requeued rather than the
+    repository analyzing forever. While another job of the repository runs,
+    or a worker has taken this one, the caller waits for the queue instead.
+    """
+    job = enqueue(repository, mode or settings.ANALYSIS_DEFAULT_MODE, on_complete)
+    # A delayed job this one was folded into is wanted now
+    AnalysisJob.objects.filter(id=job.id, status='queued').update(available_at=timezone.now())
+    poll = max(settings.ANALYSIS_JOB_POLL_SECONDS, 0.5)
+    while True:
+        requeue_expired()
+        claimed = local_worker.claim(job.id)
+        if claimed is not None:
+            return local_worker.execute(claimed)
+        job.refresh_from_db()
+        if job.status not in ('queued', 'running'):
+            break
+        time.sleep(poll)
+
+    repository.refresh_from_db()
+    if job.status == 'complete' and repository.analysis_results:
+        return repository.analysis_results
+    error, _, details = job.last_error.partition(': ')
+    return ErrorResponse(error=error or "Analysis Failed", details=details or job.last_error)
+
+_poller_lock = threading.Lock()
+_poller: Optional[threading.Thread] = None
+
+def start_queue_poller():
+    """Run the job queue from this process in the background when ANALYSIS_QUEUE is 'local'.
+
+    Started by the WSGI and ASGI entry points, so a web process recovers
+    on its own: every ANALYSIS_JOB_POLL_SECONDS it requeues the jobs whose
+    lease lapsed, and hands ready jobs (requeued ones, delayed ones, and
+    ones a previous process left behind) to its analysis threads.
+    """
+    global _poller
+    if settings.ANALYSIS_QUEUE != 'local' or settings.ANALYSIS_JOB_POLL_SECONDS <= 0:
+        return
+    with _poller_lock:
+        if _poller is None:
+            _poller = threading.Thread(target=_poll_queue, name='analysis-queue-poller', daemon=True)
+            _poller.start()
+
+def _poll_queue():
+    pending: Optional[Future] = None
+    while True:
+        time.sleep(settings.ANALYSIS_JOB_POLL_SECONDS)
+        try:
+            requeue_expired()
+            # One drain at a time; run_pending keeps claiming until the queue is empty
+            if (pending is None or pending.done()) and ready_jobs().exists():
+                pending = analysis_executor.submit(local_worker.run_pending)
+        except Exception as e:
+            logger.warning(f"Analysis queue poll failed: {e}")
+        finally:
+            close_old_connections()
@@ -2,8 +2,20 @@ import requests
 from typing import Dict, List, Optional
 from dataclasses import dataclass
 import json
+import re
+from django.conf import settings
 from loguru import logger
-from tenacity import retry, stop_after_attempt, wait_exponential
+from api.services.question_bank import strip_option_prefix
+
+# One full generation plus follow-ups that only ask for the missing questions
+MAX_GENERATION_ROUNDS = 3
+# What the questions of a full generation test, in turn
+QUESTION_FOCUS = (
+    "Understanding of the project's architecture and design",
+    "Knowledge of the technology stack",
+    "Knowledge of the technology stack",
+)
+ANSWER_LETTER = re.compile(r'^(?:option\s+)?\(?([A-Da-d])\)?[).:]?(?:\s|$)', re.IGNORECASE)
 
 @dataclass
 class Question:
@@ -11,6 +23,7 @@ class Question:
     options: List[str]
     correct_answer: int
     explanation: str
+    topic: str = 'project'
 
 @dataclass
 class Assessment:
@@ -21,55 +34,71 @@ class AssessmentGenerator:
         self.API_URL = "https://router.huggingface.co/nebius/v1/chat/completions"
         self.headers = {"Authorization": f"Bearer {huggingface_token}"}
 
-    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
     def generate_assessment(self, project_info: Dict) -> Optional[Assessment]:
-        """Generate assessment questions based on project analysis"""
-        try:
-            prompt = self._create_assessment_prompt(project_info)
-            
-            response = requests.post(
-                self.API_URL,
-                headers=self.headers,
-                json={
-                    "messages": [
-        {
-            "role": "user",
-            "content": prompt,
-        }
-    ],
-                    "model": "meta-llama/Meta-Llama-3.1-8B-Instruct-fast"
-                },
-                timeout=30
-            )
-            
-            response.raise_for_status()
-            response_json = response.json()["choices"][0]["message"]
-            print("RESPONSE:", response_json.get('content'))
-            
-            # if not response_json or not isinstance(response_json, list):
-            #     logger.error("Invalid API response format")
-            #     return None
-                
-            questions_data = self._parse_response(response_json.get('content'))
-            if not questions_data:
-                return None
-                
-            questions = [
-                Question(
-                    text=q['question'],
-                    options=q['options'],
-                    correct_answer=q['correct_answer'],
-                    explanation=q['explanation']
-                )
-                for q in questions_data
-            ]
-            
-            return Assessment(questions=questions)
-            
-        except Exception as e:
-            logger.error(f"Failed to generate assessment: {str(e)}")
+        """Generate assessment questions based on project analysis.
+
+        Valid questions are kept from every response, and later rounds only
+        ask for the ones still missing, so one bad question costs a short
+        follow-up call instead of a whole new assessment.
+        """
+        question_count = settings.ASSESSMENT_QUESTION_COUNT
+        questions_data: List[Dict] = []
+        for round_number in range(MAX_GENERATION_ROUNDS):
+            missing = question_count - len(questions_data)
+            if round_number == 0:
+                prompt = self._create_assessment_prompt(project_info)
+            else:
+                logger.info(f"Asking for {missing} replacement question(s)")
+                prompt = self._create_replacement_prompt(project_info, missing, questions_data)
+            try:
+                content = self._complete(prompt)
+            except Exception as e:
+                logger.error(f"Failed to generate assessment: {str(e)}")
+                continue
+
+            seen = {q['question'].strip().lower() for q in questions_data}
+            for q in self._parse_response(content) or []:
+                if q['question'].strip().lower() not in seen and len(questions_data) < question_count:
+                    seen.add(q['question'].strip().lower())
+                    questions_data.append(q)
+            if len(questions_data) == question_count:
+                break
+        else:
+            logger.error(f"Only {len(questions_data)} valid questions after {MAX_GENERATION_ROUNDS} rounds")
             return None
 
+        questions = [
+            Question(
+                text=q['question'],
+                options=q['options'],
+                correct_answer=q['correct_answer'],
+                explanation=q['explanation'],
+                topic=q.get('topic') or 'project'
+            )
+            for q in questions_data
+        ]
+        return Assessment(questions=questions)
+
+    def _complete(self, prompt: str) -> str:
+        response = requests.post(
+            self.API_URL,
+            headers=self.headers,
+            json={
+                "messages": [
+                    {
+                        "role": "user",
+                        "content": prompt,
+                    }
+                ],
+                "model": "meta-llama/Meta-Llama-3.1-8B-Instruct-fast"
+            },
+            timeout=30
+        )
+        response.raise_for_status()
+        content = response.json()["choices"][0]["message"].get('content') or ''
+        logger.debug(f"Assessment response: {content}")
+        return content
+
     def _create_assessment_prompt(self, project_info: Dict) -> str:
         """Create prompt for assessment generation"""
         try:
@@ -79,28 +108,29 @@ class AssessmentGenerator:
             metrics = code_quality.get('metrics', {})
             
             tech_list = ', '.join(technologies) if technologies else 'No technologies specified'
+            count = settings.ASSESSMENT_QUESTION_COUNT
+            focus = ''.join(
+                f"{number}. {QUESTION_FOCUS[(number - 1) % len(QUESTION_FOCUS)]}\n" for number in range(1, count + 1)
+            )
             
             prompt = (
-                "You are an expert technical interviewer. Create 5 multiple-choice questions to assess understanding of this project.\n\n"
+                f"You are an expert technical interviewer. Create {count} multiple-choice questions to assess understanding of this project.\n\n"
                 f"Project Description:\n{description}\n\n"
                 f"Technologies Used:\n{tech_list}\n\n"
-                "Create 5 questions that test:\n"
-                "1. Understanding of the project's architecture and design\n"
-                "2. Knowledge of the technology stack\n"
-                "3. Knowledge of the technology stack\n"
-                "4. Understanding of the project's architecture and design\n"
-                "5. Knowledge of the technology stack\n\n"
+                f"Create {count} questions that test:\n"
+                f"{focus}\n"
                 "For each question:\n"
                 "- Make it specific to the project context\n"
                 "- Provide 4 options (A, B, C, D)\n"
                 "- Include a detailed explanation for the correct answer\n\n"
-                "Your response must be a valid JSON array containing exactly 5 questions.\n"
+                f"Your response must be a valid JSON array containing exactly {count} questions.\n"
                 "Each question must have these exact fields:\n"
                 "- question: The question text\n"
                 "- options: Array of 4 strings with options prefixed by A), B), C), D)\n"
                 "- correct_answer: Integer 0-3 indicating the correct option index\n"
                 "- Make sure the correct answer integer aligns with the correct option\n"
-                "- explanation: String explaining why the answer is correct\n\n"
+                "- explanation: String explaining why the answer is correct, without naming option letters\n"
+                "- topic: \"project\" if the question is about this project, otherwise the one technology from the list above it is about\n\n"
                 "Example format:\n"
                 "[\n"
                 "  {\n"
@@ -112,7 +142,8 @@ class AssessmentGenerator:
                 '      "D) Option four"\n'
                 "    ],\n"
                 '    "correct_answer": 2,\n'
-                '    "explanation": "Option C is correct because..."\n'
+                '    "explanation": "Option three is correct because...",\n'
+                '    "topic": "project"\n'
                 "  }\n"
                 "]\n\n"
                 "Respond ONLY with the JSON array, no other text or formatting. Make sure correct_answer aligns with correct option"
@@ -124,53 +155,122 @@ class AssessmentGenerator:
             logger.error(f"Error creating assessment prompt: {str(e)}")
             return ""
 
+    def _create_replacement_prompt(self, project_info: Dict, count: int, existing: List[Dict]) -> str:
+        """Ask for count more questions that do not repeat the ones already kept"""
+        technologies = project_info.get('project_info', {}).get('technologies', [])
+        description = project_info.get('project_info', {}).get('description', '')
+        tech_list = ', '.join(technologies) if technologies else 'No technologies specified'
+        asked = '\n'.join(f"- {q['question']}" for q in existing) or '- (none)'
+        return (
+            f"You are an expert technical interviewer. Create {count} more multiple-choice questions "
+            "to assess understanding of this project.\n\n"
+            f"Project Description:\n{description}\n\n"
+            f"Technologies Used:\n{tech_list}\n\n"
+            f"Do not repeat these questions:\n{asked}\n\n"
+            f"Your response must be a valid JSON array containing exactly {count} question(s), each with:\n"
+            "- question: The question text\n"
+            "- options: Array of 4 strings with options prefixed by A), B), C), D)\n"
+            "- correct_answer: Integer 0-3 indicating the correct option index\n"
+            "- explanation: String explaining why the answer is correct, without naming option letters\n"
+            "- topic: \"project\" if the question is about this project, otherwise the one technology from the list above it is about\n\n"
+            "Respond ONLY with the JSON array, no other text or formatting. Make sure correct_answer aligns with correct option"
+        )
+
     def _parse_response(self, response_text: str) -> Optional[List[Dict]]:
-        """Parse API response into structured question format"""
-        try:
-            # Clean up the response text
-            clean_text = response_text.strip()
-            
-            # Find the first '[' and last ']' to extract just the JSON array
-            start = clean_text.find('[')
-            end = clean_text.rfind(']')
-            
-            if start == -1 or end == -1:
-                logger.error("Could not find JSON array markers")
-                return None
-                
-            json_text = clean_text[start:end + 1]
-            
-            # Parse the JSON
-            questions = json.loads(json_text)
-            
-            # Validate response format
-            if not isinstance(questions, list):
-                logger.error("Response is not a list")
-                return None
-                
-            # Take only the first 5 questions if more were generated
-            questions = questions[:5]
-            
-            # Validate each question
-            for q in questions:
-                if not all(k in q for k in ['question', 'options', 'correct_answer', 'explanation']):
-                    logger.error("Missing required question fields")
-                    return None
-                    
-                if not isinstance(q['options'], list) or len(q['options']) != 4:
-                    logger.error("Invalid options format")
-                    return None
-                    
-                if not isinstance(q['correct_answer'], int) or q['correct_answer'] not in range(4):
-                    logger.error("Invalid correct_answer format")
-                    return None
-            
-            return questions
-            
-        except json.JSONDecodeError as e:
-            logger.error(f"Failed to parse response JSON: {str(e)}")
-            logger.error(f"Response text: {response_text}")
+        """Parse API response into the valid questions it contains, repairing what can be repaired.
+
+        A response that is not a well-formed array is read object by
+        object, and questions that stay invalid after repair are dropped
+        rather than failing the whole response.
+        """
+        if not response_text:
             return None
-        except Exception as e:
-            logger.error(f"Error parsing response: {str(e)}")
-            return None
\ No newline at end of file
+        clean_text = response_text.strip()
+
+        # Find the first '[' and last ']' to extract just the JSON array
+        start = clean_text.find('[')
+        end = clean_text.rfind(']')
+        candidates = None
+        if start != -1 and end > start:
+            try:
+                candidates = json.loads(clean_text[start:end + 1])
+            except json.JSONDecodeError as e:
+                logger.warning(f"Response is not a valid JSON array ({str(e)}); reading questions one by one")
+        if not isinstance(candidates, list):
+            candidates = self._extract_objects(clean_text)
+
+        questions = []
+        for candidate in candidates:
+            question = self._repair_question(candidate)
+            if question:
+                questions.append(question)
+            else:
+                logger.warning(f"Dropped invalid question: {str(candidate)[:200]}")
+        if not questions:
+            logger.error(f"No valid questions in response: {response_text[:500]}")
+            return None
+        return questions[:settings.ASSESSMENT_QUESTION_COUNT]
+
+    def _extract_objects(self, text: str) -> List:
+        """Every JSON object that decodes on its own, skipping the broken ones between them"""
+        decoder = json.JSONDecoder()
+        objects, position = [], text.find('{')
+        while position != -1:
+            try:
+                value, end = decoder.raw_decode(text, position)
+            except json.JSONDecodeError:
+                position = text.find('{', position + 1)
+                continue
+            objects.append(value)
+            position = text.find('{', end)
+        return objects
+
+    def _repair_question(self, q) -> Optional[Dict]:
+        """The question with its fields normalised, or None if it cannot be used"""
+        if not isinstance(q, dict):
+            return None
+        text = q.get('question') or q.get('text')
+        options = q.get('options')
+        explanation = q.get('explanation')
+        if not isinstance(text, str) or not text.strip() or not isinstance(explanation, str):
+            return None
+        if isinstance(options, dict):
+            options = [options[key] for key in sorted(options)]
+        if not isinstance(options, list) or len(options) != 4:
+            return None
+        bare = [strip_option_prefix(option).strip() for option in options]
+        if not all(bare) or len({option.lower() for option in bare}) != 4:
+            return None
+
+        correct_answer = self._answer_index(q.get('correct_answer'), bare)
+        if correct_answer is None:
+            return None
+        return {
+            'question': text.strip(),
+            'options': [f"{letter}) {option}" for letter, option in zip('ABCD', bare)],
+            'correct_answer': correct_answer,
+            'explanation': explanation.strip(),
+            'topic': q.get('topic') or 'project',
+        }
+
+    def _answer_index(self, answer, options: List[str]) -> Optional[int]:
+        """Coerce an answer given as an index, a digit, a letter or the option text to 0-3"""
+        if isinstance(answer, bool):
+            return None
+        if isinstance(answer, float) and answer.is_integer():
+            answer = int(answer)
+        if isinstance(answer, int):
+            return answer if answer in range(4) else None
+        if not isinstance(answer, str):
+            return None
+        answer = answer.strip()
+        if answer.isdigit():
+            return int(answer) if int(answer) in range(4) else None
+        lowered = [option.lower() for option in options]
+        bare = strip_option_prefix(answer).strip().lower()
+        if bare in lowered:
+            return lowered.index(bare)
+        match = ANSWER_LETTER.match(answer)
+        if match:
+            return 'ABCD'.index(match.group(1).upper())
+        return None
@@ -0,0 +1,84 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from loguru import logger
+from api.models import Assessment, LinkedRepository
+from api.services.assessment_generator import AssessmentGenerator
+from api.services.progress import record_stage
+from api.services.question_bank import QuestionBank
+from api.services.single_flight import SingleFlight
+
+assessment_flight = SingleFlight()
+assessment_executor = ThreadPoolExecutor(
+    max_workers=settings.ASSESSMENT_PREWARM_WORKERS, thread_name_prefix='assessment'
+)
+
+def create_assessment(repository: LinkedRepository, retake: bool = False) -> Optional[Assessment]:
+    """The assessment for the repository's analyzed commit, assembled and stored now if it has none.
+
+    Questions come from the question bank when it covers the analyzed
+    commit, and from the LLM otherwise; generated questions are banked.
+    retake always assembles a new assessment. The pre-warm and an
+    on-demand request for the same commit share one generation in this
+    process, and the database keeps one per commit across processes.
+    """
+    project_info = (repository.analysis_results or {}).get('project_info', {})
+    commit, technologies = project_info.get('commit') or '', project_info.get('technologies') or []
+
+    def current() -> Optional[Assessment]:
+        return Assessment.objects.filter(repository=repository, commit=commit, retake=False).first()
+
+    def generate():
+        if not retake:
+            existing = current()
+            if existing:
+                return existing
+
+        bank = QuestionBank()
+        questions = bank.draw(commit, technologies)
+        if questions is None:
+            generator = AssessmentGenerator(settings.HUGGINGFACE_TOKEN)
+            assessment_data = generator.generate_assessment(repository.analysis_results)
+            if not assessment_data:
+                return None
+            generated = [{
+                'text': q.text,
+                'options': q.options,
+                'correct_answer': q.correct_answer,
+                'explanation': q.explanation,
+                'topic': q.topic
+            } for q in assessment_data.questions]
+            bank.store(commit, generated, technologies)
+            questions = [{key: value for key, value in q.items() if key != 'topic'} for q in generated]
+
+        try:
+            with transaction.atomic():
+                return Assessment.objects.create(repository=repository, commit=commit, retake=retake, questions=questions)
+        except IntegrityError:
+            # Another process stored this commit's assessment first
+            return current()
+
+    return assessment_flight.do(f"assessment:{repository.id}:{commit}:{'retake' if retake else 'first'}", generate)
+
+def prewarm_assessment(repository: LinkedRepository) -> Optional[Future]:
+    """Generate the assessment in the background as soon as the analysis is complete"""
+    if not settings.ASSESSMENT_PREWARM:
+        return None
+
+    def run():
+        record_stage(repository.id, 'assessment', 'running')
+        try:
+            assessment = create_assessment(repository)
+            if assessment is None:
+                record_stage(repository.id, 'assessment', 'failed', error='Assessment generation failed')
+            else:
+                record_stage(repository.id, 'assessment', 'complete', result={'assessment_id': assessment.id})
+            return assessment
+        except Exception as e:
+            logger.error(f"Pre-warming the assessment of {repository.repo_name} failed: {e}")
+            record_stage(repository.id, 'assessment', 'failed', error=str(e))
+        finally:
+            close_old_connections()
+
+    return assessment_executor.submit(run)
@@ -0,0 +1,219 @@
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterable, List, Optional, Tuple
+from django.conf import settings
+from loguru import logger
+from api.services.resource_limits import ProcessLimiter, record_usage
+
+# How often blocked waits (child processes, sleeps) wake up to check for cancellation
+POLL_SECONDS = 0.5
+
+class AnalysisCancelled(BaseException):
+    """Raised inside an analysis once it has been cancelled.
+
+    A BaseException, like asyncio.CancelledError, so the pipeline's many
+    `except Exception` blocks cannot swallow it and carry on.
+    """
+
+class StageTimeout(AnalysisCancelled):
+    """Raised when an analysis stage runs past its deadline"""
+
+def kill_process_tree(process: subprocess.Popen):
+    """Kill a child started in its own session or process group, and everything it spawned"""
+    if process.poll() is not None:
+        return
+    if sys.platform == 'win32':
+        subprocess.run(['taskkill', '/F', '/T', '/PID', str(process.pid)], capture_output=True)
+    else:
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+class CancelToken:
+    """Cancellation and stage deadlines for one analysis run.
+
+    The run checks the token between steps and while it waits on child
+    processes, sleeps and SonarQube, and caps HTTP timeouts at the time
+    left in the current stage. Cancelling kills the registered child
+    processes (git, the scanner JVM) at once. A run is also cancelled once
+    none of the repositories waiting for it is still 'analyzing', which is
+    how a cancel request or a deleted repository reaches a run in another
+    process: the token polls for that every ANALYSIS_CANCEL_POLL_SECONDS.
+    """
+
+    def __init__(self, repository_ids: Optional[Callable[[], Iterable]] = None):
+        self.event = threading.Event()
+        self.reason: Optional[str] = None
+        self.stage: Optional[str] = None
+        self.deadline: Optional[float] = None
+        self.repository_ids = repository_ids
+        self.processes: List[subprocess.Popen] = []
+        self.lock = threading.Lock()
+        self._polled_at = 0.0
+
+    @property
+    def cancelled(self) -> bool:
+        return self.event.is_set()
+
+    def cancel(self, reason: str = 'Analysis cancelled'):
+        with self.lock:
+            if self.event.is_set():
+                return
+            self.reason = reason
+            self.event.set()
+            processes = list(self.processes)
+        logger.info(f"Cancelling analysis: {reason}")
+        for process in processes:
+            kill_process_tree(process)
+
+    def begin_stage(self, stage: str):
+        """Start the clock on a stage's ANALYSIS_STAGE_TIMEOUTS deadline"""
+        timeout = settings.ANALYSIS_STAGE_TIMEOUTS.get(stage)
+        self.stage = stage
+        self.deadline = time.monotonic() + timeout if timeout else None
+
+    def remaining(self) -> Optional[float]:
+        return None if self.deadline is None else self.deadline - time.monotonic()
+
+    def check(self):
+        """Raise if the run was cancelled or the current stage is out of time"""
+        if not self.event.is_set() and time.monotonic() - self._polled_at >= settings.ANALYSIS_CANCEL_POLL_SECONDS:
+            self.poll()
+        if self.event.is_set():
+            raise AnalysisCancelled(self.reason)
+        remaining = self.remaining()
+        if remaining is not None and remaining <= 0:
+            raise StageTimeout(f"Stage {self.stage} exceeded its {settings.ANALYSIS_STAGE_TIMEOUTS[self.stage]}s deadline")
+
+    def poll(self):
+        """Cancel the run if every repository waiting for it was cancelled or deleted"""
+        self._polled_at = time.monotonic()
+        ids = list(self.repository_ids() if self.repository_ids else ())
+        if not ids:
+            return
+        from api.models import LinkedRepository
+        try:
+            waiting = LinkedRepository.objects.filter(id__in=ids, analysis_status='analyzing').exists()
+        except Exception as e:
+            logger.warning(f"Could not check for cancellation: {e}")
+            return
+        if not waiting:
+            self.cancel('Every repository waiting for this analysis was cancelled or deleted')
+
+    def register(self, process: subprocess.Popen):
+        with self.lock:
+            self.processes.append(process)
+            cancelled = self.event.is_set()
+        if cancelled:
+            kill_process_tree(process)
+
+    def unregister(self, process: subprocess.Popen):
+        with self.lock:
+            if process in self.processes:
+                self.processes.remove(process)
+
+_local = threading.local()
+
+def current_token() -> Optional[CancelToken]:
+    return getattr(_local, 'token', None)
+
+@contextmanager
+def activate(token: Optional[CancelToken]):
+    """Make token the one that helpers in this thread check and register processes with"""
+    previous = current_token()
+    _local.token = token
+    try:
+        yield token
+    finally:
+        _local.token = previous
+
+def check_cancelled():
+    token = current_token()
+    if token:
+        token.check()
+
+def sleep(seconds: float):
+    """time.sleep that wakes up early to raise once the current analysis is cancelled"""
+    token = current_token()
+    if token is None:
+        time.sleep(seconds)
+        return
+    end = time.monotonic() + seconds
+    while True:
+        token.check()
+        left = end - time.monotonic()
+        if left <= 0:
+            return
+        token.event.wait(min(left, POLL_SECONDS))
+
+def request_timeout(default: float) -> float:
+    """An HTTP timeout that does not outlast the current stage's deadline"""
+    token = current_token()
+    if token is None:
+        return default
+    token.check()
+    remaining = token.remaining()
+    return default if remaining is None else max(1.0, min(default, remaining))
+
+def new_session_kwargs() -> dict:
+    """Popen arguments that put a child in its own process group, so it can be killed with its children"""
+    if sys.platform == 'win32':
+        return {'creationflags': subprocess.CREATE_NEW_PROCESS_GROUP}
+    return {'start_new_session': True}
+
+def start_process(cmd: List[str], **kwargs) -> Tuple[subprocess.Popen, ProcessLimiter]:
+    """Popen cmd in its own session under the analysis resource limits; pass both to communicate()"""
+    limiter = ProcessLimiter()
+    try:
+        process = subprocess.Popen(limiter.command(cmd), **kwargs, **new_session_kwargs())
+    except BaseException:
+        limiter.finish()
+        raise
+    limiter.started(process.pid)
+    return process, limiter
+
+def communicate(process: subprocess.Popen, limiter: ProcessLimiter, timeout: Optional[float] = None):
+    """process.communicate() that kills the process tree on cancellation, deadline or timeout.
+
+    What the process used, as measured by the limiter it was started with,
+    is added to the thread's collect_usage() block. Returns (stdout,
+    stderr, timed_out); cancellation raises instead.
+    """
+    token = current_token()
+    if token:
+        token.register(process)
+    end = time.monotonic() + timeout if timeout else None
+    try:
+        while True:
+            limiter.sample()
+            wait = POLL_SECONDS
+            if end is not None:
+                left = max(0.0, end - time.monotonic())
+                wait = min(wait, left)
+            try:
+                stdout, stderr = process.communicate(timeout=wait)
+                if token and token.cancelled:
+                    # Killed by cancel() rather than finished
+                    raise AnalysisCancelled(token.reason)
+                return stdout, stderr, False
+            except subprocess.TimeoutExpired:
+                if end is not None and time.monotonic() >= end:
+                    kill_process_tree(process)
+                    stdout, stderr = process.communicate()
+                    return stdout, stderr, True
+                if token:
+                    token.check()
+    except BaseException:
+        kill_process_tree(process)
+        process.communicate()
+        raise
+    finally:
+        if token:
+            token.unregister(process)
+        record_usage(limiter.finish())
@@ -0,0 +1,79 @@
+import hashlib
+import pickle
+from dataclasses import dataclass
+from typing import Any, Optional
+from django.conf import settings
+from django.core.cache import caches
+from loguru import logger
+
+@dataclass
+class RetryPolicy:
+    """How often one analysis stage is attempted, and the exponential wait between attempts"""
+    attempts: int
+    wait_min: float
+    wait_max: float
+
+# Cheap, flaky stages get more attempts; the scanner is expensive, so it gets one retry
+STAGE_RETRY_POLICIES = {
+    'clone': RetryPolicy(attempts=3, wait_min=2, wait_max=10),
+    'ingest': RetryPolicy(attempts=2, wait_min=1, wait_max=5),
+    'ai_summary': RetryPolicy(attempts=3, wait_min=4, wait_max=10),
+    'scan': RetryPolicy(attempts=2, wait_min=10, wait_max=30),
+    'results': RetryPolicy(attempts=3, wait_min=5, wait_max=30),
+}
+
+class StageAbandoned(Exception):
+    """Raised by a stage's work when another attempt cannot succeed, so it is not retried"""
+
+# Stages whose output is saved, in pipeline order
+CHECKPOINTED_STAGES = ('ingest', 'ai_summary', 'scan', 'results')
+
+class CheckpointStore:
+    """Outputs of the completed stages of one analysis, so a retry resumes where it failed.
+
+    Checkpoints are keyed by repository, commit and mode, and live in the
+    ANALYSIS_CHECKPOINT_CACHE_ALIAS cache, on disk by default, so they
+    survive a worker restart. A later run for the same commit picks up the
+    ingested content, the AI review, the scanner's compute-engine task and
+    the fetched results instead of producing them again. They are cleared
+    once the analysis succeeds and expire after ANALYSIS_CHECKPOINT_TTL.
+    Outputs larger than ANALYSIS_CHECKPOINT_MAX_BYTES are not saved; that
+    stage simply runs again.
+    """
+
+    def __init__(self, repo_url: str, commit: str, mode: str):
+        self.cache = caches[settings.ANALYSIS_CHECKPOINT_CACHE_ALIAS]
+        identity = f"{repo_url.rstrip('/').removesuffix('.git').lower()}@{commit}:{mode}"
+        self.prefix = f"checkpoint:{hashlib.sha256(identity.encode()).hexdigest()[:24]}"
+
+    def get(self, stage: str) -> Optional[Any]:
+        try:
+            saved = self.cache.get(f"{self.prefix}:{stage}")
+            return pickle.loads(saved) if saved is not None else None
+        except Exception as e:
+            logger.warning(f"Could not read {stage} checkpoint: {e}")
+            return None
+
+    def save(self, stage: str, data: Any):
+        try:
+            # Pickled here, so its size is known before it is written
+            blob = pickle.dumps(data, pickle.HIGHEST_PROTOCOL)
+            if len(blob) > settings.ANALYSIS_CHECKPOINT_MAX_BYTES:
+                logger.info(f"Not checkpointing {stage}: {len(blob)} bytes is over ANALYSIS_CHECKPOINT_MAX_BYTES")
+                return
+            self.cache.set(f"{self.prefix}:{stage}", blob)
+        except Exception as e:
+            logger.warning(f"Could not save {stage} checkpoint: {e}")
+
+    def discard(self, stage: str):
+        """Forget one stage's output, so the next run produces it again"""
+        try:
+            self.cache.delete(f"{self.prefix}:{stage}")
+        except Exception as e:
+            logger.warning(f"Could not discard {stage} checkpoint: {e}")
+
+    def clear(self):
+        try:
+            self.cache.delete_many([f"{self.prefix}:{stage}" for stage in CHECKPOINTED_STAGES])
+        except Exception as e:
+            logger.warning(f"Could not clear checkpoints: {e}")
@@ -0,0 +1,386 @@
+import hashlib
+import os
+import shutil
+import subprocess
+import threading
+import time
+import uuid
+from typing import List, Optional, Tuple
+from django.conf import settings
+from loguru import logger
+from api.services.cancellation import communicate, start_process
+from api.services.single_flight import LockTimeout, repository_lock
+from api.services.workspace_manager import remove_tree
+
+MAINTENANCE_STAMP = '.last-maintenance'
+
+class GitCloneError(Exception):
+    """Raised when a git command in the clone pipeline fails"""
+
+def run_git(cmd: List[str]) -> str:
+    """Run a git command, killing it if the analysis it belongs to is cancelled or out of time"""
+    process, limiter = start_process(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    stdout, stderr, _ = communicate(process, limiter)
+    if process.returncode != 0:
+        error = subprocess.CalledProcessError(process.returncode, cmd, stdout, stderr)
+        raise GitCloneError(stderr.strip() or str(error)) from error
+    return stdout
+
+def directory_size(path: str) -> int:
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                total += os.lstat(os.path.join(dirpath, filename)).st_size
+            except OSError:
+                pass
+    return total
+
+def repack_object_cache(cache_dir: str):
+    """Merge the shared object cache's packs into one, without deleting any object.
+
+    Donated packs come from blob-less clones, so trees in them point at
+    blobs the cache never had, and a reachability walk (git gc, repack -a)
+    would fail. The multi-pack-index commands copy objects from pack to
+    pack instead. The merged pack is marked as a promisor pack again, so
+    partial clones that borrow from the cache still accept the missing
+    blobs. Packs added while this runs are left for the next time.
+    """
+    try:
+        with repository_lock(f"object-cache:{cache_dir}", timeout=0):
+            pack_dir = os.path.join(cache_dir, 'objects', 'pack')
+            promisor = any(name.endswith('.promisor') for name in os.listdir(pack_dir))
+            for command in (['write'], ['repack', '--batch-size=0'], ['write'], ['expire']):
+                run_git(['git', '--git-dir', cache_dir, 'multi-pack-index'] + command)
+            if promisor:
+                for name in os.listdir(pack_dir):
+                    if name.endswith('.pack'):
+                        with open(os.path.join(pack_dir, name[:-5] + '.promisor'), 'a'):
+                            pass
+    except LockTimeout:
+        pass
+
+def cache_key(repo_url: str) -> str:
+    """Stable name for a remote URL, used for cache refs and mirror directories"""
+    return hashlib.sha1(repo_url.rstrip('/').removesuffix('.git').lower().encode()).hexdigest()
+
+class MirrorCache:
+    """Bare, blob-less mirrors of remote repositories, one per URL.
+
+    Workspaces are git worktrees of a mirror, so they share its object
+    store, and blobs a checkout needs are fetched into the mirror once.
+    Changes to a mirror (creation, fetch, adding a worktree, maintenance,
+    eviction) happen under its repository lock. Reading never takes the
+    lock, which is safe because nothing a live worktree can reach is ever
+    deleted. A mirror is only evicted once it has no worktrees left, and
+    least recently used mirrors go first once the cache is over its quota.
+    """
+
+    def __init__(self, root: Optional[str] = None, quota_bytes: Optional[int] = None):
+        self.root = os.path.realpath(root or settings.GIT_MIRROR_DIR)
+        self.quota_bytes = settings.GIT_MIRROR_QUOTA_BYTES if quota_bytes is None else quota_bytes
+        self._maintenance_lock = threading.Lock()
+
+    def path_for(self, repo_url: str) -> str:
+        return os.path.join(self.root, f"{cache_key(repo_url)}.git")
+
+    def lock(self, mirror: str, timeout: Optional[float] = None):
+        return repository_lock(f"mirror:{mirror}", timeout)
+
+    def touch(self, mirror: str):
+        try:
+            os.utime(mirror)
+        except OSError:
+            pass
+
+    def has_commit(self, mirror: str, commit: str) -> bool:
+        try:
+            run_git(['git', '--git-dir', mirror, 'cat-file', '-e', f'{commit}^{{commit}}'])
+            return True
+        except GitCloneError:
+            return False
+
+    def mirrors(self) -> List[Tuple[str, float, int]]:
+        """(path, last_used, size) of every mirror"""
+        if not os.path.isdir(self.root):
+            return []
+        found = []
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if name.endswith('.git') and os.path.isdir(path):
+                try:
+                    found.append((path, os.path.getmtime(path), self._measure(path)))
+                except OSError:
+                    continue
+        return found
+
+    def maintain(self):
+        """Prune dead worktrees, let git repack where it wants to, then enforce the quota.
+
+        The shared object cache, which git gc never touches, has its packs
+        merged here too.
+        """
+        expire = f"{settings.WORKSPACE_STAGING_MAX_AGE}.seconds.ago"
+        for mirror, _, _ in self.mirrors():
+            try:
+                with self.lock(mirror, timeout=0):
+                    # Worktrees younger than the staging age may still be being renamed into place
+                    run_git(['git', '--git-dir', mirror, 'worktree', 'prune', f'--expire={expire}'])
+                    run_git(['git', '--git-dir', mirror, 'gc', '--auto', '--quiet'])
+            except LockTimeout:
+                continue
+            except GitCloneError as e:
+                logger.warning(f"Maintenance of mirror {mirror} failed: {e}")
+        self.enforce_quota()
+        if os.path.isfile(os.path.join(settings.GIT_OBJECT_CACHE_DIR, 'HEAD')):
+            try:
+                repack_object_cache(settings.GIT_OBJECT_CACHE_DIR)
+            except (GitCloneError, OSError) as e:
+                logger.warning(f"Maintenance of the shared object cache failed: {e}")
+
+    def maybe_maintain(self):
+        """Run maintain() in the background if no process has done so recently"""
+        stamp = os.path.join(self.root, MAINTENANCE_STAMP)
+        try:
+            if time.time() - os.path.getmtime(stamp) < settings.GIT_MIRROR_MAINTENANCE_INTERVAL:
+                return
+        except OSError:
+            pass
+        if not self._maintenance_lock.acquire(blocking=False):
+            return
+        os.makedirs(self.root, exist_ok=True)
+        with open(stamp, 'a'):
+            os.utime(stamp)
+
+        def run():
+            try:
+                self.maintain()
+            finally:
+                self._maintenance_lock.release()
+        threading.Thread(target=run, daemon=True).start()
+
+    def enforce_quota(self):
+        """Evict least recently used mirrors without worktrees until the cache fits the quota"""
+        if not self.quota_bytes:
+            return
+        mirrors = sorted(self.mirrors(), key=lambda m: m[1])
+        total = sum(m[2] for m in mirrors)
+        for mirror, _, size in mirrors:
+            if total <= self.quota_bytes:
+                break
+            if self._evict(mirror):
+                logger.info(f"Evicted mirror {mirror} ({size} bytes)")
+                total -= size
+        if total > self.quota_bytes:
+            logger.warning(f"Mirrors use {total} bytes, over the {self.quota_bytes} byte quota; the rest have worktrees")
+
+    def _evict(self, mirror: str) -> bool:
+        try:
+            with self.lock(mirror, timeout=0):
+                worktrees = os.path.join(mirror, 'worktrees')
+                if os.path.isdir(worktrees) and os.listdir(worktrees):
+                    return False
+                remove_tree(mirror)
+                return True
+        except (LockTimeout, OSError):
+            return False
+
+    def _measure(self, path: str) -> int:
+        return directory_size(path)
+
+class GitCloner:
+    """Clones repositories as cheaply as the analysis allows.
+
+    Clones are shallow (GIT_CLONE_DEPTH, one commit by default) and
+    blob-less (--filter=blob:none), so only the analyzed commit's trees
+    come down up front. A non-cone sparse checkout then leaves out vendored
+    and binary paths, which means their blobs are never fetched at all.
+
+    With GIT_CLONE_DEPTH=0 (full history) every clone borrows from, and
+    afterwards donates its pack files to, one shared bare object cache
+    through git alternates. The cache keeps a ref per repository, so
+    cloning a fork or re-cloning a repository advertises those commits as
+    already present and only the difference crosses the network. Shallow
+    clones skip the cache: git cannot borrow from a shallow repository,
+    and a shallow clone is small anyway.
+
+    With the mirror cache enabled the clone is made once per repository as
+    a bare mirror, later analyses only fetch what changed, and each
+    checkout is a worktree of the mirror.
+    """
+
+    def __init__(
+        self,
+        cache_dir: Optional[str] = None,
+        clone_filter: Optional[str] = None,
+        sparse_excludes: Optional[List[str]] = None,
+        share_objects: Optional[bool] = None,
+        mirror_cache: Optional[MirrorCache] = None,
+        depth: Optional[int] = None,
+    ):
+        self.cache_dir = cache_dir or settings.GIT_OBJECT_CACHE_DIR
+        self.clone_filter = settings.GIT_CLONE_FILTER if clone_filter is None else clone_filter
+        self.sparse_excludes = settings.GIT_SPARSE_EXCLUDES if sparse_excludes is None else sparse_excludes
+        self.depth = settings.GIT_CLONE_DEPTH if depth is None else depth
+        share_objects = settings.GIT_SHARED_OBJECT_CACHE if share_objects is None else share_objects
+        self.share_objects = share_objects and not self.depth
+        if mirror_cache is None and settings.GIT_MIRROR_CACHE:
+            mirror_cache = MirrorCache()
+        self.mirror_cache = mirror_cache
+
+    def clone(self, repo_url: str, dest: str, commit: Optional[str] = None) -> str:
+        """Clone repo_url into dest, check out the sparse working tree and return the HEAD SHA"""
+        if self.mirror_cache:
+            return self._checkout_from_mirror(repo_url, dest, commit)
+
+        cmd = [
+            'git', 'clone',
+            '--no-checkout',
+            '--config', 'core.fileMode=false',
+            '--config', 'core.symlinks=false',
+        ] + self._fetch_options()
+        if self.share_objects:
+            self._ensure_cache()
+            cmd += ['--reference-if-able', self.cache_dir]
+        self._run(cmd + [repo_url, dest])
+        self._sparse_checkout(dest, 'HEAD')
+
+        head_sha = self._run(['git', '-C', dest, 'rev-parse', 'HEAD']).strip()
+        if self.share_objects:
+            try:
+                self._donate_objects(os.path.join(dest, '.git'), repo_url, head_sha)
+            except (GitCloneError, OSError) as e:
+                # The clone is complete either way; the cache is only an optimisation
+                logger.warning(f"Could not add {repo_url} to the shared object cache: {e}")
+            MirrorCache().maybe_maintain()
+        return head_sha
+
+    def moved(self, dest: str):
+        """Tell git a checkout was renamed, so its mirror keeps tracking the worktree"""
+        if self.mirror_cache and os.path.isfile(os.path.join(dest, '.git')):
+            self._run(['git', '-C', dest, 'worktree', 'repair'])
+
+    def remote_head(self, repo_url: str) -> Optional[str]:
+        """SHA the remote's HEAD points at, without cloning anything; None if unreachable"""
+        try:
+            output = self._run(['git', 'ls-remote', repo_url, 'HEAD'])
+        except GitCloneError as e:
+            logger.warning(f"git ls-remote failed for {repo_url}: {e}")
+            return None
+        return output.split()[0] if output.strip() else None
+
+    def _checkout_from_mirror(self, repo_url: str, dest: str, commit: Optional[str]) -> str:
+        mirror = self.mirror_cache.path_for(repo_url)
+        with self.mirror_cache.lock(mirror):
+            if not os.path.isdir(mirror):
+                self._create_mirror(repo_url, mirror)
+            elif not commit or not self.mirror_cache.has_commit(mirror, commit):
+                logger.info(f"Fetching {repo_url} into mirror {mirror}")
+                self._run(['git', '--git-dir', mirror, 'fetch', '--prune', '--no-tags', *self._fetch_options(), 'origin'])
+            if commit and not self.mirror_cache.has_commit(mirror, commit):
+                # Not on any branch head, e.g. a force-pushed or detached commit
+                self._run(['git', '--git-dir', mirror, 'fetch', '--no-tags', *self._fetch_options(), 'origin', commit])
+            head_sha = commit or self._run(['git', '--git-dir', mirror, 'rev-parse', 'HEAD']).strip()
+            # Registering the worktree under the lock keeps eviction from taking the mirror
+            self._run([
+                'git', '--git-dir', mirror, 'worktree', 'add',
+                '--no-checkout', '--detach', dest, head_sha
+            ])
+            self.mirror_cache.touch(mirror)
+
+        # Checking out (and fetching any missing blobs) needs no lock
+        self._run(['git', '-C', dest, 'config', '--worktree', 'core.fileMode', 'false'])
+        self._run(['git', '-C', dest, 'config', '--worktree', 'core.symlinks', 'false'])
+        self._sparse_checkout(dest, head_sha)
+        self.mirror_cache.maybe_maintain()
+        return head_sha
+
+    def _create_mirror(self, repo_url: str, mirror: str):
+        """Clone a new bare mirror next to its final path and rename it into place"""
+        staging = f"{mirror}.{uuid.uuid4().hex}.tmp"
+        os.makedirs(os.path.dirname(mirror), exist_ok=True)
+        logger.info(f"Creating mirror {mirror} for {repo_url}")
+        cmd = ['git', 'clone', '--bare', '--no-tags'] + self._fetch_options()
+        if self.depth:
+            # A shallow clone only takes the default branch; the mirror needs them all
+            cmd.append('--no-single-branch')
+        if self.share_objects:
+            self._ensure_cache()
+            cmd += ['--reference-if-able', self.cache_dir]
+        try:
+            self._run(cmd + [repo_url, staging])
+            self._run(['git', '--git-dir', staging, 'config', 'remote.origin.fetch', '+refs/heads/*:refs/heads/*'])
+            # Worktrees keep their sparse patterns and settings to themselves
+            self._run(['git', '--git-dir', staging, 'config', 'extensions.worktreeConfig', 'true'])
+            # core.bare must then live in the mirror's own config.worktree, or
+            # every worktree would think it is bare too
+            self._run(['git', '--git-dir', staging, 'config', '--unset', 'core.bare'])
+            self._run(['git', '--git-dir', staging, 'config', '--worktree', 'core.bare', 'true'])
+            if self.share_objects:
+                try:
+                    head_sha = self._run(['git', '--git-dir', staging, 'rev-parse', 'HEAD']).strip()
+                    self._donate_objects(staging, repo_url, head_sha)
+                except (GitCloneError, OSError) as e:
+                    logger.warning(f"Could not add {repo_url} to the shared object cache: {e}")
+            os.rename(staging, mirror)
+        finally:
+            if os.path.exists(staging):
+                remove_tree(staging)
+
+    def _fetch_options(self) -> List[str]:
+        options = [f'--depth={self.depth}'] if self.depth else []
+        if self.clone_filter:
+            options.append(f'--filter={self.clone_filter}')
+        return options
+
+    def _sparse_checkout(self, dest: str, rev: str):
+        if self.sparse_excludes:
+            # Non-cone patterns: take everything, then carve out the excludes
+            patterns = ['/*'] + [f'!{pattern}' for pattern in self.sparse_excludes]
+            self._run(['git', '-C', dest, 'sparse-checkout', 'set', '--no-cone'] + patterns)
+        self._run(['git', '-C', dest, 'checkout', rev])
+
+    def _ensure_cache(self):
+        if os.path.isfile(os.path.join(self.cache_dir, 'HEAD')):
+            return
+        os.makedirs(os.path.dirname(self.cache_dir) or '.', exist_ok=True)
+        self._run(['git', 'init', '--quiet', '--bare', self.cache_dir])
+        # Objects in the cache are only reachable through refs/cache/*, and
+        # workspaces depend on them through alternates, so never let git prune
+        self._run(['git', '-C', self.cache_dir, 'config', 'gc.auto', '0'])
+        self._run(['git', '-C', self.cache_dir, 'config', 'gc.pruneExpire', 'never'])
+
+    def _donate_objects(self, git_dir: str, repo_url: str, head_sha: str):
+        """Move a repository's packs into the shared cache and record its HEAD there.
+
+        The repository already lists the cache as an alternate, so its
+        objects stay reachable after the move. Each pack is moved before its
+        index so a concurrent reader never sees an index without its pack.
+        """
+        src_pack_dir = os.path.join(git_dir, 'objects', 'pack')
+        dst_pack_dir = os.path.join(self.cache_dir, 'objects', 'pack')
+        os.makedirs(dst_pack_dir, exist_ok=True)
+        quota = settings.GIT_OBJECT_CACHE_QUOTA_BYTES
+        if quota and directory_size(dst_pack_dir) > quota:
+            # Over its quota the cache stops growing; the repository keeps its own packs
+            logger.warning(f"Shared object cache is over its {quota} byte quota; not adding {repo_url}")
+            return
+
+        packs = [name[:-5] for name in os.listdir(src_pack_dir) if name.endswith('.pack')]
+        for pack in packs:
+            for ext in ('.pack', '.promisor', '.rev', '.idx'):
+                src = os.path.join(src_pack_dir, pack + ext)
+                if os.path.exists(src):
+                    shutil.move(src, os.path.join(dst_pack_dir, pack + ext))
+
+        self._run([
+            'git', '-C', self.cache_dir, 'update-ref',
+            f'refs/cache/{self.cache_key(repo_url)}', head_sha
+        ])
+
+    def cache_key(self, repo_url: str) -> str:
+        """Stable ref name component for a remote URL"""
+        return cache_key(repo_url)
+
+    def _run(self, cmd: List[str]) -> str:
+        return run_git(cmd)
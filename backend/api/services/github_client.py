@@ -0,0 +1,181 @@
+import hashlib
+import time
+from typing import Dict, List, Optional
+import requests
+from django.conf import settings
+from django.core.cache import caches
+from loguru import logger
+from api.services.cancellation import request_timeout
+from api.services.rate_limits import GitHubRateLimited, backoff_seconds, is_rate_limited, rate_limits, resource_for
+
+GITHUB_API = 'https://api.github.com'
+
+def token_key(token: Optional[str]) -> str:
+    """Stands in for a token in cache keys and rate-limit records"""
+    return hashlib.sha256((token or 'anonymous').encode()).hexdigest()[:16]
+
+class GitHubError(Exception):
+    """Raised when GitHub answers with anything but success or 304"""
+
+    def __init__(self, status_code: Optional[int], message: str):
+        super().__init__(message)
+        self.status_code = status_code
+
+class GitHubClient:
+    """GitHub REST client that pages through lists and caches every response per token.
+
+    Cached responses younger than GITHUB_CACHE_FRESH_SECONDS are served
+    without a request. Older ones are revalidated with If-None-Match, and
+    GitHub's 304 answers do not count against the rate limit. Cache keys
+    include a hash of the token, so users never see each other's data.
+    Lists follow the Link header with per_page=100.
+
+    Requests go through the shared rate-limit tracker. Background clients
+    (analyses, imports) wait for the budget and retry rate-limited
+    responses after the reset. Interactive ones never sleep in a request;
+    they serve the cache or fail fast instead.
+    """
+
+    session = requests.Session()
+
+    def __init__(self, token: Optional[str] = None, background: bool = False):
+        self.token = token
+        self.background = background
+        self.max_wait = settings.GITHUB_RATE_LIMIT_MAX_WAIT if background else 0
+        self.cache = caches[settings.GITHUB_CACHE_ALIAS]
+        self.token_key = token_key(token)
+        self.headers = {'Accept': 'application/vnd.github.v3+json'}
+        if token:
+            self.headers['Authorization'] = f'token {token}'
+
+    def get(self, path: str, params: Optional[Dict] = None, max_age: Optional[int] = None):
+        """JSON body of one GET request, from the cache when it is still fresh or unchanged"""
+        return self._get(self._url(path), params, max_age)['data']
+
+    def get_all(self, path: str, params: Optional[Dict] = None, max_age: Optional[int] = None) -> List:
+        """Every item of a paginated list, following the Link header's next page"""
+        params = {'per_page': 100, **(params or {})}
+        url, items = self._url(path), []
+        for _ in range(settings.GITHUB_MAX_PAGES):
+            entry = self._get(url, params, max_age)
+            items.extend(entry['data'])
+            url = entry.get('next')
+            if not url:
+                break
+            params = None  # the next link already carries the query
+        else:
+            logger.warning(f"Stopped listing {path} after {settings.GITHUB_MAX_PAGES} pages")
+        return items
+
+    def get_repository(self, full_name: str) -> Dict:
+        return self.get(f'/repos/{full_name}')
+
+    def list_user_repositories(self) -> List[Dict]:
+        return self.get_all('/user/repos', {'sort': 'updated'})
+
+    def get_tree(self, full_name: str, ref: str, recursive: bool = True) -> Dict:
+        # Addressed by branch, trees change with every push: always revalidate (304s are free)
+        return self.get(
+            f'/repos/{full_name}/git/trees/{ref}',
+            {'recursive': '1'} if recursive else None,
+            max_age=0
+        )
+
+    def graphql(self, query: str, variables: Optional[Dict] = None) -> Dict:
+        """Run a GraphQL query; returns its data and errors, which may both be present"""
+        response = self._request('POST', f'{GITHUB_API}/graphql', self.headers, json={
+            'query': query,
+            'variables': variables or {},
+        })
+        if response.status_code != 200:
+            raise GitHubError(response.status_code, f"GitHub GraphQL returned {response.status_code}")
+        body = response.json()
+        return {'data': body.get('data') or {}, 'errors': body.get('errors') or []}
+
+    def get_repositories_metadata(self, full_names: List[str]) -> Dict[str, Optional[Dict]]:
+        """Metadata of many repositories in one GraphQL request; None for those not found"""
+        fields = []
+        variables = {}
+        declarations = []
+        for index, full_name in enumerate(full_names):
+            owner, name = full_name.split('/', 1)
+            variables[f'o{index}'], variables[f'n{index}'] = owner, name
+            declarations.append(f'$o{index}: String!, $n{index}: String!')
+            fields.append(f'r{index}: repository(owner: $o{index}, name: $n{index}) {{ ...repo }}')
+        query = (
+            f"query({', '.join(declarations)}) {{ {' '.join(fields)} }}\n"
+            "fragment repo on Repository {\n"
+            "  nameWithOwner url description diskUsage isPrivate\n"
+            "  primaryLanguage { name }\n"
+            "  languages(first: 10, orderBy: {field: SIZE, direction: DESC}) { edges { size node { name } } }\n"
+            "  defaultBranchRef { name target { oid } }\n"
+            "}"
+        )
+        result = self.graphql(query, variables)
+        for error in result['errors']:
+            logger.info(f"GitHub GraphQL: {error.get('message')}")
+        return {
+            full_name: result['data'].get(f'r{index}')
+            for index, full_name in enumerate(full_names)
+        }
+
+    def _url(self, path: str) -> str:
+        return path if path.startswith('http') else f'{GITHUB_API}{path}'
+
+    def _cache_key(self, url: str, params: Optional[Dict]) -> str:
+        query = '&'.join(f'{key}={value}' for key, value in sorted((params or {}).items()))
+        digest = hashlib.sha256(f'{url}?{query}'.encode()).hexdigest()
+        return f'github:{self.token_key}:{digest}'
+
+    def _get(self, url: str, params: Optional[Dict], max_age: Optional[int]) -> Dict:
+        max_age = settings.GITHUB_CACHE_FRESH_SECONDS if max_age is None else max_age
+        key = self._cache_key(url, params)
+        cached = self.cache.get(key)
+        if cached and time.time() - cached['fetched_at'] < max_age:
+            return cached
+
+        headers = dict(self.headers)
+        if cached and cached.get('etag'):
+            headers['If-None-Match'] = cached['etag']
+        try:
+            response = self._request('GET', url, headers, params=params)
+        except GitHubError as e:
+            if cached:
+                logger.warning(f"GitHub unavailable ({e}); serving cached {url}")
+                return cached
+            raise
+
+        if response.status_code == 304 and cached:
+            cached['fetched_at'] = time.time()
+            self.cache.set(key, cached)
+            return cached
+        if response.status_code != 200:
+            raise GitHubError(response.status_code, f"GitHub returned {response.status_code} for {url}")
+
+        entry = {
+            'data': response.json(),
+            'etag': response.headers.get('ETag'),
+            'next': response.links.get('next', {}).get('url'),
+            'fetched_at': time.time(),
+        }
+        self.cache.set(key, entry)
+        return entry
+
+    def _request(self, method: str, url: str, headers: Dict, **kwargs) -> requests.Response:
+        resource = resource_for(url)
+        for attempt in range(settings.GITHUB_RATE_LIMIT_RETRIES + 1):
+            try:
+                rate_limits.wait(self.token_key, resource, self.background, self.max_wait)
+                response = self.session.request(
+                    method, url, headers=headers, timeout=request_timeout(settings.GITHUB_TIMEOUT), **kwargs
+                )
+            except GitHubRateLimited as e:
+                raise GitHubError(429, str(e)) from e
+            except requests.RequestException as e:
+                raise GitHubError(None, str(e)) from e
+            rate_limits.record(self.token_key, url, response, attempt)
+            if not is_rate_limited(response):
+                return response
+            if backoff_seconds(response, attempt) > self.max_wait:
+                break
+        raise GitHubError(response.status_code, f"GitHub rate limit exceeded for {url}")
@@ -0,0 +1,97 @@
+import copy
+import threading
+from typing import Dict, Iterable, Optional
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from loguru import logger
+from api.models import LinkedRepository
+
+STAGES = ('plan', 'clone', 'ingest', 'ai_summary', 'scan', 'issues', 'hotspots', 'assessment')
+
+class AnalysisProgress:
+    """Per-stage status of one analysis run, persisted as it happens.
+
+    Every stage records its status (pending, running, complete, failed or
+    skipped), start and finish timestamps, and whatever partial result it
+    produced, e.g. the AI summary long before SonarQube is done. The state
+    is written to the analysis_progress field of every linked repository
+    following the run. Concurrent requests that join the same analysis all
+    see its progress.
+    """
+
+    def __init__(self, mode: str = 'full', repository_ids: Iterable = ()):
+        now = timezone.now().isoformat()
+        self.lock = threading.Lock()
+        self.repository_ids = set(repository_ids)
+        self.state = {
+            "mode": mode,
+            "started_at": now,
+            "updated_at": now,
+            "stages": {stage: {"status": "pending"} for stage in STAGES},
+        }
+        if mode == 'quick':
+            for stage in ('ingest', 'ai_summary'):
+                self.state["stages"][stage]["status"] = "skipped"
+        if not settings.ASSESSMENT_PREWARM:
+            self.state["stages"]["assessment"]["status"] = "skipped"
+        self._save()
+
+    def attach(self, repository_id):
+        """Start publishing to another repository that joined this run"""
+        with self.lock:
+            self.repository_ids.add(repository_id)
+        self._save([repository_id])
+
+    def start(self, stage: str):
+        self._update(stage, status="running", started_at=timezone.now().isoformat(), error=None)
+
+    def finish(self, stage: str, result: Optional[Dict] = None):
+        self._update(stage, status="complete", finished_at=timezone.now().isoformat(), result=result, error=None)
+
+    def fail(self, stage: str, error: str):
+        self._update(stage, status="failed", finished_at=timezone.now().isoformat(), error=error)
+
+    def snapshot(self) -> Dict:
+        with self.lock:
+            return copy.deepcopy(self.state)
+
+    def _update(self, stage: str, **fields):
+        with self.lock:
+            entry = self.state["stages"].setdefault(stage, {})
+            entry.update({key: value for key, value in fields.items() if value is not None or key == 'error'})
+            self.state["updated_at"] = timezone.now().isoformat()
+        self._save()
+
+    def _save(self, repository_ids: Optional[Iterable] = None):
+        state = self.snapshot()
+        ids = list(self.repository_ids if repository_ids is None else repository_ids)
+        if not ids:
+            return
+        try:
+            # update() so a concurrent save() of other fields cannot be clobbered, and vice versa
+            LinkedRepository.objects.filter(id__in=ids).update(
+                analysis_progress=state, updated_at=timezone.now()
+            )
+        except Exception as e:
+            logger.warning(f"Could not save analysis progress: {e}")
+
+def record_stage(repository_id, stage: str, status: str, **fields):
+    """Update one stage of a repository's stored progress after its analysis run has ended"""
+    now = timezone.now()
+    entry = {"status": status, **{key: value for key, value in fields.items() if value is not None}}
+    entry["started_at" if status == "running" else "finished_at"] = now.isoformat()
+    try:
+        with transaction.atomic():
+            repository = LinkedRepository.objects.select_for_update().only('analysis_progress').get(id=repository_id)
+            state = repository.analysis_progress or {}
+            stages = state.setdefault("stages", {})
+            if status != "running":
+                entry["started_at"] = (stages.get(stage) or {}).get("started_at")
+            stages[stage] = entry
+            state["updated_at"] = now.isoformat()
+            LinkedRepository.objects.filter(id=repository_id).update(analysis_progress=state, updated_at=now)
+    except LinkedRepository.DoesNotExist:
+        pass
+    except Exception as e:
+        logger.warning(f"Could not save {stage} progress: {e}")
@@ -0,0 +1,114 @@
+import hashlib
+import random
+import re
+from typing import Dict, List, Optional
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from loguru import logger
+from api.models import BankedQuestion
+
+LETTERS = 'ABCD'
+OPTION_PREFIX = re.compile(r'^\s*\(?([A-Da-d])[).:]\s*')
+LETTER_REFERENCE = re.compile(r'\b(Option|option|Answer|answer|Choice|choice)\s+([A-D])\b')
+
+def strip_option_prefix(option: str) -> str:
+    return OPTION_PREFIX.sub('', str(option), count=1)
+
+def question_fingerprint(text: str, options: List[str]) -> str:
+    normalized = ' '.join(text.lower().split()) + '|' + '|'.join(sorted(o.lower().strip() for o in options))
+    return hashlib.sha256(normalized.encode()).hexdigest()
+
+def shuffle_options(question: Dict, rng: random.Random) -> Dict:
+    """The question with its options in a new order, relabelled A) to D) and the answer moved along"""
+    order = list(range(len(question['options'])))
+    rng.shuffle(order)
+    new_index = {old: new for new, old in enumerate(order)}
+    explanation = LETTER_REFERENCE.sub(
+        lambda match: f"{match.group(1)} {LETTERS[new_index[LETTERS.index(match.group(2))]]}",
+        question.get('explanation', '')
+    )
+    return {
+        'text': question['text'],
+        'options': [f"{LETTERS[new]}) {question['options'][old]}" for new, old in enumerate(order)],
+        'correct_answer': new_index[question['correct_answer']],
+        'explanation': explanation,
+    }
+
+class QuestionBank:
+    """Validated assessment questions, reused across repositories and attempts.
+
+    Project questions are stored under the commit they were written for,
+    so forks, re-linked repositories and re-analyses of unchanged code
+    share them. Questions about a technology are stored under that
+    technology and serve any project that uses it. Every assessment
+    drawn from the bank is a fresh random sample with shuffled options,
+    so repeated attempts differ without another LLM call.
+    """
+
+    def __init__(self, rng: Optional[random.Random] = None):
+        self.rng = rng or random.Random()
+
+    def store(self, commit: Optional[str], questions: List[Dict], technologies: List[str]):
+        """Add generated questions; technology questions about other technologies stay with the commit"""
+        known = {technology.lower() for technology in technologies}
+        for question in questions:
+            options = [strip_option_prefix(option) for option in question['options']]
+            topic = str(question.get('topic') or 'project').strip().lower()
+            if topic not in known:
+                topic = 'project'
+            if topic == 'project' and not commit:
+                continue
+            try:
+                # A savepoint, so a duplicate does not break the caller's transaction
+                with transaction.atomic():
+                    BankedQuestion.objects.create(
+                        commit=commit or '',
+                        topic=topic,
+                        fingerprint=question_fingerprint(question['text'], options),
+                        text=question['text'],
+                        options=options,
+                        correct_answer=question['correct_answer'],
+                        explanation=question.get('explanation', '')
+                    )
+            except IntegrityError:
+                pass  # already banked for this commit
+
+    def draw(self, commit: Optional[str], technologies: List[str], count: Optional[int] = None) -> Optional[List[Dict]]:
+        """A shuffled sample of count questions, or None if the bank cannot cover this project yet"""
+        count = count or settings.ASSESSMENT_QUESTION_COUNT
+        # A minimum above the question count would be more than one assessment can hold
+        minimum = min(settings.ASSESSMENT_BANK_MIN_PROJECT_QUESTIONS, count)
+        project = list(BankedQuestion.objects.filter(commit=commit, topic='project')) if commit else []
+        if len(project) < minimum:
+            return None
+        topics = [technology.lower() for technology in technologies]
+        # The same technology question may be banked under several commits
+        seen = {question.fingerprint for question in project}
+        technology = []
+        for question in BankedQuestion.objects.filter(topic__in=topics).order_by('id') if topics else []:
+            if question.fingerprint not in seen:
+                seen.add(question.fingerprint)
+                technology.append(question)
+        if len(project) + len(technology) < count:
+            return None
+
+        # At least the minimum from the project itself, the rest from anything that fits
+        chosen = self.rng.sample(project, minimum)
+        rest = [question for question in project + technology if question not in chosen]
+        chosen += self.rng.sample(rest, count - minimum)
+        self.rng.shuffle(chosen)
+
+        BankedQuestion.objects.filter(id__in=[question.id for question in chosen]).update(
+            times_served=F('times_served') + 1
+        )
+        logger.info(f"Assessment for {commit} served from the question bank")
+        return [
+            shuffle_options({
+                'text': question.text,
+                'options': question.options,
+                'correct_answer': question.correct_answer,
+                'explanation': question.explanation,
+            }, self.rng)
+            for question in chosen
+        ]
@@ -0,0 +1,614 @@
+import ast
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+from django.conf import settings
+from loguru import logger
+
+PYTHON_EXTENSIONS = ('.py',)
+SCRIPT_EXTENSIONS = ('.js', '.jsx', '.mjs', '.cjs', '.ts', '.tsx')
+SKIP_DIRS = {'.git', 'node_modules', 'bower_components', 'vendor', 'third_party', 'dist', 'build',
+             'venv', '.venv', 'env', '__pycache__', 'site-packages', 'coverage', '.next'}
+MAX_FILE_BYTES = 1024 * 1024
+
+# Same limits SonarQube's default quality profiles use
+COGNITIVE_COMPLEXITY_THRESHOLD = 15
+MAX_PARAMETERS = 7
+MAX_FILE_LINES = 1000
+MAX_ISSUES = 100  # the Sonar path fetches one page of 100 issues too
+
+# rule: (type, severity, remediation minutes, message, introduction)
+RULES = {
+    'cognitive-complexity': ('CODE_SMELL', 'CRITICAL', 10,
+                             "Refactor this function to reduce its Cognitive Complexity from {value} to the {limit} allowed.",
+                             "Cognitive Complexity measures how hard the control flow of a function is to understand."),
+    'too-many-parameters': ('CODE_SMELL', 'MAJOR', 20,
+                            "This function has {value} parameters, which is greater than the {limit} authorized.",
+                            "Functions with a long parameter list are hard to call and usually do too much."),
+    'file-too-long': ('CODE_SMELL', 'MAJOR', 60,
+                      "This file has {value} lines, which is greater than {limit} authorized. Split it into smaller files.",
+                      "Very long files are hard to navigate and tend to mix several responsibilities."),
+    'bare-except': ('CODE_SMELL', 'MAJOR', 5,
+                    "Specify an exception class to catch or reraise the exception.",
+                    "A bare except also catches SystemExit and KeyboardInterrupt and hides real failures."),
+    'empty-except': ('CODE_SMELL', 'MAJOR', 5,
+                     "Handle this exception or explain in a comment why it can be ignored.",
+                     "Silently swallowed exceptions make failures very hard to diagnose."),
+    'mutable-default': ('CODE_SMELL', 'CRITICAL', 5,
+                        "Change this default value of \"{value}\" to None and initialize it inside the function.",
+                        "Default values are evaluated once, so a mutable default is shared between calls."),
+    'todo-comment': ('CODE_SMELL', 'INFO', 0,
+                     "Complete the task associated to this \"{value}\" comment.",
+                     "TODO and FIXME comments mark work that was never finished."),
+    'loose-equality': ('CODE_SMELL', 'MINOR', 5,
+                       "Replace \"{value}\" with \"{value}=\".",
+                       "Loose equality applies type coercion, which gives surprising results."),
+    'var-declaration': ('CODE_SMELL', 'MAJOR', 5,
+                        "Use \"let\" or \"const\" instead of \"var\".",
+                        "var is function scoped and hoisted, which invites scoping bugs."),
+    'debugger-statement': ('CODE_SMELL', 'MAJOR', 5,
+                           "Remove this debugger statement.",
+                           "debugger statements pause execution and should not be committed."),
+    'identity-with-literal': ('BUG', 'MAJOR', 5,
+                              "Replace \"{value}\" with an equality operator; identity of literals is not guaranteed.",
+                              "is compares object identity, which is unreliable for literals."),
+    'self-comparison': ('BUG', 'MAJOR', 5,
+                        "Correct one of the identical sides of this \"{value}\" operation.",
+                        "Comparing an expression with itself is always true or always false, so it is almost certainly a mistake."),
+    'self-assignment': ('BUG', 'MAJOR', 3,
+                        "Remove or correct this useless self-assignment.",
+                        "Assigning a variable to itself has no effect and usually hides a typo."),
+    'nan-comparison': ('BUG', 'MAJOR', 5,
+                       "Use Number.isNaN() instead of comparing with NaN.",
+                       "NaN is not equal to anything, including itself."),
+    'unsafe-yaml-load': ('VULNERABILITY', 'CRITICAL', 10,
+                         "Pass a safe Loader, or use yaml.safe_load(), when parsing YAML.",
+                         "yaml.load without a safe Loader can construct arbitrary Python objects."),
+    'tls-verification-disabled': ('VULNERABILITY', 'CRITICAL', 5,
+                                  "Enable server certificate validation on this request.",
+                                  "Disabling certificate validation exposes the connection to interception."),
+}
+
+# hotspot: (securityCategory, vulnerabilityProbability, message, riskDescription)
+HOTSPOTS = {
+    'dynamic-code': ('rce', 'MEDIUM', "Make sure that this dynamic code execution is safe here.",
+                     "Executing code built at runtime can let attackers run their own code."),
+    'shell-command': ('command-injection', 'HIGH', "Make sure that executing this OS command through a shell is safe here.",
+                      "Commands run through a shell can be altered by injected input."),
+    'deserialization': ('insecure-conf', 'MEDIUM', "Make sure that deserializing this data is safe here.",
+                        "Deserializing untrusted data can execute arbitrary code."),
+    'hardcoded-credentials': ('auth', 'HIGH', "Review this potentially hard-coded credential.",
+                              "Credentials committed to source code can be read by anyone with access to it."),
+    'weak-hash': ('weak-cryptography', 'LOW', "Make sure that this hashing algorithm is safe here.",
+                  "MD5 and SHA-1 are vulnerable to collisions."),
+    'dom-injection': ('xss', 'MEDIUM', "Make sure that writing raw HTML here is safe.",
+                      "Raw HTML built from user input can lead to cross-site scripting."),
+    'weak-random': ('weak-cryptography', 'LOW', "Make sure that using this pseudorandom number generator is safe here.",
+                    "Math.random is predictable and must not be used for security purposes."),
+}
+
+CREDENTIAL_NAME = re.compile(r'(pass(word|wd)?|pwd|secret|token|api_?key|private_?key)$', re.I)
+TODO_COMMENT = re.compile(r'(#|//|/\*)\s*(TODO|FIXME)\b', re.I)
+
+@dataclass
+class FileMetrics:
+    """Metrics and findings for one source file"""
+    path: str
+    language: str
+    ncloc: int = 0
+    cyclomatic_complexity: int = 0
+    cognitive_complexity: int = 0
+    issues: List[Tuple[str, int, Dict]] = field(default_factory=list)     # (rule, line, params)
+    hotspots: List[Tuple[str, int]] = field(default_factory=list)        # (hotspot, line)
+    error: Optional[str] = None
+
+    def issue(self, rule: str, line: int, **params):
+        self.issues.append((rule, line, params))
+
+    def hotspot(self, kind: str, line: int):
+        self.hotspots.append((kind, line))
+
+def count_ncloc(lines: List[str], comment_prefixes: Tuple[str, ...]) -> int:
+    return sum(1 for line in lines if line.strip() and not line.strip().startswith(comment_prefixes))
+
+class PythonMetricsVisitor:
+    """Computes complexity and findings for a Python module from its AST"""
+
+    COMPARE_NAMES = {ast.Eq: '==', ast.NotEq: '!=', ast.Lt: '<', ast.LtE: '<=', ast.Gt: '>', ast.GtE: '>=',
+                     ast.Is: 'is', ast.IsNot: 'is not'}
+
+    def __init__(self, result: FileMetrics):
+        self.result = result
+        self.function_depth = 0
+
+    def visit_module(self, tree: ast.Module):
+        self.result.cognitive_complexity += self._cognitive(tree.body, 0)
+        for node in ast.walk(tree):
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.Lambda)):
+                self.result.cyclomatic_complexity += 1
+            self.result.cyclomatic_complexity += self._decisions(node)
+            self._check(node)
+
+    def _decisions(self, node: ast.AST) -> int:
+        if isinstance(node, (ast.If, ast.IfExp, ast.For, ast.AsyncFor, ast.While, ast.ExceptHandler)):
+            return 1
+        if isinstance(node, ast.BoolOp):
+            return len(node.values) - 1
+        if isinstance(node, ast.comprehension):
+            return 1 + len(node.ifs)
+        if hasattr(ast, 'match_case') and isinstance(node, ast.match_case):
+            return 1
+        return 0
+
+    def _cognitive(self, body: List[ast.AST], nesting: int) -> int:
+        """Cognitive complexity of a block, reporting functions that exceed the threshold"""
+        total = 0
+        for node in body:
+            total += self._cognitive_node(node, nesting)
+        return total
+
+    def _cognitive_node(self, node: ast.AST, nesting: int) -> int:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            # Nested functions add to their parent's score at one more level of
+            # nesting; outermost ones are checked against the threshold
+            outermost = self.function_depth == 0
+            self.function_depth += 1
+            try:
+                score = self._cognitive(node.body, 0 if outermost else nesting + 1)
+            finally:
+                self.function_depth -= 1
+            if outermost and score > COGNITIVE_COMPLEXITY_THRESHOLD:
+                self.result.issue('cognitive-complexity', node.lineno, value=score, limit=COGNITIVE_COMPLEXITY_THRESHOLD)
+            return score
+        if isinstance(node, ast.ClassDef):
+            return self._cognitive(node.body, nesting)
+        if isinstance(node, ast.If):
+            score = 1 + nesting + self._expression(node.test, nesting) + self._cognitive(node.body, nesting + 1)
+            orelse = node.orelse
+            while len(orelse) == 1 and isinstance(orelse[0], ast.If):  # elif chain
+                elif_node = orelse[0]
+                score += 1 + self._expression(elif_node.test, nesting) + self._cognitive(elif_node.body, nesting + 1)
+                orelse = elif_node.orelse
+            if orelse:
+                score += 1 + self._cognitive(orelse, nesting + 1)
+            return score
+        if isinstance(node, (ast.For, ast.AsyncFor, ast.While)):
+            test = getattr(node, 'test', None)
+            score = 1 + nesting + (self._expression(test, nesting) if test else 0)
+            return score + self._cognitive(node.body, nesting + 1) + self._cognitive(node.orelse, nesting + 1)
+        if isinstance(node, ast.Try) or (hasattr(ast, 'TryStar') and isinstance(node, ast.TryStar)):
+            score = self._cognitive(node.body, nesting) + self._cognitive(node.orelse, nesting)
+            score += self._cognitive(node.finalbody, nesting)
+            for handler in node.handlers:
+                score += 1 + nesting + self._cognitive(handler.body, nesting + 1)
+            return score
+        if hasattr(ast, 'Match') and isinstance(node, ast.Match):
+            return 1 + nesting + sum(self._cognitive(case.body, nesting + 1) for case in node.cases)
+        if isinstance(node, (ast.With, ast.AsyncWith)):
+            return self._cognitive(node.body, nesting)
+        return self._expression(node, nesting)
+
+    def _expression(self, node: ast.AST, nesting: int) -> int:
+        """Boolean operator sequences, ternaries and lambdas inside a statement or expression"""
+        score = 0
+        for child in ast.walk(node):
+            if isinstance(child, ast.BoolOp):
+                score += 1
+            elif isinstance(child, ast.IfExp):
+                score += 1 + nesting
+        return score
+
+    def _check(self, node: ast.AST):
+        result = self.result
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            args = node.args
+            params = [a for a in args.posonlyargs + args.args + args.kwonlyargs if a.arg not in ('self', 'cls')]
+            if len(params) > MAX_PARAMETERS:
+                result.issue('too-many-parameters', node.lineno, value=len(params), limit=MAX_PARAMETERS)
+            for default in args.defaults + [d for d in args.kw_defaults if d is not None]:
+                if isinstance(default, (ast.List, ast.Dict, ast.Set)):
+                    result.issue('mutable-default', default.lineno, value=ast.unparse(default)[:40])
+        elif isinstance(node, ast.ExceptHandler):
+            if node.type is None:
+                result.issue('bare-except', node.lineno)
+            if all(isinstance(stmt, ast.Pass) for stmt in node.body):
+                result.issue('empty-except', node.lineno)
+        elif isinstance(node, ast.Compare):
+            left = node.left
+            for op, right in zip(node.ops, node.comparators):
+                name = self.COMPARE_NAMES.get(type(op))
+                if isinstance(op, (ast.Is, ast.IsNot)) and isinstance(right, ast.Constant) \
+                        and right.value is not None and not isinstance(right.value, bool) and right.value is not ...:
+                    result.issue('identity-with-literal', node.lineno, value=name)
+                elif name and not isinstance(left, ast.Constant) and ast.dump(left) == ast.dump(right):
+                    result.issue('self-comparison', node.lineno, value=name)
+                left = right
+        elif isinstance(node, ast.Assign):
+            if len(node.targets) == 1 and isinstance(node.targets[0], ast.Name) \
+                    and isinstance(node.value, ast.Name) and node.targets[0].id == node.value.id:
+                result.issue('self-assignment', node.lineno)
+            for target in node.targets:
+                name = target.id if isinstance(target, ast.Name) else getattr(target, 'attr', '')
+                if CREDENTIAL_NAME.search(name or '') and isinstance(node.value, ast.Constant) \
+                        and isinstance(node.value.value, str) and len(node.value.value) >= 4:
+                    result.hotspot('hardcoded-credentials', node.lineno)
+        elif isinstance(node, ast.Call):
+            self._check_call(node)
+
+    def _check_call(self, node: ast.Call):
+        result = self.result
+        func = node.func
+        name = func.id if isinstance(func, ast.Name) else func.attr if isinstance(func, ast.Attribute) else ''
+        owner = func.value.id if isinstance(func, ast.Attribute) and isinstance(func.value, ast.Name) else ''
+        keywords = {kw.arg: kw.value for kw in node.keywords if kw.arg}
+
+        if name in ('eval', 'exec') and not owner:
+            result.hotspot('dynamic-code', node.lineno)
+        elif owner == 'pickle' and name in ('load', 'loads') or owner == 'marshal' and name == 'loads':
+            result.hotspot('deserialization', node.lineno)
+        elif owner == 'hashlib' and name in ('md5', 'sha1'):
+            result.hotspot('weak-hash', node.lineno)
+        elif owner == 'os' and name in ('system', 'popen'):
+            result.hotspot('shell-command', node.lineno)
+        elif owner == 'yaml' and name == 'load' and 'Loader' not in keywords and len(node.args) < 2:
+            result.issue('unsafe-yaml-load', node.lineno)
+
+        shell = keywords.get('shell')
+        if isinstance(shell, ast.Constant) and shell.value is True:
+            result.hotspot('shell-command', node.lineno)
+        verify = keywords.get('verify')
+        if isinstance(verify, ast.Constant) and verify.value is False:
+            result.issue('tls-verification-disabled', node.lineno)
+
+def analyze_python(path: str, source: str) -> FileMetrics:
+    result = FileMetrics(path=path, language='Python')
+    lines = source.splitlines()
+    result.ncloc = count_ncloc(lines, ('#',))
+    try:
+        tree = ast.parse(source)
+    except (SyntaxError, ValueError) as e:
+        result.error = f"Could not parse: {e}"
+        return result
+    PythonMetricsVisitor(result).visit_module(tree)
+    return result
+
+SCRIPT_TOKEN = re.compile(r"""
+    (?P<comment>//[^\n]*|/\*.*?\*/)
+  | (?P<string>'(?:\\.|[^'\\\n])*'|"(?:\\.|[^"\\\n])*"|`(?:\\.|[^`\\])*`)
+  | (?P<word>[A-Za-z_$][\w$]*)
+  | (?P<number>\d[\w.]*)
+  | (?P<op>===|!==|==|!=|&&|\|\||\?\?|=>|\?\.|[{}()\[\];,?:=.<>!+\-*/%&|^~])
+  | (?P<newline>\n)
+  | (?P<space>\s+)
+  | (?P<other>.)
+""", re.S | re.X)
+
+CONTROL_KEYWORDS = {'if', 'for', 'while', 'switch', 'catch', 'do', 'else', 'try', 'finally', 'with', 'return', 'typeof'}
+
+def tokenize_script(source: str) -> Tuple[List[Tuple[str, str, int]], set]:
+    """(kind, text, line) for the code tokens of a JS/TS source, plus the lines comments touch"""
+    tokens = []
+    comment_lines = set()
+    line = 1
+    for match in SCRIPT_TOKEN.finditer(source):
+        kind, text = match.lastgroup, match.group()
+        if kind == 'comment':
+            comment_lines.update(range(line, line + text.count('\n') + 1))
+        elif kind not in ('space', 'newline'):
+            tokens.append((kind, text, line))
+        line += text.count('\n')
+    return tokens, comment_lines
+
+def analyze_script(path: str, source: str) -> FileMetrics:
+    """Approximate metrics for JavaScript/TypeScript from a token stream.
+
+    Braces opened by control structures raise the nesting level used for
+    cognitive complexity. A brace that follows `=>`, or a parameter list
+    owned by a name that is not a keyword, starts a function. Regular
+    expression literals are not recognised, so this is deliberately rough.
+    """
+    language = 'TypeScript' if path.endswith(('.ts', '.tsx')) else 'JavaScript'
+    result = FileMetrics(path=path, language=language)
+    result.ncloc = count_ncloc(source.splitlines(), ('//', '/*', '*'))
+    tokens, comment_lines = tokenize_script(source)
+
+    brace_stack = []        # (kind, line) with kind 'control', 'function' or 'block'
+    function_scores = []    # [score, start line] per open function
+    paren_owners = []
+    last_paren_owner = None
+    pending_control = False
+    closed_do = False
+    last_bool_op = None
+    nesting = 0
+
+    def add(score: int):
+        if function_scores:
+            function_scores[-1][0] += score
+        else:
+            result.cognitive_complexity += score
+
+    for i, (kind, text, line) in enumerate(tokens):
+        prev = tokens[i - 1] if i else ('', '', 0)
+        nxt = tokens[i + 1] if i + 1 < len(tokens) else ('', '', 0)
+
+        if kind == 'word':
+            if text == 'if':
+                add(1 if prev[1] == 'else' else 1 + nesting)
+                result.cyclomatic_complexity += 1
+                pending_control = True
+            elif text in ('for', 'while', 'switch', 'catch', 'do'):
+                closes_do = text == 'while' and prev[1] == '}' and closed_do
+                if not closes_do:
+                    add(1 + nesting)
+                    result.cyclomatic_complexity += text != 'do'
+                pending_control = not closes_do
+            elif text == 'else' and nxt[1] != 'if':
+                add(1)
+                pending_control = True
+            elif text == 'case':
+                result.cyclomatic_complexity += 1
+            elif text == 'var':
+                result.issue('var-declaration', line)
+            elif text == 'debugger':
+                result.issue('debugger-statement', line)
+            elif text == 'eval' and nxt[1] == '(' and prev[1] != '.':
+                result.hotspot('dynamic-code', line)
+            elif text == 'Function' and prev[1] == 'new':
+                result.hotspot('dynamic-code', line)
+            elif text == 'innerHTML' and prev[1] == '.' and nxt[1] == '=':
+                result.hotspot('dom-injection', line)
+            elif text == 'write' and prev[1] == '.' and i >= 2 and tokens[i - 2][1] == 'document':
+                result.hotspot('dom-injection', line)
+            elif text == 'random' and prev[1] == '.' and i >= 2 and tokens[i - 2][1] == 'Math':
+                result.hotspot('weak-random', line)
+            elif text == 'NaN' and prev[1] in ('==', '===', '!=', '!=='):
+                result.issue('nan-comparison', line)
+            elif CREDENTIAL_NAME.search(text) and nxt[1] in ('=', ':') and i + 2 < len(tokens) \
+                    and tokens[i + 2][0] == 'string' and len(tokens[i + 2][1]) >= 6:
+                result.hotspot('hardcoded-credentials', line)
+        elif kind == 'op':
+            if text in ('&&', '||', '??'):
+                result.cyclomatic_complexity += 1
+                if text != last_bool_op:
+                    add(1)
+                last_bool_op = text
+            elif text == '?' and nxt[1] not in ('.', ':', ')', ','):
+                add(1 + nesting)
+                result.cyclomatic_complexity += 1
+            elif text in ('==', '!='):
+                result.issue('loose-equality', line, value=text)
+            elif text == '(':
+                paren_owners.append(prev[1] if prev[0] == 'word' else None)
+            elif text == ')':
+                last_paren_owner = paren_owners.pop() if paren_owners else None
+            elif text == '{':
+                is_function = prev[1] == '=>' or (
+                    prev[1] == ')' and last_paren_owner and last_paren_owner not in CONTROL_KEYWORDS
+                )
+                if is_function and not pending_control:
+                    if function_scores:
+                        nesting += 1
+                        brace_stack.append(('nested-function', line))
+                    else:
+                        brace_stack.append(('function', line))
+                    function_scores.append([0, line])
+                    result.cyclomatic_complexity += 1
+                elif pending_control:
+                    nesting += 1
+                    brace_stack.append(('do' if prev[1] == 'do' else 'control', line))
+                    if prev[1] == ')' and nxt[1] == '}' and last_paren_owner == 'catch' \
+                            and not comment_lines.intersection(range(line, nxt[2] + 1)):
+                        result.issue('empty-except', line)
+                else:
+                    brace_stack.append(('block', line))
+                pending_control = False
+            elif text == '}':
+                opened, _ = brace_stack.pop() if brace_stack else ('block', line)
+                closed_do = opened == 'do'
+                if opened in ('control', 'do', 'nested-function'):
+                    nesting = max(0, nesting - 1)
+                if opened in ('function', 'nested-function') and function_scores:
+                    score, start = function_scores.pop()
+                    if function_scores:
+                        function_scores[-1][0] += score
+                    else:
+                        result.cognitive_complexity += score
+                        if score > COGNITIVE_COMPLEXITY_THRESHOLD:
+                            result.issue('cognitive-complexity', start, value=score, limit=COGNITIVE_COMPLEXITY_THRESHOLD)
+            elif text == '=>' and nxt[1] != '{':
+                result.cyclomatic_complexity += 1
+            if text in (';', '(', ')', '{', '}', ','):
+                last_bool_op = None
+            if text == ';' and not paren_owners:  # for (;;) headers keep their pending brace
+                pending_control = False
+    return result
+
+def analyze_file(full_path: str, rel_path: str) -> FileMetrics:
+    """Analyze one file; runs inside pool workers, so it must not touch Django"""
+    try:
+        with open(full_path, 'r', encoding='utf-8', errors='replace') as f:
+            source = f.read()
+    except OSError as e:
+        return FileMetrics(path=rel_path, language='Unknown', error=str(e))
+    if rel_path.endswith(PYTHON_EXTENSIONS):
+        result = analyze_python(rel_path, source)
+    else:
+        result = analyze_script(rel_path, source)
+
+    lines = source.splitlines()
+    if len(lines) > MAX_FILE_LINES:
+        result.issue('file-too-long', 1, value=len(lines), limit=MAX_FILE_LINES)
+    for number, text in enumerate(lines, start=1):
+        match = TODO_COMMENT.search(text)
+        if match:
+            result.issue('todo-comment', number, value=match.group(2).upper())
+    return result
+
+def is_analyzable(filename: str) -> bool:
+    return filename.endswith(PYTHON_EXTENSIONS + SCRIPT_EXTENSIONS) and not filename.endswith(('.min.js', '.d.ts'))
+
+def collect_source_files(repo_path: str, paths: Optional[List[str]] = None) -> List[Tuple[str, str]]:
+    """Source files of the repository, or of the given directories and files in it"""
+    candidates = []
+    for root in [os.path.join(repo_path, path) for path in paths] if paths else [repo_path]:
+        if os.path.isfile(root):
+            candidates.append(root)
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames[:] = [d for d in dirnames if d not in SKIP_DIRS and not d.startswith('.')]
+            candidates.extend(os.path.join(dirpath, filename) for filename in filenames)
+
+    files = []
+    for full_path in candidates:
+        if not is_analyzable(os.path.basename(full_path)):
+            continue
+        try:
+            if os.path.getsize(full_path) > MAX_FILE_BYTES:
+                continue
+        except OSError:
+            continue
+        files.append((full_path, os.path.relpath(full_path, repo_path).replace(os.sep, '/')))
+    return files
+
+def rating_for_severities(severities: List[str]) -> str:
+    """Sonar's reliability/security rating: the worst severity found decides the grade"""
+    order = {'MINOR': 'B', 'MAJOR': 'C', 'CRITICAL': 'D', 'BLOCKER': 'E'}
+    grades = [order[s] for s in severities if s in order]
+    return max(grades) if grades else 'A'
+
+def maintainability_rating(debt_minutes: int, ncloc: int) -> str:
+    """Sonar's SQALE rating from the technical debt ratio, with 30 minutes of development per line"""
+    ratio = debt_minutes / (ncloc * 30) if ncloc else 0
+    for limit, grade in ((0.05, 'A'), (0.1, 'B'), (0.2, 'C'), (0.5, 'D')):
+        if ratio <= limit:
+            return grade
+    return 'E'
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+def get_executor() -> ProcessPoolExecutor:
+    """One long-lived pool per process; spawn keeps forked Django threads and locks out of the workers"""
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=settings.QUICK_METRICS_WORKERS or os.cpu_count() or 1,
+            mp_context=multiprocessing.get_context('spawn')
+        )
+    return _executor
+
+def reset_executor():
+    """Drop a pool that broke, e.g. because a worker was killed, so the next call starts a fresh one"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+class QuickMetricsEngine:
+    """Sonar-free static analysis that runs in-process in seconds.
+
+    It produces the same `metrics`, `issues` and `security_hotspots`
+    shapes as SonarAnalyzer, from Python ASTs and a JS/TS tokenizer, so the
+    results drop straight into AnalysisResult and the candidate scoring.
+    The rules are a small subset of Sonar's, so counts are lower bounds and
+    the results are marked with engine "quick".
+    """
+
+    def analyze_repository(self, repo_path: str, paths: Optional[List[str]] = None) -> Dict:
+        """Analyze the repository, or only the given directories of it"""
+        repo_path = os.path.realpath(repo_path)
+        files = collect_source_files(repo_path, paths)
+        if len(files) < settings.QUICK_METRICS_POOL_MIN_FILES:
+            results = [analyze_file(full, rel) for full, rel in files]
+        else:
+            try:
+                results = list(get_executor().map(
+                    analyze_file, [f[0] for f in files], [f[1] for f in files], chunksize=16
+                ))
+            except Exception as e:
+                logger.warning(f"Quick metrics pool failed ({e}); analyzing in-process")
+                reset_executor()
+                results = [analyze_file(full, rel) for full, rel in files]
+        return self._aggregate(repo_path, results)
+
+    def _aggregate(self, repo_path: str, results: List[FileMetrics]) -> Dict:
+        issues, hotspots = [], []
+        counts = {'BUG': 0, 'VULNERABILITY': 0, 'CODE_SMELL': 0}
+        bug_severities, vulnerability_severities = [], []
+        debt = ncloc = cyclomatic = cognitive = 0
+        languages: Dict[str, int] = {}
+
+        for result in results:
+            ncloc += result.ncloc
+            cyclomatic += result.cyclomatic_complexity
+            cognitive += result.cognitive_complexity
+            languages[result.language] = languages.get(result.language, 0) + result.ncloc
+            if result.error:
+                logger.debug(f"Quick metrics skipped {result.path}: {result.error}")
+            file_path = os.path.join(repo_path, result.path)
+            lines = None
+
+            for rule, line, params in result.issues:
+                issue_type, severity, minutes, message, introduction = RULES[rule]
+                counts[issue_type] += 1
+                debt += minutes
+                if issue_type == 'BUG':
+                    bug_severities.append(severity)
+                elif issue_type == 'VULNERABILITY':
+                    vulnerability_severities.append(severity)
+                if len(issues) < MAX_ISSUES:
+                    lines = lines if lines is not None else self._read_lines(file_path)
+                    issues.append({
+                        "message": message.format(**params),
+                        "severity": severity,
+                        "type": issue_type,
+                        "rule": f"quick:{rule}",
+                        "component": result.path,
+                        "file_path": file_path,
+                        "textRange": {"startLine": line, "endLine": line},
+                        "code_snippet": lines[line - 1].strip() if 0 < line <= len(lines) else None,
+                        "introduction": introduction,
+                        "root_cause": None
+                    })
+
+            for kind, line in result.hotspots:
+                category, probability, message, risk = HOTSPOTS[kind]
+                lines = lines if lines is not None else self._read_lines(file_path)
+                hotspots.append({
+                    "message": message,
+                    "file_path": file_path,
+                    "textRange": {"startLine": line, "endLine": line},
+                    "code_snippet": lines[line - 1].strip() if 0 < line <= len(lines) else None,
+                    "securityCategory": category,
+                    "severity": probability,
+                    "component": result.path,
+                    "line": line,
+                    "riskDescription": risk,
+                })
+
+        return {
+            "metrics": {
+                "bugs": counts['BUG'],
+                "vulnerabilities": counts['VULNERABILITY'],
+                "code_smells": counts['CODE_SMELL'],
+                "security_hotspots": len(hotspots),
+                "cognitive_complexity": cognitive,
+                "cyclomatic_complexity": cyclomatic,
+                "maintainability_rating": maintainability_rating(debt, ncloc),
+                "reliability_rating": rating_for_severities(bug_severities),
+                "security_rating": rating_for_severities(vulnerability_severities),
+            },
+            "issues": issues,
+            "security_hotspots": hotspots,
+            "engine": "quick",
+            "files_analyzed": len(results),
+            "languages": {name: lines for name, lines in sorted(languages.items(), key=lambda item: -item[1])},
+        }
+
+    def _read_lines(self, file_path: str) -> List[str]:
+        try:
+            with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
+                return f.read().splitlines()
+        except OSError:
+            return []
@@ -0,0 +1,137 @@
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+from django.conf import settings
+from django.utils import timezone
+from loguru import logger
+from api.models import GitHubRateLimit
+from api.services.cancellation import sleep
+
+# Secondary rate limits say nothing about when they lift; start here and double per retry
+SECONDARY_BACKOFF_SECONDS = 60
+MAX_BACKOFF_SECONDS = 15 * 60
+
+class GitHubRateLimited(Exception):
+    """Raised when a GitHub request would have to wait longer than its caller allows"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+def resource_for(url: str) -> str:
+    """The rate-limit bucket GitHub charges a request to"""
+    path = urlparse(url).path
+    if path.startswith('/search/'):
+        return 'search'
+    if path.startswith('/graphql'):
+        return 'graphql'
+    return 'core'
+
+def is_rate_limited(response) -> bool:
+    if response.status_code == 429:
+        return True
+    if response.status_code != 403:
+        return False
+    if response.headers.get('X-RateLimit-Remaining') == '0' or 'Retry-After' in response.headers:
+        return True
+    return 'rate limit' in response.text.lower()
+
+def backoff_seconds(response, attempt: int = 0) -> float:
+    """How long to wait after a rate-limited response, honouring whatever GitHub told us"""
+    retry_after = response.headers.get('Retry-After')
+    if retry_after and retry_after.isdigit():
+        return float(retry_after)
+    reset = response.headers.get('X-RateLimit-Reset')
+    if response.headers.get('X-RateLimit-Remaining') == '0' and reset and reset.isdigit():
+        return max(1.0, int(reset) - time.time() + 1)
+    return float(min(SECONDARY_BACKOFF_SECONDS * 2 ** attempt, MAX_BACKOFF_SECONDS))
+
+class RateLimitTracker:
+    """GitHub rate-limit budgets per token, shared by every worker through the database.
+
+    Every response updates the remaining budget and its reset time.
+    Rate-limited responses block the token until the limit lifts. Before
+    a request, callers ask how long to wait. Background work keeps
+    GITHUB_RATE_LIMIT_RESERVE requests in hand, so it yields to
+    interactive requests before the budget runs out, not after.
+    """
+
+    def __init__(self):
+        # What this process last wrote per (token, resource), so unchanged budgets cost no write
+        self.recorded: Dict[Tuple[str, str], Dict] = {}
+        self.lock = threading.Lock()
+
+    def record(self, token_key: str, url: str, response, attempt: int = 0):
+        headers = response.headers
+        resource = headers.get('X-RateLimit-Resource') or resource_for(url)
+        fields = {}
+        if headers.get('X-RateLimit-Remaining', '').isdigit():
+            fields['remaining'] = int(headers['X-RateLimit-Remaining'])
+        if headers.get('X-RateLimit-Limit', '').isdigit():
+            fields['limit'] = int(headers['X-RateLimit-Limit'])
+        if headers.get('X-RateLimit-Reset', '').isdigit():
+            fields['reset_at'] = datetime.fromtimestamp(int(headers['X-RateLimit-Reset']), tz=dt_timezone.utc)
+        if is_rate_limited(response):
+            wait = backoff_seconds(response, attempt)
+            fields['blocked_until'] = timezone.now() + timedelta(seconds=wait)
+            logger.warning(f"GitHub rate limit hit on {resource} ({response.status_code}); backing off {wait:.0f}s")
+        key = (token_key, resource)
+        with self.lock:
+            if not fields or fields == self.recorded.get(key):
+                return
+        try:
+            GitHubRateLimit.objects.update_or_create(token_key=token_key, resource=resource, defaults=fields)
+        except Exception as e:
+            logger.warning(f"Could not record GitHub rate limit: {e}")
+            return
+        with self.lock:
+            self.recorded[key] = fields
+
+    def delay(self, token_key: str, resource: str = 'core', background: bool = False) -> float:
+        """Seconds to hold off before spending this token's budget, 0 if it can go now"""
+        try:
+            budget = GitHubRateLimit.objects.filter(token_key=token_key, resource=resource).first()
+        except Exception as e:
+            logger.warning(f"Could not read GitHub rate limit: {e}")
+            return 0.0
+        if budget is None:
+            return 0.0
+        now = timezone.now()
+        if budget.blocked_until and budget.blocked_until > now:
+            return (budget.blocked_until - now).total_seconds()
+        reserve = settings.GITHUB_RATE_LIMIT_RESERVE if background else 0
+        if budget.remaining is not None and budget.remaining <= reserve and budget.reset_at and budget.reset_at > now:
+            return (budget.reset_at - now).total_seconds() + 1
+        return 0.0
+
+    def wait(self, token_key: str, resource: str = 'core', background: bool = False, max_wait: float = 0):
+        """Sleep until the budget allows a request, or raise if that takes longer than max_wait"""
+        delay = self.delay(token_key, resource, background)
+        if delay <= 0:
+            return
+        if delay > max_wait:
+            raise GitHubRateLimited(f"GitHub {resource} rate limit: retry in {delay:.0f}s", delay)
+        logger.info(f"Waiting {delay:.0f}s for GitHub {resource} rate limit")
+        sleep(delay)
+
+    def snapshot(self, token_keys: Optional[List[str]] = None) -> List[Dict]:
+        """Remaining budgets, for the rate-limit endpoint"""
+        budgets = GitHubRateLimit.objects.all()
+        if token_keys is not None:
+            budgets = budgets.filter(token_key__in=token_keys)
+        now = timezone.now()
+        return [
+            {
+                'resource': budget.resource,
+                'limit': budget.limit,
+                'remaining': budget.remaining,
+                'reset_at': budget.reset_at.isoformat() if budget.reset_at else None,
+                'blocked_seconds': max(0, int((budget.blocked_until - now).total_seconds())) if budget.blocked_until else 0,
+                'updated_at': budget.updated_at.isoformat(),
+            }
+            for budget in budgets.order_by('resource')
+        ]
+
+rate_limits = RateLimitTracker()
@@ -0,0 +1,106 @@
+import random
+import time
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Tuple
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import OuterRef, Subquery
+from loguru import logger
+from api.models import AnalysisJob, LinkedRepository
+from api.services.analysis_runner import submit_analysis
+from api.services.github_client import GitHubClient, GitHubError
+
+# Repositories per GraphQL query; GitHub caps a query's cost, not its aliases
+CHECK_BATCH_SIZE = 50
+
+def analyzed_commit(repository: LinkedRepository) -> Optional[str]:
+    """The commit last analyzed, or last attempted if that analysis failed.
+
+    An analysis that failed before its clone finished only has the commit
+    its job was queued for, annotated by run_cycle as queued_commit.
+    """
+    results = repository.analysis_results or {}
+    commit = (results.get('project_info') or {}).get('commit')
+    if commit and repository.analysis_status == 'complete':
+        return commit
+    clone = ((repository.analysis_progress or {}).get('stages') or {}).get('clone') or {}
+    return (clone.get('result') or {}).get('commit') or getattr(repository, 'queued_commit', None) or commit
+
+def analyzed_mode(repository: LinkedRepository) -> str:
+    return (repository.analysis_progress or {}).get('mode') or settings.ANALYSIS_DEFAULT_MODE
+
+class RefreshScheduler:
+    """Re-analyzes linked repositories whose default branch moved since their last analysis.
+
+    Each cycle asks GitHub for the head of every analyzed repository,
+    fifty at a time, in one GraphQL query per batch and per owner's
+    token, so private repositories are checked with their owner's access.
+    Only repositories whose head differs from the analyzed commit are
+    queued. At most REFRESH_MAX_PER_CYCLE are queued per cycle, longest
+    unrefreshed first, and cycles are spread out with random jitter so
+    a fleet of schedulers does not hit GitHub in lockstep.
+    """
+
+    def __init__(self, max_per_cycle: Optional[int] = None, on_complete=None):
+        self.max_per_cycle = settings.REFRESH_MAX_PER_CYCLE if max_per_cycle is None else max_per_cycle
+        self.on_complete = on_complete
+
+    def run_forever(self, interval: Optional[float] = None, jitter: Optional[float] = None):
+        interval = settings.REFRESH_INTERVAL_SECONDS if interval is None else interval
+        jitter = settings.REFRESH_JITTER if jitter is None else jitter
+        while True:
+            try:
+                self.run_cycle()
+            except Exception as e:
+                logger.error(f"Refresh cycle failed: {e}")
+            finally:
+                close_old_connections()
+            time.sleep(interval * random.uniform(1 - jitter, 1 + jitter))
+
+    def run_cycle(self) -> List[Future]:
+        """Queue re-analysis of the repositories that moved; returns their futures"""
+        repositories = list(
+            LinkedRepository.objects
+            .filter(analysis_status__in=['complete', 'failed'])
+            .select_related('candidate__user')
+            .annotate(queued_commit=Subquery(
+                AnalysisJob.objects.filter(repository=OuterRef('pk')).order_by('-id').values('commit')[:1]
+            ))
+            .order_by('updated_at')
+        )
+        changed = self.find_changed(repositories)
+        queued = []
+        for repository, head in changed[:self.max_per_cycle]:
+            logger.info(f"{repository.repo_name} moved to {head}; re-analyzing")
+            # Queued for the head seen here, so a run that fails before cloning is not requeued every cycle
+            queued.append(submit_analysis(
+                repository, analyzed_mode(repository), on_complete=self.on_complete, commit=head
+            ))
+        if len(changed) > self.max_per_cycle:
+            logger.info(f"{len(changed) - self.max_per_cycle} changed repositories left for the next cycle")
+        logger.info(f"Refresh cycle: checked {len(repositories)}, {len(changed)} changed, queued {len(queued)}")
+        return queued
+
+    def find_changed(self, repositories: List[LinkedRepository]) -> List[Tuple[LinkedRepository, str]]:
+        """The repositories whose default branch head differs from analyzed_commit, with that head"""
+        by_token: Dict[Optional[str], List[LinkedRepository]] = {}
+        for repository in repositories:
+            token = repository.candidate.user.github_token or settings.GITHUB_TOKEN
+            by_token.setdefault(token, []).append(repository)
+
+        changed = []
+        for token, group in by_token.items():
+            client = GitHubClient(token, background=True)
+            for start in range(0, len(group), CHECK_BATCH_SIZE):
+                batch = group[start:start + CHECK_BATCH_SIZE]
+                try:
+                    metadata = client.get_repositories_metadata([repository.repo_name for repository in batch])
+                except GitHubError as e:
+                    logger.warning(f"Could not check {len(batch)} repositories for changes: {e}")
+                    continue
+                for repository in batch:
+                    head = ((metadata.get(repository.repo_name) or {}).get('defaultBranchRef') or {}).get('target') or {}
+                    if head.get('oid') and head['oid'] != analyzed_commit(repository):
+                        changed.append((repository, head['oid']))
+        # Keep the oldest-first order across tokens
+        return sorted(changed, key=lambda item: item[0].updated_at)
@@ -1,19 +1,27 @@
 import requests
-from typing import Dict, List, Optional, Union
+from typing import Any, Callable, Dict, List, Optional, Union
 from dataclasses import dataclass
 import base64
 import os
 import shutil
-import git
-import subprocess
+import tempfile
 from github import Github
 from gitingest import ingest
 from loguru import logger
-from tenacity import retry, stop_after_attempt, wait_exponential
-import tempfile
+from tenacity import Retrying, retry_if_exception, stop_after_attempt, wait_exponential
 from pathlib import Path
 import json
-from api.services.sonarAnalysis import SonarAnalyzer
+from django.conf import settings
+from api.services.sonarAnalysis import SonarAnalyzer, SonarTaskFailed
+from api.services.quick_metrics import QuickMetricsEngine
+from api.services.analysis_planner import AnalysisPlan, AnalysisPlanner
+from api.services.cancellation import AnalysisCancelled, CancelToken, StageTimeout, activate, request_timeout, sleep
+from api.services.resource_limits import collect_usage
+from api.services.checkpoints import CHECKPOINTED_STAGES, STAGE_RETRY_POLICIES, CheckpointStore, StageAbandoned
+from api.services.github_client import GitHubClient
+from api.services.git_clone import GitCloner, GitCloneError
+from api.services.structured_output import REVIEW_SCHEMA, StructuredOutputError, parse_structured
+from api.services.workspace_manager import split_repo_url, workspace_manager
 import sys
 from datetime import datetime
 from dotenv import load_dotenv
@@ -46,6 +54,11 @@ class AnalysisResult:
     metrics: Dict
     issues: List[Dict]
     security_hotspots: List[Dict]
+    commit: Optional[str] = None
+    scanner: Optional[Dict] = None
+    engine: str = "sonar"
+    plan: Optional[Dict] = None
+    resources: Optional[Dict] = None
 
     def to_json(self) -> Dict:
         return {
@@ -53,14 +66,19 @@ class AnalysisResult:
             "project_info": {
                 "name": self.project_name,
                 "path": str(self.project_path),
+                "commit": self.commit,
                 "description": self.description,
                 "technologies": self.technologies
             },
             "code_quality": {
                 "metrics": self.metrics,
                 "issues": self.issues,
-                "security_hotspots": self.security_hotspots
-            }
+                "security_hotspots": self.security_hotspots,
+                "engine": self.engine,
+                "scanner": self.scanner
+            },
+            "analysis_plan": self.plan,
+            "resources": self.resources
         }
 
 @dataclass
@@ -78,20 +96,137 @@ class SonarError:
             "timestamp": self.timestamp
         }
 
+class StageFailed(Exception):
+    """Carries a failed stage attempt's ErrorResponse through the retry loop"""
+
+    def __init__(self, error: ErrorResponse, retry: bool = True):
+        super().__init__(error.details or error.error)
+        self.error = error
+        self.retry = retry
+
 class RepoAnalyzer:
-    def __init__(self, github_token: str, huggingface_token: str, sonar_token: str, sonar_host: str = "http://localhost:9000"):
+    def __init__(self, github_token: str, huggingface_token: str, sonar_token: str, sonar_host: str = "http://localhost:9000", progress=None,
+                 cancel_token: Optional[CancelToken] = None):
         self.github_headers = {
             'Authorization': f'token {github_token}',
             'Accept': 'application/vnd.github.v3+json'
         }
+        self.github = GitHubClient(github_token, background=True)
         self.hf_headers = {"Authorization": f"Bearer {huggingface_token}"}
         #self.API_URL = "https://api-inference.huggingface.co/models/mistralai/Mistral-7B-Instruct-v0.2"
         self.API_URL = "https://router.huggingface.co/nebius/v1/chat/completions"
         self.sonar_analyzer = SonarAnalyzer(sonar_token, sonar_host)
+        self.workspace = None
+        self.head_sha = None
+        self.plan: Optional[AnalysisPlan] = None
+        # Optional AnalysisProgress that each stage reports to
+        self.progress = progress
+        self.current_stage = None
+        self.checkpoints: Optional[CheckpointStore] = None
+        self.cancel_token = cancel_token or CancelToken()
+        self.created_workspace = False
+        # Peak memory and CPU time of each stage's subprocesses
+        self.resource_usage: Dict[str, Dict] = {}
         
-    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
-    def analyze_repository(self, repo_url: str) -> Union[AnalysisResult, ErrorResponse]:
-        """Analyze repository using both AI and SonarQube"""
+    def analyze_repository(self, repo_url: str, mode: str = 'full', commit: Optional[str] = None) -> Union[AnalysisResult, ErrorResponse]:
+        """Analyze repository using both AI and SonarQube.
+
+        mode='quick' skips both and only runs the built-in metrics engine,
+        which takes seconds. In full mode that engine also stands in when
+        SonarQube fails.
+
+        Each stage is retried on its own under STAGE_RETRY_POLICIES, and
+        the outputs of completed stages are checkpointed per commit, so a
+        retry or a restarted worker resumes at the first unfinished stage.
+        Every stage also has a hard deadline (ANALYSIS_STAGE_TIMEOUTS), and
+        cancel_token stops the run, killing its git and scanner processes.
+        commit pins the revision to analyze; without it the remote's HEAD
+        at clone time is used.
+        """
+        try:
+            with activate(self.cancel_token):
+                result = self._analyze(repo_url, mode, commit)
+        except StageTimeout as e:
+            # A deadline hit outside _run_stage (planning, quick metrics) is a failure, not a cancel
+            logger.error(str(e))
+            result = ErrorResponse(error="Stage Timed Out", details=str(e))
+        except AnalysisCancelled as e:
+            logger.info(f"Analysis of {repo_url} stopped: {e}")
+            result = ErrorResponse(error="Analysis Cancelled", details=str(e))
+        if isinstance(result, ErrorResponse) and self.progress and self.current_stage:
+            self.progress.fail(self.current_stage, result.details or result.error)
+        return result
+
+    def _start_stage(self, stage: str):
+        self.current_stage = stage
+        if self.progress:
+            self.progress.start(stage)
+
+    def _finish_stage(self, stage: str, result: Optional[Dict] = None):
+        if self.progress:
+            self.progress.finish(stage, result)
+
+    def _run_stage(self, stage: str, work: Callable[[], Any]):
+        """Run one stage under its retry policy, or return its checkpointed output.
+
+        work returns the stage's output, or an ErrorResponse (or None) when
+        the attempt failed. The last failure is returned once the policy's
+        attempts are used up.
+        """
+        if self.checkpoints and stage in CHECKPOINTED_STAGES:
+            saved = self.checkpoints.get(stage)
+            if saved is not None:
+                logger.info(f"Resuming after the {stage} stage from its checkpoint")
+                return saved
+
+        policy = STAGE_RETRY_POLICIES[stage]
+        self.cancel_token.begin_stage(stage)
+
+        def attempt():
+            self.cancel_token.check()
+            try:
+                output = work()
+            except StageAbandoned as e:
+                raise StageFailed(ErrorResponse(error=f"Stage {stage} failed", details=str(e)), retry=False)
+            except Exception as e:
+                output = ErrorResponse(error=f"Stage {stage} failed", details=str(e))
+            if output is None:
+                output = ErrorResponse(error=f"Stage {stage} failed", details="The stage produced no output")
+            if isinstance(output, ErrorResponse):
+                raise StageFailed(output)
+            return output
+
+        try:
+            with collect_usage() as usage:
+                output = Retrying(
+                    stop=stop_after_attempt(policy.attempts),
+                    wait=wait_exponential(multiplier=1, min=policy.wait_min, max=policy.wait_max),
+                    retry=retry_if_exception(lambda e: isinstance(e, StageFailed) and e.retry),
+                    before_sleep=lambda state: logger.warning(
+                        f"Stage {stage} failed (attempt {state.attempt_number}/{policy.attempts}): "
+                        f"{state.outcome.exception().error.details}; retrying"
+                    ),
+                    sleep=sleep,
+                    reraise=True,
+                )(attempt)
+        except StageFailed as e:
+            return e.error
+        except StageTimeout as e:
+            logger.error(str(e))
+            return ErrorResponse(error="Stage Timed Out", details=str(e))
+        finally:
+            if usage.processes:
+                self.resource_usage[stage] = usage.to_json()
+                logger.info(
+                    f"Stage {stage}: {usage.processes} process(es), peak {usage.to_json()['peak_rss_mb']} MB, "
+                    f"{usage.cpu_seconds:.1f} CPU s"
+                )
+
+        if self.checkpoints and stage in CHECKPOINTED_STAGES:
+            self.checkpoints.save(stage, output)
+        return output
+
+    def _analyze(self, repo_url: str, mode: str, commit: Optional[str] = None) -> Union[AnalysisResult, ErrorResponse]:
         try:
             # Validate repository URL
             if not repo_url:
@@ -100,51 +235,98 @@ class RepoAnalyzer:
                     details="URL must be a valid git repository URL ending with .git"
                 )
 
-            with tempfile.TemporaryDirectory() as repo_dir:
-                try:
-                    project_name = repo_url.split('/')[-1].replace('.git', '')
-                    self.repo_dir = f"./cloned/{project_name}"
-                    logger.info(f"Cloning repository to: {Path(self.repo_dir).resolve()}")
-                    
-                    # Clone repository
-                    clone_result = self._clone_repo(repo_url)
-                    if isinstance(clone_result, ErrorResponse):
-                        return clone_result
-                    
-                    # Get AI Analysis
-                    _, tree, content = ingest(str(self.repo_dir))
-                    ai_result = self._generate_ai_review(repo_url, tree, content)
-                    if isinstance(ai_result, ErrorResponse):
-                        return ai_result
-                    
-                    # Get SonarQube Analysis
-                    project_key = repo_url.split('/')[-1].replace('.git', '').lower()
-                    sonar_result = self.sonar_analyzer.analyze_repository(str(self.repo_dir), project_key)
-                    print("\n\nSONAR: ", sonar_result)
-                    if not sonar_result:
-                        return ErrorResponse(
-                            error="SonarQube Analysis Failed",
-                            details="Failed to perform SonarQube analysis"
-                        )
-                    
-                    # Combine results
-                    return AnalysisResult(
-                        project_name=ai_result.get('name', 'Unknown Project'),
-                        project_path=Path(self.repo_dir).resolve(),
-                        description=ai_result.get('description', 'No description available'),
-                        technologies=ai_result.get('technologies', []),
-                        metrics=sonar_result['metrics'],
-                        issues=sonar_result['issues'],
-                        security_hotspots=sonar_result.get('security_hotspots', [])
+            owner, project_name = split_repo_url(repo_url)
+            try:
+                # Size up the repository from GitHub before cloning it
+                planner = AnalysisPlanner(self.github)
+                self._start_stage('plan')
+                self.cancel_token.begin_stage('plan')
+                self.plan = planner.plan_from_github(repo_url)
+                if self.plan:
+                    self._finish_stage('plan', self.plan.to_json())
+
+                # Clone repository
+                self._start_stage('clone')
+                clone_result = self._run_stage('clone', lambda: self._clone_repo(repo_url, commit))
+                if isinstance(clone_result, ErrorResponse):
+                    return clone_result
+                self._finish_stage('clone', {'commit': self.head_sha})
+                logger.info(f"Analyzing workspace: {self.repo_dir}")
+                self.checkpoints = CheckpointStore(repo_url, self.head_sha, mode) if self.head_sha else None
+
+                if self.plan is None:
+                    self.plan = planner.plan_from_checkout(str(self.repo_dir))
+                    self._finish_stage('plan', self.plan.to_json())
+                logger.info(f"Analysis plan for {repo_url}: {self.plan.strategy} ({self.plan.reason})")
+
+                if mode == 'quick':
+                    quick_result = self._run_quick_metrics()
+                    return self._build_result(
+                        {'name': project_name, 'description': '', 'technologies': list(quick_result['languages'])},
+                        quick_result
                     )
-                    
-                except Exception as e:
-                    logger.error(f"Error analyzing repository: {str(e)}")
+
+                # Get AI Analysis
+                self._start_stage('ingest')
+                ingested = self._run_stage('ingest', self._ingest)
+                if isinstance(ingested, ErrorResponse):
+                    return ingested
+                self._finish_stage('ingest', {'summary': ingested['summary']})
+
+                self._start_stage('ai_summary')
+                ai_result = self._run_stage(
+                    'ai_summary', lambda: self._generate_ai_review(repo_url, ingested['tree'], ingested['content'])
+                )
+                if isinstance(ai_result, ErrorResponse):
+                    return ai_result
+                self._finish_stage('ai_summary', {
+                    'name': ai_result.get('name'),
+                    'description': ai_result.get('description'),
+                    'technologies': ai_result.get('technologies', []),
+                })
+
+                # Get SonarQube Analysis: the scan and fetching its results are
+                # separate stages, so a results hiccup never reruns the scanner
+                project_key = f"{owner}_{project_name}".lower()
+                self.current_stage = None  # SonarAnalyzer reports its own stage failures
+                scan = self._run_stage('scan', lambda: self.sonar_analyzer.run_scanner(
+                    str(self.repo_dir), project_key, self.progress, sources=self.plan.scan_paths
+                ))
+                sonar_result = None
+                if not isinstance(scan, ErrorResponse):
+                    sonar_result = self._run_stage('results', lambda: self._collect_results(project_key, scan))
+                if isinstance(sonar_result, ErrorResponse):
+                    sonar_result = None
+                if not sonar_result and settings.QUICK_METRICS_FALLBACK:
+                    logger.warning(f"SonarQube analysis failed for {repo_url}; using quick metrics instead")
+                    sonar_result = self._run_quick_metrics()
+                if not sonar_result:
                     return ErrorResponse(
-                        error="Repository Analysis Failed",
-                        details=str(e)
+                        error="SonarQube Analysis Failed",
+                        details="Failed to perform SonarQube analysis"
                     )
-                
+
+                # Combine results
+                result = self._build_result(ai_result, sonar_result)
+                if self.checkpoints:
+                    self.checkpoints.clear()
+                return result
+
+            except Exception as e:
+                logger.error(f"Error analyzing repository: {str(e)}")
+                return ErrorResponse(
+                    error="Repository Analysis Failed",
+                    details=str(e)
+                )
+            finally:
+                if self.workspace and self.cancel_token.cancelled and self.created_workspace:
+                    # Nobody wants this checkout any more; give back the disk now
+                    workspace_manager.discard(self.workspace)
+                    self.workspace = None
+                elif self.workspace:
+                    workspace_manager.release(self.workspace)
+                    self.workspace = None
+
         except Exception as e:
             logger.error(f"Unexpected error: {str(e)}")
             return ErrorResponse(
@@ -152,28 +334,104 @@ class RepoAnalyzer:
                 details=str(e)
             )
 
-    def _clone_repo(self, repo_url: str) -> Union[bool, ErrorResponse]:
-        """Clone repository to temporary directory"""
+    def _ingest(self) -> Dict:
+        if self.plan.ingest_paths is None:
+            summary, tree, content = ingest(str(self.repo_dir))
+        else:
+            with tempfile.TemporaryDirectory(prefix='ingest-') as sample_root:
+                sample_dir = self._copy_sample(Path(sample_root))
+                summary, tree, content = ingest(str(sample_dir), max_file_size=self.plan.ingest_max_file_bytes)
+        return {'summary': summary, 'tree': tree, 'content': content}
+
+    def _copy_sample(self, root: Path) -> Path:
+        """Link the sampled files into a directory of their own for gitingest.
+
+        gitingest splits include patterns on spaces and commas and rejects
+        most punctuation, so paths like `src/app/(auth)/page.tsx` cannot be
+        passed to it as patterns. Ingesting a copy of just the sample needs
+        no patterns. The copy keeps the checkout's directory names, so the
+        summary and tree read as they would for the checkout itself.
+        """
+        sample_dir = root / self.repo_dir.parent.name / self.repo_dir.name
+        for relative in self.plan.ingest_paths:
+            source = self.repo_dir / relative
+            target = sample_dir / relative
+            target.parent.mkdir(parents=True, exist_ok=True)
+            try:
+                os.link(source, target)
+            except FileNotFoundError:
+                continue
+            except OSError:
+                # Another filesystem; the sample is small, so copying is cheap
+                shutil.copyfile(source, target)
+        sample_dir.mkdir(parents=True, exist_ok=True)
+        return sample_dir
+
+    def _collect_results(self, project_key: str, scan: Dict) -> Optional[Dict]:
+        try:
+            return self.sonar_analyzer.collect_results(str(self.repo_dir), project_key, scan, self.progress)
+        except SonarTaskFailed:
+            # The checkpointed task will never produce results; the next run has to scan again
+            if self.checkpoints:
+                self.checkpoints.discard('scan')
+            raise
+
+    def _run_quick_metrics(self) -> Dict:
+        """Run the built-in engine, reporting it as the scan, issues and hotspots stages"""
+        self._start_stage('scan')
+        # Under the scan deadline of its own, not whatever the failed scan left of it
+        self.cancel_token.begin_stage('scan')
+        quick_result = QuickMetricsEngine().analyze_repository(
+            str(self.repo_dir), paths=self.plan.scan_paths if self.plan else None
+        )
+        self._finish_stage('scan', {'engine': 'quick', 'files_analyzed': quick_result['files_analyzed']})
+        self._finish_stage('issues', {'metrics': quick_result['metrics'], 'issue_count': len(quick_result['issues'])})
+        self._finish_stage('hotspots', {'count': len(quick_result['security_hotspots'])})
+        return quick_result
+
+    def _build_result(self, ai_result: Dict, quality_result: Dict) -> AnalysisResult:
+        return AnalysisResult(
+            project_name=ai_result.get('name', 'Unknown Project'),
+            project_path=Path(self.repo_dir).resolve(),
+            description=ai_result.get('description', 'No description available'),
+            technologies=ai_result.get('technologies', []),
+            metrics=quality_result['metrics'],
+            issues=quality_result['issues'],
+            security_hotspots=quality_result.get('security_hotspots', []),
+            commit=self.head_sha,
+            scanner=quality_result.get('scanner'),
+            engine=quality_result.get('engine', 'sonar'),
+            plan=self.plan.to_json() if self.plan else None,
+            resources=self.resource_usage or None
+        )
+
+    def _clone_repo(self, repo_url: str, commit: Optional[str] = None) -> Union[bool, ErrorResponse]:
+        """Pin a workspace for commit, or the repository's current HEAD, cloning it if needed.
+
+        Workspaces are keyed by owner, repository and commit, so re-analysing
+        an unchanged repository reuses the existing checkout. New checkouts
+        come from the repository's local mirror, which only fetches the delta.
+        """
         try:
-            subprocess.run([
-                'git', 'clone',
-                '--depth=1',
-                '--no-checkout',
-                '--config', 'core.fileMode=false',
-                '--config', 'core.symlinks=false',
-                repo_url,
-                str(self.repo_dir)
-            ], check=True, capture_output=True)
-            
-            repo = git.Repo(str(self.repo_dir))
-            repo.git.checkout('HEAD')
+            owner, project_name = split_repo_url(repo_url)
+            cloner = GitCloner()
+            head_sha = commit or cloner.remote_head(repo_url)
+            self.workspace = workspace_manager.acquire(owner, project_name, head_sha) if head_sha else None
+            self.created_workspace = self.workspace is None
+            if self.workspace is None:
+                self.workspace = workspace_manager.create(
+                    owner, project_name,
+                    lambda dest: cloner.clone(repo_url, dest, head_sha),
+                    moved=cloner.moved
+                )
+            self.repo_dir = self.workspace.path
+            self.head_sha = self.workspace.commit
             return True
-            
-        except subprocess.CalledProcessError as e:
-            error_msg = e.stderr.decode() if e.stderr else str(e)
+
+        except GitCloneError as e:
             return ErrorResponse(
                 error="Git Clone Failed",
-                details=error_msg
+                details=str(e)
             )
         except Exception as e:
             return ErrorResponse(
@@ -181,56 +439,34 @@ class RepoAnalyzer:
                 details=str(e)
             )
 
-    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
-    def _generate_ai_review(self, repo_url: str, tree: str, content: str, prompt: Optional[str] = None) -> Union[Dict, ErrorResponse]:
-        """Generate project summary using Mistral"""
-        print("PROMPT: ", prompt)
+    def _generate_ai_review(self, repo_url: str, tree: str, content: str, prompt: Optional[str] = None,
+                            schema: Dict = REVIEW_SCHEMA, kind: str = 'review') -> Union[Dict, ErrorResponse]:
+        """Generate project summary using Mistral.
+
+        Output that cannot be parsed even after repair is sent back to the
+        model on its own to be reformatted, which is far cheaper than
+        sending the codebase again. kind names the output in the parse
+        statistics.
+        """
         try:
             logger.info(f"Sending request to Hugging Face API for repository: {repo_url}")
-            
-            response = requests.post(
-                self.API_URL,
-                headers=self.hf_headers,
-                json={
-                    "messages": [
-        {
-            "role": "user",
-            "content": prompt or self._get_analysis_prompt(tree, content),
-        }
-    ],
-                    "model": "meta-llama/Meta-Llama-3.1-8B-Instruct-fast"
-                    # "inputs": self._get_analysis_prompt(tree, content),
-                    # "parameters": {
-                    #     "temperature": 0.7,
-                    #     "top_p": 0.95,
-                    #     "return_full_text": False
-                    # }
-                },
-                timeout=30
-            )
-            
-            #response.raise_for_status()
-            
-            #print(response.json())
-            response_json = response.json()["choices"][0]["message"]
-            print("RESPONSE:", response_json.get('content'))
-            
-            # if not response_json or not isinstance(response_json, list) or len(response_json) == 0:
-            #     return ErrorResponse(
-            #         error="Invalid API Response",
-            #         details="API response format was not as expected"
-            #     )
-                
-            analysis = response_json.get('content')
+            analysis = self._complete(prompt or self._get_analysis_prompt(tree, content))
             if not analysis:
                 return ErrorResponse(
                     error="Empty Analysis",
                     details="No analysis text generated by API"
                 )
-                
+
             logger.info("Successfully received analysis from API")
-            return self._parse_ai_analysis(analysis)
-            
+            result = self._parse_ai_analysis(analysis, schema, kind)
+            for _ in range(settings.STRUCTURED_OUTPUT_REFORMAT_ATTEMPTS):
+                if not isinstance(result, ErrorResponse):
+                    break
+                logger.warning(f"Asking the model to reformat its {kind}: {result.details}")
+                analysis = self._complete(self._get_reformat_prompt(analysis, schema))
+                result = self._parse_ai_analysis(analysis, schema, kind)
+            return result
+
         except requests.exceptions.RequestException as e:
             return ErrorResponse(
                 error="API Request Failed",
@@ -242,25 +478,44 @@ class RepoAnalyzer:
                 details=str(e)
             )
 
-    def _parse_ai_analysis(self, analysis: str) -> Union[Dict, ErrorResponse]:
+    def _complete(self, prompt: str) -> Optional[str]:
+        response = requests.post(
+            self.API_URL,
+            headers=self.hf_headers,
+            json={
+                "messages": [
+                    {
+                        "role": "user",
+                        "content": prompt,
+                    }
+                ],
+                "model": "meta-llama/Meta-Llama-3.1-8B-Instruct-fast"
+            },
+            timeout=request_timeout(30)
+        )
+        content = response.json()["choices"][0]["message"].get('content')
+        logger.debug(f"AI response: {content}")
+        return content
+
+    def _parse_ai_analysis(self, analysis: str, schema: Dict = REVIEW_SCHEMA, kind: str = 'review') -> Union[Dict, ErrorResponse]:
         """Parse AI response into structured format"""
-        
         try:
-            clean_analysis = analysis.replace('\n---\n', '')
-            print("Final JSON: ")
-            json_analysis = json.loads(clean_analysis)
-            
-            return json_analysis
-        except json.JSONDecodeError as e:
+            return parse_structured(analysis, schema, kind)
+        except StructuredOutputError as e:
             return ErrorResponse(
                 error="JSON Parse Error",
                 details=f"Failed to parse AI response: {str(e)}"
             )
-        except Exception as e:
-            return ErrorResponse(
-                error="Analysis Parse Error",
-                details=str(e)
-            )
+
+    def _get_reformat_prompt(self, analysis: str, schema: Dict) -> str:
+        fields = ', '.join(
+            f'"{field}": ' + ('["..."]' if expected is list else '"..."') for field, expected in schema.items()
+        )
+        return (
+            "Rewrite the following text as a single JSON object of the form "
+            f"{{{fields}}}. Respond ONLY with the JSON object, no other text or formatting.\n\n"
+            f"{analysis}"
+        )
 
     def _get_analysis_prompt(self, tree: str, content: str) -> str:
         """Get the analysis prompt template"""
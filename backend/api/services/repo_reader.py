@@ -0,0 +1,433 @@
+import atexit
+import fnmatch
+import hashlib
+import os
+import subprocess
+import tempfile
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Iterator, List, Optional, Tuple
+from django.conf import settings
+
+CHUNK_SIZE = 64 * 1024
+
+# Restarting cat-file is cheaper than pumping this much unread blob data through the pipe
+MAX_DRAIN_BYTES = 1024 * 1024
+
+# Streamed content is copied out of cat-file into memory up to this size, and
+# into a temporary file past it
+SPOOL_MAX_BYTES = 1024 * 1024
+
+@dataclass
+class TreeEntry:
+    """A single file or directory inside a repository tree"""
+    name: str
+    path: str
+    type: str  # 'file' or 'directory'
+    sha: Optional[str] = None
+
+@dataclass
+class BlobInfo:
+    """Identity and size of a file's content"""
+    sha: str
+    size: int
+
+class GitObjectError(Exception):
+    """Raised when a cat-file process stops answering"""
+
+@lru_cache(maxsize=4096)
+def blob_sha(full_path: str, mtime_ns: int, size: int) -> str:
+    """Git blob SHA of a file, hashed in chunks and cached until the file changes"""
+    digest = hashlib.sha1(f"blob {size}\0".encode())
+    with open(full_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def normalize_repo_path(path: str) -> str:
+    """Strip slashes from a repository-relative path and reject traversal"""
+    path = (path or '').replace('\\', '/').strip('/')
+    if any(part in ('..', '.') for part in path.split('/')) or '\n' in path:
+        raise ValueError(f"Invalid repository path: {path}")
+    return path
+
+def sparse_excluded(path: str) -> bool:
+    """Whether a path matches GIT_SPARSE_EXCLUDES, so its blob was never fetched by a blob-less clone"""
+    if not settings.GIT_CLONE_FILTER:
+        return False
+    parts = path.split('/')
+    for pattern in settings.GIT_SPARSE_EXCLUDES:
+        if pattern.endswith('/'):
+            # A directory anywhere above the file
+            if any(fnmatch.fnmatchcase(part, pattern[:-1]) for part in parts[:-1]):
+                return True
+        elif '/' in pattern.strip('/'):
+            if fnmatch.fnmatchcase(path, pattern.lstrip('/')):
+                return True
+        elif fnmatch.fnmatchcase(parts[-1], pattern):
+            return True
+    return False
+
+class CatFileProcess:
+    """A long-lived `git cat-file --batch` (or --batch-check) process for one repository"""
+
+    def __init__(self, git_dir: str, mode: str = '--batch'):
+        self.git_dir = git_dir
+        self.mode = mode
+        self.lock = threading.Lock()
+        self.process = None
+        self.closed = False
+        self._start()
+
+    def _start(self):
+        self.process = subprocess.Popen(
+            ['git', '--git-dir', self.git_dir, 'cat-file', self.mode],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            # A blob a partial clone never fetched is reported missing instead of
+            # being fetched from the remote in the middle of a request (git 2.44+)
+            env={**os.environ, 'GIT_NO_LAZY_FETCH': '1'}
+        )
+
+    def _restart(self):
+        self._stop()
+        self._start()
+
+    def _stop(self):
+        if self.process and self.process.poll() is None:
+            self.process.kill()
+            self.process.wait()
+
+    def _request(self, spec: str) -> Optional[Tuple[str, str, int]]:
+        """Send one object name and read back its header. Caller holds the lock."""
+        for attempt in range(2):
+            if self.process.poll() is not None:
+                self._start()
+            try:
+                self.process.stdin.write(spec.encode() + b'\n')
+                self.process.stdin.flush()
+                header = self.process.stdout.readline()
+            except (BrokenPipeError, OSError):
+                header = b''
+            if header:
+                break
+            self._restart()
+        else:
+            raise GitObjectError(f"git cat-file stopped answering for {self.git_dir}")
+
+        if header.endswith((b' missing\n', b' ambiguous\n')):
+            return None
+        sha, obj_type, size = header.split()
+        return sha.decode(), obj_type.decode(), int(size)
+
+    def _read_exact(self, size: int) -> bytes:
+        data = self.process.stdout.read(size)
+        if len(data) != size:
+            raise GitObjectError(f"Short read from git cat-file for {self.git_dir}")
+        return data
+
+    @contextmanager
+    def _session(self):
+        """Hold the process for one request"""
+        with self.lock:
+            try:
+                yield
+            finally:
+                if self.closed:
+                    # Evicted from the pool while a caller still held it: the
+                    # request restarted it, so stop it again rather than leak it
+                    self._stop()
+
+    def info(self, spec: str) -> Optional[Tuple[str, str, int]]:
+        """Return (sha, type, size) for an object name, or None if it does not exist"""
+        with self._session():
+            header = self._request(spec)
+            if header and self.mode == '--batch':
+                # --batch always sends the body; skip past it
+                self._skip(header[2] + 1)
+            return header
+
+    def read(self, spec: str) -> Optional[Tuple[str, str, bytes]]:
+        """Return (sha, type, content) for an object name, or None if it does not exist"""
+        with self._session():
+            header = self._request(spec)
+            if header is None:
+                return None
+            sha, obj_type, size = header
+            data = self._read_exact(size)
+            self._read_exact(1)  # trailing newline
+            return sha, obj_type, data
+
+    def stream(self, spec: str, start: int = 0, length: Optional[int] = None) -> Iterator[bytes]:
+        """Yield part of an object's content in chunks.
+
+        The range is copied out of the process first, into memory or a
+        temporary file past SPOOL_MAX_BYTES, and sent from there once the
+        process is free again, so a slow client never holds up other reads
+        of the repository.
+        """
+        buffer = self._copy_range(spec, start, length)
+        if buffer is None:
+            return
+        with buffer:
+            buffer.seek(0)
+            for chunk in iter(lambda: buffer.read(CHUNK_SIZE), b''):
+                yield chunk
+
+    def _copy_range(self, spec: str, start: int, length: Optional[int]):
+        with self._session():
+            header = self._request(spec)
+            if header is None:
+                return None
+            size = header[2]
+            start = min(start, size)
+            end = size if length is None else min(size, start + length)
+            position = 0
+            buffer = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+            try:
+                self._skip(start)
+                position = start
+                while position < end:
+                    chunk = self._read_exact(min(CHUNK_SIZE, end - position))
+                    position += len(chunk)
+                    buffer.write(chunk)
+            except BaseException:
+                buffer.close()
+                raise
+            finally:
+                remaining = size - position + 1
+                if remaining > MAX_DRAIN_BYTES or self.process.poll() is not None:
+                    self._restart()
+                else:
+                    self._skip(remaining)
+            return buffer
+
+    def _skip(self, count: int):
+        while count > 0:
+            count -= len(self._read_exact(min(CHUNK_SIZE, count)))
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            self._stop()
+
+class CatFilePool:
+    """Keeps a bounded number of cat-file processes alive and shares them across requests"""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.processes = OrderedDict()
+
+    def _key(self, git_dir: str, mode: str):
+        # Include the inode so a re-cloned repository never reuses a process
+        # that still has the old pack files open
+        git_dir = os.path.realpath(git_dir)
+        return git_dir, os.stat(git_dir).st_ino, mode
+
+    def get(self, git_dir: str, mode: str = '--batch') -> CatFileProcess:
+        key = self._key(git_dir, mode)
+        evicted = []
+        with self.lock:
+            process = self.processes.get(key)
+            if process is None:
+                process = CatFileProcess(key[0], mode)
+                self.processes[key] = process
+                while len(self.processes) > self.max_size:
+                    evicted.append(self.processes.popitem(last=False)[1])
+            else:
+                self.processes.move_to_end(key)
+        for old in evicted:
+            old.close()
+        return process
+
+    def discard(self, git_dir: str):
+        """Close every process serving git_dir, e.g. before it is deleted"""
+        git_dir = os.path.realpath(git_dir)
+        with self.lock:
+            keys = [key for key in self.processes if key[0] == git_dir]
+            closing = [self.processes.pop(key) for key in keys]
+        for process in closing:
+            process.close()
+
+    def close_all(self):
+        with self.lock:
+            closing = list(self.processes.values())
+            self.processes.clear()
+        for process in closing:
+            process.close()
+
+cat_file_pool = CatFilePool(settings.GIT_CAT_FILE_POOL_SIZE)
+atexit.register(cat_file_pool.close_all)
+
+class GitObjectReader:
+    """Serves trees and blobs of one revision straight from the git object store.
+
+    Blobs of sparse-excluded paths were never fetched by the blob-less
+    clone, and asking git for them would fetch each one from the remote
+    (older git ignores GIT_NO_LAZY_FETCH), so they have no size and no
+    content here.
+    """
+
+    def __init__(self, git_dir: str, rev: str = 'HEAD'):
+        self.git_dir = git_dir
+        self.rev = rev
+
+    def _spec(self, path: str) -> str:
+        return f"{self.rev}:{normalize_repo_path(path)}"
+
+    def list_dir(self, path: str) -> Optional[List[TreeEntry]]:
+        path = normalize_repo_path(path)
+        obj = cat_file_pool.get(self.git_dir).read(self._spec(path))
+        if obj is None or obj[1] != 'tree':
+            return None
+        entries = []
+        prefix = f"{path}/" if path else ''
+        for mode, name, sha in self._parse_tree(obj[2]):
+            # Trees and submodules (gitlinks) both show up as directories
+            is_dir = mode in (b'40000', b'160000')
+            entries.append(TreeEntry(
+                name=name,
+                path=prefix + name,
+                type='directory' if is_dir else 'file',
+                sha=sha
+            ))
+        return entries
+
+    def _parse_tree(self, data: bytes):
+        """Yield (mode, name, sha) from a raw tree object"""
+        pos = 0
+        while pos < len(data):
+            space = data.index(b' ', pos)
+            nul = data.index(b'\0', space)
+            mode = data[pos:space]
+            name = data[space + 1:nul].decode('utf-8', errors='replace')
+            sha = data[nul + 1:nul + 21].hex()
+            pos = nul + 21
+            yield mode, name, sha
+
+    def entry_size(self, entry: TreeEntry) -> Optional[int]:
+        if sparse_excluded(entry.path):
+            return None
+        info = cat_file_pool.get(self.git_dir, '--batch-check').info(entry.sha or self._spec(entry.path))
+        return info[2] if info and info[1] == 'blob' else None
+
+    def count_visible_children(self, entry: TreeEntry) -> int:
+        children = self.list_dir(entry.path)
+        return sum(1 for child in children or [] if not child.name.startswith('.'))
+
+    def stat(self, path: str) -> Optional[BlobInfo]:
+        if sparse_excluded(normalize_repo_path(path)):
+            return None
+        info = cat_file_pool.get(self.git_dir, '--batch-check').info(self._spec(path))
+        if info is None or info[1] != 'blob':
+            return None
+        return BlobInfo(sha=info[0], size=info[2])
+
+    def stream(self, path: str, start: int = 0, length: Optional[int] = None) -> Iterator[bytes]:
+        return cat_file_pool.get(self.git_dir).stream(self._spec(path), start, length)
+
+    def read(self, path: str) -> bytes:
+        if sparse_excluded(normalize_repo_path(path)):
+            raise FileNotFoundError(path)
+        obj = cat_file_pool.get(self.git_dir).read(self._spec(path))
+        if obj is None or obj[1] != 'blob':
+            raise FileNotFoundError(path)
+        return obj[2]
+
+    def local_path(self, path: str) -> Optional[str]:
+        return None
+
+class WorktreeReader:
+    """Serves trees and files from a checked-out working tree"""
+
+    def __init__(self, repo_dir: str):
+        self.repo_dir = os.path.realpath(repo_dir)
+
+    def _full_path(self, path: str) -> str:
+        full_path = os.path.realpath(os.path.join(self.repo_dir, normalize_repo_path(path)))
+        if full_path != self.repo_dir and not full_path.startswith(self.repo_dir + os.sep):
+            raise ValueError(f"Invalid repository path: {path}")
+        return full_path
+
+    def list_dir(self, path: str) -> Optional[List[TreeEntry]]:
+        full_path = self._full_path(path)
+        if not os.path.isdir(full_path):
+            return None
+        with os.scandir(full_path) as it:
+            return [
+                TreeEntry(
+                    name=entry.name,
+                    path=os.path.relpath(entry.path, self.repo_dir).replace(os.sep, '/'),
+                    type='directory' if entry.is_dir() else 'file'
+                )
+                for entry in it
+            ]
+
+    def entry_size(self, entry: TreeEntry) -> Optional[int]:
+        return os.stat(self._full_path(entry.path)).st_size if entry.type == 'file' else None
+
+    def count_visible_children(self, entry: TreeEntry) -> int:
+        try:
+            with os.scandir(self._full_path(entry.path)) as it:
+                return sum(1 for child in it if not child.name.startswith('.'))
+        except OSError:
+            return 0
+
+    def stat(self, path: str) -> Optional[BlobInfo]:
+        full_path = self._full_path(path)
+        if not os.path.isfile(full_path):
+            return None
+        file_stat = os.stat(full_path)
+        return BlobInfo(
+            sha=blob_sha(full_path, file_stat.st_mtime_ns, file_stat.st_size),
+            size=file_stat.st_size
+        )
+
+    def stream(self, path: str, start: int = 0, length: Optional[int] = None) -> Iterator[bytes]:
+        with open(self._full_path(path), 'rb') as f:
+            f.seek(start)
+            remaining = length
+            while remaining is None or remaining > 0:
+                chunk = f.read(CHUNK_SIZE if remaining is None else min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+
+    def read(self, path: str) -> bytes:
+        with open(self._full_path(path), 'rb') as f:
+            return f.read()
+
+    def local_path(self, path: str) -> Optional[str]:
+        return self._full_path(path)
+
+def find_git_dir(repo_dir: str) -> Optional[str]:
+    """Locate the git directory of a checkout, worktree or bare repository"""
+    dot_git = os.path.join(repo_dir, '.git')
+    if os.path.isdir(dot_git):
+        return dot_git
+    if os.path.isfile(dot_git):
+        # Worktree: .git is a file pointing at its git directory inside the mirror
+        with open(dot_git) as f:
+            content = f.read().strip()
+        if content.startswith('gitdir:'):
+            git_dir = os.path.join(repo_dir, content[len('gitdir:'):].strip())
+            return git_dir if os.path.isdir(git_dir) else None
+    if os.path.isfile(os.path.join(repo_dir, 'HEAD')) and os.path.isdir(os.path.join(repo_dir, 'objects')):
+        return repo_dir
+    return None
+
+def get_repo_reader(repo_dir: str, rev: str = 'HEAD'):
+    """Pick the reader for a repository directory, preferring the git object store"""
+    git_dir = find_git_dir(repo_dir) if settings.REPO_READER_USE_GIT_OBJECTS else None
+    if git_dir:
+        return GitObjectReader(git_dir, rev)
+    if os.path.isdir(repo_dir):
+        return WorktreeReader(repo_dir)
+    return None
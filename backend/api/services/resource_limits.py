@@ -0,0 +1,234 @@
+import ctypes
+import os
+import platform
+import shutil
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from functools import lru_cache
+from typing import Dict, List, Optional
+from django.conf import settings
+from loguru import logger
+
+try:
+    import resource
+except ImportError:  # Windows: no rlimits or priorities, usage is not measured
+    resource = None
+
+# ioprio_set(2) has no Python binding; its syscall number differs per architecture
+IOPRIO_SET_SYSCALLS = {'x86_64': 251, 'i386': 289, 'i686': 289, 'aarch64': 30, 'armv7l': 314}
+IOPRIO_WHO_PROCESS = 1
+IOPRIO_CLASS_SHIFT = 13
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+@dataclass
+class ResourceUsage:
+    """Peak memory and CPU time of one or more analysis subprocesses"""
+    processes: int = 0
+    peak_rss_bytes: int = 0
+    cpu_seconds: float = 0.0
+    wall_seconds: float = 0.0
+    source: str = 'proc'  # proc: sampled from /proc; cgroup: the job's own cgroup counters
+
+    def add(self, other: 'ResourceUsage'):
+        self.processes += other.processes
+        self.peak_rss_bytes = max(self.peak_rss_bytes, other.peak_rss_bytes)
+        self.cpu_seconds += other.cpu_seconds
+        self.wall_seconds += other.wall_seconds
+        if other.source == 'cgroup':
+            self.source = 'cgroup'
+
+    def to_json(self) -> Dict:
+        usage = asdict(self)
+        usage['peak_rss_mb'] = round(self.peak_rss_bytes / (1024 * 1024), 1)
+        usage['cpu_seconds'] = round(self.cpu_seconds, 2)
+        usage['wall_seconds'] = round(self.wall_seconds, 2)
+        return usage
+
+def set_io_priority(task_id: int, io_class: int, level: int) -> bool:
+    """ioprio_set for one process or thread; False where the platform does not support it"""
+    number = IOPRIO_SET_SYSCALLS.get(platform.machine())
+    if number is None or not io_class:
+        return False
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        return libc.syscall(number, IOPRIO_WHO_PROCESS, task_id, (io_class << IOPRIO_CLASS_SHIFT) | level) == 0
+    except (OSError, AttributeError):
+        return False
+
+def lower_thread_priority():
+    """Run the calling thread, and whatever it does in-process (gitingest, quick metrics), at analysis priority.
+
+    Used as the analysis executor's initializer. Linux applies nice and
+    I/O priority per thread, so the request threads are unaffected.
+    """
+    if resource is None or not hasattr(threading, 'get_native_id'):
+        return
+    task_id = threading.get_native_id()
+    try:
+        os.setpriority(os.PRIO_PROCESS, task_id, settings.ANALYSIS_NICE)
+    except OSError as e:
+        logger.debug(f"Could not lower analysis thread priority: {e}")
+    set_io_priority(task_id, settings.ANALYSIS_IONICE_CLASS, settings.ANALYSIS_IONICE_LEVEL)
+
+def process_tree(pid: int) -> List[int]:
+    """pid and every live descendant, read from /proc"""
+    tree, pending = [], [pid]
+    while pending:
+        current = pending.pop()
+        tree.append(current)
+        try:
+            for task in os.listdir(f'/proc/{current}/task'):
+                with open(f'/proc/{current}/task/{task}/children') as f:
+                    pending.extend(int(child) for child in f.read().split())
+        except OSError:
+            continue
+    return tree
+
+@lru_cache(maxsize=None)
+def find_tool(name: str) -> Optional[str]:
+    """Path of a limit launcher (nice, ionice, prlimit), warning once when it is missing"""
+    path = shutil.which(name)
+    if path is None:
+        logger.warning(f"{name} is not installed; analysis subprocesses run without the limits it applies")
+    return path
+
+class ProcessLimiter:
+    """Runs one child process under the analysis limits and measures what it uses.
+
+    command() wraps the child's argv so the limits are in place before its
+    first instruction: nice -n ANALYSIS_NICE, ionice with the
+    ANALYSIS_IONICE_CLASS/LEVEL I/O priority and, when set, prlimit with
+    RLIMIT_CPU and RLIMIT_AS. Each tool execs the next, so the child keeps
+    the pid Popen returned and every helper it forks inherits all of them.
+    With ANALYSIS_CGROUP pointing at a delegated cgroup v2 directory, a
+    small sh launcher first writes its own pid into a fresh cgroup under
+    it, which carries the memory limit instead of RLIMIT_AS (the scanner
+    JVM reserves far more address space than it uses) and gives exact peak
+    memory and CPU figures. Without one, usage is sampled from /proc while
+    the process runs. Tools that are not installed are skipped with a warning.
+    """
+
+    def __init__(self):
+        self.pid: Optional[int] = None
+        self.started_at = time.monotonic()
+        self.cgroup: Optional[str] = None
+        self.peak_rss = 0
+        self.cpu_ticks = 0
+
+    def command(self, cmd: List[str]) -> List[str]:
+        """cmd prefixed with the launchers that apply the limits before it runs"""
+        if resource is None:
+            return list(cmd)
+        prefix = []
+        if settings.ANALYSIS_CGROUP:
+            self.cgroup = self._create_cgroup()
+            if self.cgroup:
+                prefix += ['/bin/sh', '-c', 'echo $$ > "$0/cgroup.procs" && exec "$@"', self.cgroup]
+        if settings.ANALYSIS_NICE and find_tool('nice'):
+            prefix += ['nice', '-n', str(settings.ANALYSIS_NICE)]
+        if settings.ANALYSIS_IONICE_CLASS and find_tool('ionice'):
+            prefix += ['ionice', '-c', str(settings.ANALYSIS_IONICE_CLASS)]
+            if settings.ANALYSIS_IONICE_CLASS in (1, 2):  # the idle class takes no level
+                prefix += ['-n', str(settings.ANALYSIS_IONICE_LEVEL)]
+        limits = []
+        if settings.ANALYSIS_CPU_LIMIT_SECONDS:
+            limits.append(f'--cpu={settings.ANALYSIS_CPU_LIMIT_SECONDS}')
+        if settings.ANALYSIS_MEMORY_LIMIT_MB and not self.cgroup:
+            limits.append(f'--as={settings.ANALYSIS_MEMORY_LIMIT_MB * 1024 * 1024}')
+        if limits and find_tool('prlimit'):
+            prefix += ['prlimit', *limits, '--']
+        return prefix + list(cmd)
+
+    def started(self, pid: int):
+        self.pid = pid
+        self.started_at = time.monotonic()
+
+    def sample(self):
+        """Record the process tree's current memory and CPU time"""
+        if resource is None or self.cgroup or self.pid is None:
+            return
+        rss = ticks = 0
+        for pid in process_tree(self.pid):
+            try:
+                with open(f'/proc/{pid}/stat') as f:
+                    # Fields after the command name: utime, stime, cutime, cstime at 11-14, rss at 21;
+                    # cutime/cstime hold the descendants that already exited
+                    fields = f.read().rsplit(')', 1)[1].split()
+            except (OSError, IndexError):
+                continue
+            ticks += sum(int(value) for value in fields[11:15])
+            rss += int(fields[21]) * PAGE_SIZE
+        self.peak_rss = max(self.peak_rss, rss)
+        self.cpu_ticks = max(self.cpu_ticks, ticks)
+
+    def finish(self) -> ResourceUsage:
+        """What the process used; call once it has exited, or if it never started"""
+        usage = ResourceUsage(
+            processes=1 if self.pid is not None else 0,
+            peak_rss_bytes=self.peak_rss,
+            cpu_seconds=self.cpu_ticks / CLOCK_TICKS,
+            wall_seconds=time.monotonic() - self.started_at,
+        )
+        if self.cgroup:
+            usage.source = 'cgroup'
+            usage.peak_rss_bytes = self._read_cgroup_int('memory.peak') or 0
+            cpu = self._read_cgroup_stat('cpu.stat').get('usage_usec', 0)
+            usage.cpu_seconds = cpu / 1_000_000
+            try:
+                os.rmdir(self.cgroup)
+            except OSError:
+                pass  # a straggler is still inside; the empty directory it leaves is harmless
+        return usage
+
+    def _create_cgroup(self) -> Optional[str]:
+        path = os.path.join(settings.ANALYSIS_CGROUP, f'job-{uuid.uuid4().hex[:12]}')
+        try:
+            os.mkdir(path)
+            if settings.ANALYSIS_MEMORY_LIMIT_MB:
+                with open(os.path.join(path, 'memory.max'), 'w') as f:
+                    f.write(str(settings.ANALYSIS_MEMORY_LIMIT_MB * 1024 * 1024))
+            return path
+        except OSError as e:
+            logger.warning(f"Could not create a cgroup under {settings.ANALYSIS_CGROUP}: {e}")
+            try:
+                os.rmdir(path)
+            except OSError:
+                pass
+            return None
+
+    def _read_cgroup_int(self, name: str) -> Optional[int]:
+        try:
+            with open(os.path.join(self.cgroup, name)) as f:
+                return int(f.read().strip())
+        except (OSError, ValueError):
+            return None
+
+    def _read_cgroup_stat(self, name: str) -> Dict[str, int]:
+        try:
+            with open(os.path.join(self.cgroup, name)) as f:
+                return {key: int(value) for key, value in (line.split() for line in f if line.strip())}
+        except (OSError, ValueError):
+            return {}
+
+_local = threading.local()
+
+@contextmanager
+def collect_usage():
+    """Add up the ResourceUsage of every limited subprocess this thread runs inside the block"""
+    previous = getattr(_local, 'usage', None)
+    _local.usage = usage = ResourceUsage()
+    try:
+        yield usage
+    finally:
+        _local.usage = previous
+        if previous is not None:
+            previous.add(usage)
+
+def record_usage(usage: ResourceUsage):
+    collector = getattr(_local, 'usage', None)
+    if collector is not None:
+        collector.add(usage)
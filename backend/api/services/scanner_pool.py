@@ -0,0 +1,174 @@
+import os
+import shutil
+import subprocess
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+from django.conf import settings
+from loguru import logger
+from api.services.cancellation import communicate, sleep, start_process
+from api.services.resource_limits import collect_usage
+
+try:
+    import fcntl
+except ImportError:  # Windows: slots only bound scans within this process
+    fcntl = None
+
+# Keep only the end of scanner output; the JVM can be very chatty
+OUTPUT_TAIL_CHARS = 4000
+
+class ScannerQueueTimeout(Exception):
+    """Raised when no scanner slot frees up in time"""
+
+@dataclass
+class ScanResult:
+    """Outcome of one sonar-scanner run"""
+    returncode: Optional[int]
+    output: str
+    queue_wait_seconds: float
+    scan_seconds: float
+    timed_out: bool = False
+    peak_rss_mb: Optional[float] = None
+    cpu_seconds: Optional[float] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.returncode == 0 and not self.timed_out
+
+    def timings(self) -> Dict:
+        return {
+            "queue_wait_seconds": round(self.queue_wait_seconds, 2),
+            "scan_seconds": round(self.scan_seconds, 2),
+            "timed_out": self.timed_out,
+            "peak_rss_mb": self.peak_rss_mb,
+            "cpu_seconds": self.cpu_seconds
+        }
+
+def find_scanner() -> Optional[str]:
+    """Resolve SONAR_SCANNER_PATH, which may be a bare command name on PATH"""
+    path = settings.SONAR_SCANNER_PATH
+    if os.path.isfile(path):
+        return path
+    return shutil.which(path)
+
+def total_memory_mb() -> Optional[int]:
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') // (1024 * 1024)
+    except (AttributeError, ValueError, OSError):
+        return None
+
+def default_worker_count() -> int:
+    """As many scans as the CPUs and the memory budget both allow, and at least one"""
+    cpus = os.cpu_count() or 1
+    budget = settings.SONAR_SCANNER_MEMORY_BUDGET_MB
+    if not budget:
+        total = total_memory_mb()
+        # Leave half the host to SonarQube itself, Django and the page cache
+        budget = total // 2 if total else settings.SONAR_SCANNER_HEAP_MB
+    return max(1, min(cpus, budget // settings.SONAR_SCANNER_HEAP_MB))
+
+class ScannerPool:
+    """Runs sonar-scanner with a bounded number of JVMs per host.
+
+    Each running scan holds one of `size` slot files under
+    ANALYSIS_LOCK_DIR with an exclusive flock, so the bound covers every
+    worker process, and a crashed worker frees its slot automatically.
+    Callers queue until a slot frees up. Every JVM gets a fixed heap
+    (SONAR_SCANNER_HEAP_MB), which is what the pool size is budgeted
+    against. It runs in its own process group, so a timeout or a cancelled
+    analysis kills the JVM and anything it spawned, not just the wrapper
+    script.
+    """
+
+    def __init__(self, size: Optional[int] = None, scanner: Optional[str] = None):
+        self.size = size or settings.SONAR_SCANNER_WORKERS or default_worker_count()
+        self.scanner = scanner
+        self._local_slots = [False] * self.size
+        self._local_lock = threading.Lock()
+
+    def run(
+        self,
+        args: List[str],
+        cwd: str,
+        timeout: Optional[float] = None,
+        queue_timeout: Optional[float] = None
+    ) -> ScanResult:
+        """Wait for a slot, then run the scanner with args in cwd"""
+        scanner = self.scanner or find_scanner()
+        if not scanner:
+            raise FileNotFoundError(f"sonar-scanner not found at {settings.SONAR_SCANNER_PATH}")
+        timeout = settings.SONAR_SCANNER_TIMEOUT if timeout is None else timeout
+        queue_timeout = settings.SONAR_SCANNER_QUEUE_TIMEOUT if queue_timeout is None else queue_timeout
+
+        queued_at = time.monotonic()
+        slot = self._acquire_slot(queue_timeout)
+        queue_wait = time.monotonic() - queued_at
+        if queue_wait > 1:
+            logger.info(f"Scan waited {queue_wait:.1f}s for a scanner slot")
+        try:
+            started_at = time.monotonic()
+            with collect_usage() as usage:
+                returncode, output, timed_out = self._execute([scanner] + args, cwd, timeout)
+            usage = usage.to_json()
+            return ScanResult(
+                returncode=returncode,
+                output=output[-OUTPUT_TAIL_CHARS:],
+                queue_wait_seconds=queue_wait,
+                scan_seconds=time.monotonic() - started_at,
+                timed_out=timed_out,
+                peak_rss_mb=usage['peak_rss_mb'],
+                cpu_seconds=usage['cpu_seconds']
+            )
+        finally:
+            self._release_slot(slot)
+
+    def _execute(self, cmd: List[str], cwd: str, timeout: float):
+        env = os.environ.copy()
+        env['SONAR_SCANNER_OPTS'] = f"{env.get('SONAR_SCANNER_OPTS', '')} -Xmx{settings.SONAR_SCANNER_HEAP_MB}m".strip()
+        # One persistent home keeps the downloaded JRE, plugins and analyzers warm across scans
+        env['SONAR_USER_HOME'] = settings.SONAR_USER_HOME
+        process, limiter = start_process(
+            cmd, cwd=cwd, env=env, text=True,
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT
+        )
+        # Kills the scanner and the JVM it started on timeout or cancellation
+        output, _, timed_out = communicate(process, limiter, timeout)
+        if timed_out:
+            logger.error(f"sonar-scanner exceeded {timeout}s in {cwd}; killed it")
+        return process.returncode, output or '', timed_out
+
+    def _acquire_slot(self, queue_timeout: float):
+        deadline = time.monotonic() + queue_timeout
+        os.makedirs(settings.ANALYSIS_LOCK_DIR, exist_ok=True)
+        while True:
+            for index in range(self.size):
+                slot = self._try_slot(index)
+                if slot is not None:
+                    return slot
+            if time.monotonic() >= deadline:
+                raise ScannerQueueTimeout(f"No sonar-scanner slot free after {queue_timeout}s")
+            sleep(1)
+
+    def _try_slot(self, index: int):
+        if fcntl is None:
+            with self._local_lock:
+                if self._local_slots[index]:
+                    return None
+                self._local_slots[index] = True
+                return index
+        lock_file = open(os.path.join(settings.ANALYSIS_LOCK_DIR, f"scanner-slot-{index}.lock"), 'a+')
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return lock_file
+        except BlockingIOError:
+            lock_file.close()
+            return None
+
+    def _release_slot(self, slot):
+        if fcntl is None:
+            self._local_slots[slot] = False
+        else:
+            slot.close()  # drops the flock
+
+scanner_pool = ScannerPool()
@@ -0,0 +1,102 @@
+import hashlib
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional
+from django.conf import settings
+from loguru import logger
+
+try:
+    import fcntl
+except ImportError:  # Windows: locks only coordinate threads of this process
+    fcntl = None
+
+class LockTimeout(Exception):
+    """Raised when a repository lock cannot be taken in time"""
+
+class _Call:
+    """One in-flight execution that other callers can wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+class SingleFlight:
+    """Collapses concurrent calls with the same key into one execution.
+
+    The first caller for a key runs the function. Callers that arrive while
+    it is running block and receive the same result, or the same
+    exception. Nothing is cached once the call finishes.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls: Dict[str, _Call] = {}
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = _Call()
+
+        if not leader:
+            logger.info(f"Joining in-flight call for {key}")
+            call.done.wait()
+            if call.error:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                self.calls.pop(key, None)
+            call.done.set()
+
+_thread_locks: Dict[str, threading.Lock] = {}
+_thread_locks_guard = threading.Lock()
+
+@contextmanager
+def repository_lock(name: str, timeout: Optional[float] = None):
+    """Exclusive lock on a repository shared by every worker process on the host.
+
+    Backed by flock on a file under ANALYSIS_LOCK_DIR, so a crashed holder
+    releases it automatically. Threads of one process are serialised with
+    an ordinary lock first, because flock does not exclude them from each
+    other reliably.
+    """
+    timeout = settings.ANALYSIS_LOCK_TIMEOUT if timeout is None else timeout
+    digest = hashlib.sha1(name.encode()).hexdigest()
+    with _thread_locks_guard:
+        thread_lock = _thread_locks.setdefault(digest, threading.Lock())
+
+    deadline = time.monotonic() + timeout
+    if not thread_lock.acquire(timeout=timeout):
+        raise LockTimeout(f"Timed out waiting for the lock on {name}")
+    try:
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(settings.ANALYSIS_LOCK_DIR, exist_ok=True)
+        with open(os.path.join(settings.ANALYSIS_LOCK_DIR, f"{digest}.lock"), 'a+') as lock_file:
+            while True:
+                try:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    if time.monotonic() >= deadline:
+                        raise LockTimeout(f"Timed out waiting for the lock on {name}")
+                    time.sleep(0.5)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+    finally:
+        thread_lock.release()
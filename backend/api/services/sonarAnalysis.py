@@ -7,6 +7,15 @@ from loguru import logger
 from dataclasses import dataclass
 from typing import List, Dict, Optional
 from dotenv import load_dotenv
+from api.services.cancellation import check_cancelled, request_timeout, sleep
+from api.services.checkpoints import StageAbandoned
+from api.services.scanner_pool import ScanResult, ScannerQueueTimeout, scanner_pool
+
+# Seconds per SonarQube API call, further capped by the current stage's deadline
+SONAR_REQUEST_TIMEOUT = 30
+
+class SonarTaskFailed(StageAbandoned):
+    """Raised when the scan's compute-engine task ended FAILED or CANCELED; only a new scan can help"""
 
 @dataclass
 class SonarQubeAnalysis:
@@ -19,15 +28,43 @@ class SonarQubeAnalysis:
     security_hotspots: int
     issues: List[Dict]
 
+def sonar_list(values: List[str]) -> str:
+    """A multi-valued sonar property; entries with commas or quotes are CSV-quoted as SonarQube expects"""
+    return ','.join(
+        '"' + value.replace('"', '""') + '"' if ',' in value or '"' in value else value
+        for value in values
+    )
+
+def escape_property(value: str) -> str:
+    """value escaped for a Java .properties file, where a backslash starts an escape"""
+    return value.replace('\\', '\\\\')
+
 class SonarAnalyzer:
     def __init__(self, sonar_token: str, sonar_host: str = "http://localhost:9000"):
         self.sonar_token = sonar_token
         self.sonar_host = sonar_host
         self.headers = {"Authorization": f"Bearer {sonar_token}"}
         self.repo_path = None
+        self.last_scan: Optional[ScanResult] = None
+        self.progress = None
+
+    def analyze_repository(
+        self, repo_path: str, project_key: str, progress=None, sources: Optional[List[str]] = None
+    ) -> Optional[Dict]:
+        """Run SonarQube analysis on a repository, reporting the scan, issues and hotspots stages to progress.
 
-    def analyze_repository(self, repo_path: str, project_key: str) -> Optional[Dict]:
-        """Run SonarQube analysis on a repository"""
+        sources limits the scan to those directories of the repository.
+        """
+        scan = self.run_scanner(repo_path, project_key, progress, sources)
+        if scan is None:
+            return None
+        return self.collect_results(repo_path, project_key, scan, progress)
+
+    def run_scanner(
+        self, repo_path: str, project_key: str, progress=None, sources: Optional[List[str]] = None
+    ) -> Optional[Dict]:
+        """Run sonar-scanner; returns the compute-engine task it queued and the scanner's timings"""
+        self.progress = progress
         try:
             # Ensure repo_path is absolute
             repo_path = str(Path(repo_path).resolve())
@@ -35,23 +72,66 @@ class SonarAnalyzer:
             logger.info(f"Running SonarQube analysis on: {repo_path}")
 
             # Run SonarQube scanner
-            scanner_result = self._run_sonar_scanner(repo_path, project_key)
+            self._stage('start', 'scan')
+            scanner_result = self._run_sonar_scanner(repo_path, project_key, sources)
             if scanner_result == False:
                 logger.error("SonarQube scanner failed")
+                self._stage('fail', 'scan', "SonarQube scanner failed")
                 return None
+            return {
+                "task_id": self._read_task_id(repo_path),
+                "timings": self.last_scan.timings() if self.last_scan else None,
+            }
+
+        except Exception as e:
+            logger.error(f"Error in SonarQube analysis: {str(e)}")
+            return None
+
+    def collect_results(self, repo_path: str, project_key: str, scan: Dict, progress=None) -> Optional[Dict]:
+        """Wait for SonarQube to process a finished scan, then fetch its metrics, issues and hotspots.
 
-            if not self._wait_for_analysis_completion(project_key):
+        Raises SonarTaskFailed if SonarQube gave up on the scan's task.
+        """
+        self.progress = progress
+        try:
+            self.repo_path = str(Path(repo_path).resolve())
+            if not self._wait_for_analysis_completion(project_key, task_id=scan.get("task_id")):
                 logger.error("Analysis completion check failed or timed out")
+                self._stage('fail', 'scan', "SonarQube did not finish processing the analysis")
                 return None
-            
-            # Wait for analysis to complete and fetch results
-            return self._fetch_analysis_results(project_key)
+            self._stage('finish', 'scan', scan.get("timings"))
 
+            # Wait for analysis to complete and fetch results
+            self._stage('start', 'issues')
+            results = self._fetch_analysis_results(project_key)
+            if results is None:
+                self._stage('fail', 'issues', "Could not fetch SonarQube results")
+            if results is not None and scan.get("timings"):
+                results["scanner"] = scan["timings"]
+            return results
+
+        except SonarTaskFailed as e:
+            logger.error(str(e))
+            self._stage('fail', 'scan', str(e))
+            raise
         except Exception as e:
             logger.error(f"Error in SonarQube analysis: {str(e)}")
             return None
-    
-    def _wait_for_analysis_completion(self, project_key: str, timeout: int = 300, interval: int = 10) -> bool:
+
+    def _read_task_id(self, repo_path: str) -> Optional[str]:
+        """The compute-engine task id the scanner leaves in .scannerwork/report-task.txt"""
+        try:
+            with open(Path(repo_path) / ".scannerwork" / "report-task.txt") as f:
+                for line in f:
+                    if line.startswith("ceTaskId="):
+                        return line.split("=", 1)[1].strip()
+        except OSError:
+            pass
+        return None
+
+    def _wait_for_analysis_completion(
+        self, project_key: str, timeout: int = 300, interval: int = 10, task_id: Optional[str] = None
+    ) -> bool:
         """
         Wait for SonarQube analysis to complete.
         
@@ -59,16 +139,34 @@ class SonarAnalyzer:
             project_key: The project key to check
             timeout: Maximum time to wait in seconds (default: 5 minutes)
             interval: Time between checks in seconds (default: 10 seconds)
+            task_id: The scan's compute-engine task, polled directly when known
         """
         try:
             start_time = time.time()
             while (time.time() - start_time) < timeout:
+                if task_id:
+                    response = requests.get(
+                        f"{self.sonar_host}/api/ce/task",
+                        headers=self.headers,
+                        params={"id": task_id},
+                        timeout=request_timeout(SONAR_REQUEST_TIMEOUT)
+                    )
+                    response.raise_for_status()
+                    task_status = response.json().get('task', {}).get('status')
+                    if task_status == 'SUCCESS':
+                        return True
+                    if task_status in ('FAILED', 'CANCELED'):
+                        raise SonarTaskFailed(f"SonarQube task {task_id} ended with {task_status}")
+                    sleep(interval)
+                    continue
+
                 # Check analysis status
                 status_url = f"{self.sonar_host}/api/ce/component"
                 response = requests.get(
                     status_url,
                     headers={"Authorization": f"Bearer squ_1016c1e9e0ddc97d2a3064825f1203b5293d444a"},
-                    params={"component": project_key}
+                    params={"component": project_key},
+                    timeout=request_timeout(SONAR_REQUEST_TIMEOUT)
                 )
                 response.raise_for_status()
                 
@@ -85,24 +183,30 @@ class SonarAnalyzer:
                         params={
                             "component": project_key,
                             "metricKeys": "bugs"
-                        }
+                        },
+                        timeout=request_timeout(SONAR_REQUEST_TIMEOUT)
                     )
                     
                     if metrics_response.status_code == 200:
                         return True
+                sleep(interval)
+            return False
+        except SonarTaskFailed:
+            raise
         except Exception as e:
             logger.error(f"Error checking analysis completion: {str(e)}")
             return False
 
-    def _run_sonar_scanner(self, repo_path: str, project_key: str) -> bool:
+    def _run_sonar_scanner(self, repo_path: str, project_key: str, sources: Optional[List[str]] = None) -> bool:
         """Run SonarQube scanner on the repository"""
+        sources = sonar_list(sources) if sources else '.'
         try:
             # Prepare sonar-project.properties
             properties_file = Path(repo_path) / "sonar-project.properties"
             with open(properties_file, "w") as f:
                 f.write(f"""
 sonar.projectKey={project_key}
-sonar.sources=.
+sonar.sources={escape_property(sources)}
 sonar.host.url={self.sonar_host}
 sonar.token={self.sonar_token}
 sonar.python.version=3
@@ -110,25 +214,33 @@ sonar.sourceEncoding=UTF-8
 sonar.exclusions=**/*.pyc,**/__pycache__/**,**/tests/**,**/.git/**
                 """.strip())
 
-            # Run scanner
-            SONAR_SCANNER_PATH = r"D:\My Folder\University\FYP\sonarqube-25.1.0.102122\sonar-scanner-6.2.1.4610-windows-x64\bin\sonar-scanner.bat"
-
-            cmd = [
-                SONAR_SCANNER_PATH,
+            # Run scanner through the shared pool, which bounds concurrent JVMs
+            args = [
                 f"-Dsonar.projectKey={project_key}",
-                "-Dsonar.sources=.",
+                f"-Dsonar.sources={sources}",
                 f"-Dsonar.host.url={self.sonar_host}",
                 f"-Dsonar.token={self.sonar_token}"
             ]
-            result = subprocess.run(cmd, capture_output=True, text=True, cwd=repo_path)
+            result = scanner_pool.run(args, cwd=repo_path)
+            self.last_scan = result
+            logger.info(
+                f"sonar-scanner for {project_key}: queued {result.queue_wait_seconds:.1f}s, "
+                f"ran {result.scan_seconds:.1f}s"
+            )
 
+            if result.timed_out:
+                logger.error(f"SonarQube scanner timed out after {result.scan_seconds:.0f}s")
+                return False
             if result.returncode != 0:
-                logger.error(f"SonarQube scanner failed: {result.stderr}")
+                logger.error(f"SonarQube scanner failed: {result.output}")
                 return False
 
             logger.info("SonarQube analysis completed successfully")
             return True
 
+        except ScannerQueueTimeout as e:
+            logger.error(f"SonarQube scanner not started: {str(e)}")
+            return False
         except Exception as e:
             logger.error(f"Error running SonarQube scanner: {str(e)}")
             return False
@@ -150,7 +262,8 @@ sonar.exclusions=**/*.pyc,**/__pycache__/**,**/tests/**,**/.git/**
             metrics_response = requests.get(
                 metrics_url, 
                 headers={"Authorization": f"Bearer squ_1016c1e9e0ddc97d2a3064825f1203b5293d444a"},
-                params=metrics_params
+                params=metrics_params,
+                timeout=request_timeout(SONAR_REQUEST_TIMEOUT)
             )
             metrics_response.raise_for_status()
             
@@ -172,7 +285,8 @@ sonar.exclusions=**/*.pyc,**/__pycache__/**,**/tests/**,**/.git/**
             issues_response = requests.get(
                 issues_url,
                 headers={"Authorization": f"Bearer squ_1016c1e9e0ddc97d2a3064825f1203b5293d444a"},
-                params=issues_params
+                params=issues_params,
+                timeout=request_timeout(SONAR_REQUEST_TIMEOUT)
             )
             issues_response.raise_for_status()
             
@@ -181,6 +295,7 @@ sonar.exclusions=**/*.pyc,**/__pycache__/**,**/tests/**,**/.git/**
             # Extract relevant issue details
             extracted_issues = []
             for issue in issues_data:
+                check_cancelled()
                 component_path = issue.get("component", "").split(":")[-1]  # Extract relative file path
                 text_range = issue.get("textRange", {})
                 rule_key = issue.get("rule")
@@ -203,8 +318,15 @@ sonar.exclusions=**/*.pyc,**/__pycache__/**,**/tests/**,**/.git/**
                     "root_cause": rule_details.get("root_cause")
                 })
 
+            self._stage('finish', 'issues', {
+                "metrics": {key: measures.get(key) for key in ("bugs", "vulnerabilities", "code_smells", "security_hotspots")},
+                "issue_count": len(extracted_issues)
+            })
+
             # Fetch security hotspots
+            self._stage('start', 'hotspots')
             security_hotspots = self._fetch_security_hotspots(project_key)
+            self._stage('finish', 'hotspots', {"count": len(security_hotspots)})
 
             
 
@@ -228,6 +350,16 @@ sonar.exclusions=**/*.pyc,**/__pycache__/**,**/tests/**,**/.git/**
             logger.error(f"Error fetching SonarQube results: {str(e)}")
             return None
     
+    def _stage(self, action: str, stage: str, detail=None):
+        if not self.progress:
+            return
+        if action == 'start':
+            self.progress.start(stage)
+        elif action == 'finish':
+            self.progress.finish(stage, detail)
+        else:
+            self.progress.fail(stage, detail)
+
     def _convert_rating(self, rating: float) -> str:
         """Convert SonarQube rating from number to letter grade"""
         rating_map = {
@@ -245,12 +377,13 @@ sonar.exclusions=**/*.pyc,**/__pycache__/**,**/tests/**,**/.git/**
             hotspots_url = f"{self.sonar_host}/api/hotspots/search"
             params = {"projectKey": project_key}
             
-            response = requests.get(hotspots_url, headers={"Authorization": f"Bearer squ_1016c1e9e0ddc97d2a3064825f1203b5293d444a"}, params=params)
+            response = requests.get(hotspots_url, headers={"Authorization": f"Bearer squ_1016c1e9e0ddc97d2a3064825f1203b5293d444a"}, params=params, timeout=request_timeout(SONAR_REQUEST_TIMEOUT))
             response.raise_for_status()
             hotspots_data = response.json().get("hotspots", [])
             detailed_hotspots = []
 
             for hotspot in hotspots_data:
+                check_cancelled()
                 hotspot_key = hotspot.get("key")
                 component_path = hotspot.get("component", "").split(":")[-1]  # Extract relative file path
                 text_range = hotspot.get("textRange", {})
@@ -285,7 +418,7 @@ sonar.exclusions=**/*.pyc,**/__pycache__/**,**/tests/**,**/.git/**
         """Fetches detailed hotspot details from SonarQube API."""
         try:
             hotspot_url = f"{self.sonar_host}/api/hotspots/show?hotspot={hotspot_key}"
-            response = requests.get(hotspot_url, headers={"Authorization": f"Bearer squ_1016c1e9e0ddc97d2a3064825f1203b5293d444a"})
+            response = requests.get(hotspot_url, headers={"Authorization": f"Bearer squ_1016c1e9e0ddc97d2a3064825f1203b5293d444a"}, timeout=request_timeout(SONAR_REQUEST_TIMEOUT))
             response.raise_for_status()
             hotspot_data = response.json().get("rule", {})
             return {
@@ -300,7 +433,7 @@ sonar.exclusions=**/*.pyc,**/__pycache__/**,**/tests/**,**/.git/**
         """Fetches rule details including introduction and root cause."""
         try:
             rule_url = f"{self.sonar_host}/api/rules/show?key={rule_key}"
-            rule_response = requests.get(rule_url, headers={"Authorization": f"Bearer squ_1016c1e9e0ddc97d2a3064825f1203b5293d444a"})
+            rule_response = requests.get(rule_url, headers={"Authorization": f"Bearer squ_1016c1e9e0ddc97d2a3064825f1203b5293d444a"}, timeout=request_timeout(SONAR_REQUEST_TIMEOUT))
             rule_response.raise_for_status()
             rule_data = rule_response.json().get("rule", {}).get("descriptionSections", [])
             details = {"introduction": None, "root_cause": None}
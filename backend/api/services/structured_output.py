@@ -0,0 +1,183 @@
+import json
+import re
+import threading
+from typing import Dict, Optional
+from loguru import logger
+
+# Field name -> expected type; lists are lists of strings
+REVIEW_SCHEMA = {'name': str, 'description': str, 'technologies': list}
+FILE_SUMMARY_SCHEMA = {'purpose': str, 'components': list, 'description': str}
+
+FENCE = re.compile(r'```[a-zA-Z0-9_-]*\s*\n?(.*?)```', re.DOTALL)
+# What may follow a comma for it to be a trailing one: blanks and comments, then a closing bracket
+TRAILING_COMMA = re.compile(r'(?:\s|//[^\n]*|/\*.*?\*/)*[}\]]', re.DOTALL)
+BLOCK_COMMENT_END = re.compile(r'\*/')
+BARE_WORD = re.compile(r'[A-Za-z_][A-Za-z0-9_]*')
+SMART_QUOTES = str.maketrans({'“': '"', '”': '"', '‘': "'", '’': "'"})
+PYTHON_LITERALS = {'True': 'true', 'False': 'false', 'None': 'null'}
+
+class StructuredOutputError(Exception):
+    """Raised when model output holds no object that fits the expected schema"""
+
+def strip_fences(text: str) -> str:
+    """The body of the first Markdown code fence, or the text itself if there is none"""
+    match = FENCE.search(text)
+    return match.group(1) if match else text
+
+def extract_object(text: str) -> Optional[str]:
+    """The first balanced {...} in text, ignoring brackets inside strings"""
+    start = text.find('{')
+    if start == -1:
+        return None
+    closers, in_string, escaped = [], False, False
+    for index in range(start, len(text)):
+        char = text[index]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in '{[':
+            closers.append('}' if char == '{' else ']')
+        elif char in '}]' and closers:
+            closers.pop()
+            if not closers:
+                return text[start:index + 1]
+    # Unbalanced: the output was probably cut off, so close what is still open
+    return text[start:].rstrip() + ('"' if in_string else '') + ''.join(reversed(closers))
+
+def repair_json(text: str) -> str:
+    """Fix the mistakes models make most: smart quotes, comments, trailing commas, Python literals, raw newlines.
+
+    One pass that tracks whether it is inside a string, so only raw
+    newlines are touched there; a "True" or a "//" or a ", ]" that is part
+    of a value stays as it is.
+    """
+    text = text.translate(SMART_QUOTES)
+    result, index, in_string, escaped = [], 0, False, False
+    while index < len(text):
+        char = text[index]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == '"':
+                in_string = False
+            elif char == '\n':
+                char = '\\n'
+            result.append(char)
+            index += 1
+        elif char == '"':
+            in_string = True
+            result.append(char)
+            index += 1
+        elif text.startswith('//', index):
+            end = text.find('\n', index)
+            index = len(text) if end == -1 else end
+        elif text.startswith('/*', index):
+            end = BLOCK_COMMENT_END.search(text, index + 2)
+            index = len(text) if end is None else end.end()
+        elif char == ',' and TRAILING_COMMA.match(text, index + 1):
+            index += 1
+        elif char.isalpha() or char == '_':
+            word = BARE_WORD.match(text, index).group()
+            result.append(PYTHON_LITERALS.get(word, word))
+            index += len(word)
+        else:
+            result.append(char)
+            index += 1
+    return ''.join(result)
+
+def validate(data, schema: Dict[str, type]) -> Dict:
+    """The schema's fields, each present and of the right type, coercing where it is obvious"""
+    if not isinstance(data, dict):
+        raise StructuredOutputError(f"Expected a JSON object, got {type(data).__name__}")
+    # Models like to capitalise keys ("Name", "Technologies Used")
+    by_key = {re.sub(r'[^a-z]', '', str(key).lower()): value for key, value in data.items()}
+    validated = {}
+    for field, expected in schema.items():
+        value = data.get(field, by_key.get(field))
+        if value is None:
+            value = next((v for key, v in by_key.items() if key.startswith(field) or key.endswith(field)), None)
+        if value is None:
+            raise StructuredOutputError(f"Missing field '{field}'")
+        if expected is list:
+            if isinstance(value, str):
+                value = [item.strip() for item in value.split(',') if item.strip()]
+            if not isinstance(value, list):
+                raise StructuredOutputError(f"Field '{field}' should be a list")
+            value = [item if isinstance(item, str) else json.dumps(item) for item in value]
+        elif expected is str:
+            if isinstance(value, list):
+                value = ' '.join(str(item) for item in value)
+            if not isinstance(value, str):
+                raise StructuredOutputError(f"Field '{field}' should be a string")
+        validated[field] = value
+    return validated
+
+class ParseStats:
+    """How often model output needed repair or could not be parsed at all, per kind of output"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts: Dict[str, Dict[str, int]] = {}
+
+    def record(self, kind: str, outcome: str):
+        with self.lock:
+            counts = self.counts.setdefault(kind, {'parsed': 0, 'repaired': 0, 'failed': 0})
+            counts[outcome] += 1
+            total = sum(counts.values())
+            failure_rate = counts['failed'] / total
+        if outcome != 'parsed':
+            logger.info(
+                f"{kind} output {outcome}; {counts['repaired']} repaired and "
+                f"{counts['failed']} failed of {total} ({failure_rate:.1%} failure rate)"
+            )
+
+    def snapshot(self) -> Dict[str, Dict]:
+        with self.lock:
+            return {
+                kind: {**counts, 'failure_rate': counts['failed'] / max(1, sum(counts.values()))}
+                for kind, counts in self.counts.items()
+            }
+
+parse_stats = ParseStats()
+
+def parse_structured(text: str, schema: Dict[str, type], kind: str = 'review') -> Dict:
+    """The JSON object in a model's output, validated against schema.
+
+    Tries the text as-is first, then the first fenced block's balanced
+    object, then that object after lenient repair, then the balanced object
+    of the repaired block. Raises
+    StructuredOutputError when none of them fits the schema.
+    """
+    if not text or not text.strip():
+        parse_stats.record(kind, 'failed')
+        raise StructuredOutputError("Empty output")
+
+    error = None
+    body = strip_fences(text.replace('\n---\n', ''))
+    candidate = extract_object(body)
+    attempts = [('parsed', text.strip())]
+    if candidate:
+        attempts += [('repaired', candidate), ('repaired', repair_json(candidate))]
+        # Brackets inside comments throw off extract_object, so also repair first
+        repaired = extract_object(repair_json(body[body.find('{'):]))
+        if repaired:
+            attempts.append(('repaired', repaired))
+    for outcome, attempt in attempts:
+        try:
+            result = validate(json.loads(attempt), schema)
+        except (json.JSONDecodeError, StructuredOutputError) as e:
+            error = e
+            continue
+        parse_stats.record(kind, outcome)
+        return result
+
+    parse_stats.record(kind, 'failed')
+    raise StructuredOutputError(str(error))
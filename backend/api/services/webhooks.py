@@ -0,0 +1,69 @@
+import hashlib
+import hmac
+import operator
+from functools import reduce
+from typing import Dict, List, Optional
+from django.conf import settings
+from django.db.models import Q
+from loguru import logger
+from api.models import AnalysisJob, LinkedRepository
+from api.services.analysis_runner import normalize_repo_url, submit_analysis
+from api.services.refresh_scheduler import analyzed_mode
+
+NULL_SHA = '0' * 40
+
+def sign_payload(secret: str, body: bytes) -> str:
+    return 'sha256=' + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+def verify_signature(secret: str, body: bytes, signature: Optional[str]) -> bool:
+    """Check GitHub's X-Hub-Signature-256 header in constant time"""
+    if not secret or not signature:
+        return False
+    return hmac.compare_digest(sign_payload(secret, body), signature)
+
+def linked_repositories_for(payload: Dict) -> List[LinkedRepository]:
+    repository = payload.get('repository') or {}
+    full_name = repository.get('full_name') or ''
+    urls = {normalize_repo_url(url) for url in (repository.get('html_url'), repository.get('clone_url')) if url}
+    # GitHub URLs are case-insensitive, and a linked URL may end in .git or /
+    matches = [Q(repo_url__iexact=url + suffix) for url in urls for suffix in ('', '.git', '/')]
+    if full_name:
+        matches.append(Q(repo_name__iexact=full_name))
+    if not matches:
+        return []
+    return list(LinkedRepository.objects.filter(reduce(operator.or_, matches)))
+
+def handle_push(payload: Dict, on_complete=None) -> Dict:
+    """Queue analysis of the pushed commit for the linked repositories of a push to the default branch.
+
+    The jobs become ready after WEBHOOK_COALESCE_SECONDS. A push that
+    arrives while they wait moves them to its commit and restarts the
+    wait. Coalescing happens in the job table, so it holds across web
+    processes and restarts.
+    """
+    repository = payload.get('repository') or {}
+    default_ref = f"refs/heads/{repository.get('default_branch')}"
+    if payload.get('ref') != default_ref:
+        return {'status': 'ignored', 'reason': 'Not the default branch'}
+    if payload.get('deleted') or payload.get('after', NULL_SHA) == NULL_SHA:
+        return {'status': 'ignored', 'reason': 'Branch deleted'}
+
+    linked = linked_repositories_for(payload)
+    if not linked:
+        return {'status': 'ignored', 'reason': 'Repository is not linked'}
+
+    # A job still waiting for one of these repositories takes the new head
+    # and waits the full window again, so a burst of pushes is analyzed once
+    coalesced = AnalysisJob.objects.filter(repository__in=linked, status='queued').exists()
+    after = payload['after']
+    logger.info(
+        f"Push to {repository.get('full_name')} "
+        f"{payload.get('before', NULL_SHA)[:7]}..{after[:7]}; analyzing {len(linked)} linked repositories "
+        f"in {settings.WEBHOOK_COALESCE_SECONDS:.0f}s"
+    )
+    for linked_repository in linked:
+        submit_analysis(
+            linked_repository, analyzed_mode(linked_repository), on_complete=on_complete,
+            commit=after, delay=settings.WEBHOOK_COALESCE_SECONDS
+        )
+    return {'status': 'coalesced' if coalesced else 'queued', 'repositories': len(linked), 'commit': after}
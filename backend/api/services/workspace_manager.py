@@ -0,0 +1,372 @@
+import json
+import os
+import re
+import shutil
+import stat
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+from django.conf import settings
+from loguru import logger
+from api.services.repo_reader import cat_file_pool, find_git_dir
+from api.services.single_flight import LockTimeout, repository_lock
+
+try:
+    import fcntl
+except ImportError:  # Windows: pins only protect workspaces within this process
+    fcntl = None
+
+STAGING_DIR = '.staging'
+LOCK_SUFFIX = '.lock'
+
+@dataclass
+class Workspace:
+    """A pinned working tree for one commit of one repository"""
+    owner: str
+    repo: str
+    commit: str
+    path: str
+    lock_path: str
+    lock_file: Optional[object] = None
+
+def safe_name(name: str) -> str:
+    """Make an owner or repository name safe to use as a single path component"""
+    name = re.sub(r'[^A-Za-z0-9._-]', '_', name or '')
+    return name if name.strip('.') else '_'
+
+def split_repo_url(repo_url: str) -> Tuple[str, str]:
+    """Return (owner, repo) for a GitHub style URL or owner/repo full name"""
+    parts = repo_url.rstrip('/').removesuffix('.git').split('/')
+    return (parts[-2] if len(parts) > 1 else '_'), parts[-1]
+
+def remove_tree(path: str):
+    """Delete a directory tree, including read-only files git leaves behind"""
+    def handle_remove_readonly(func, target, exc):
+        os.chmod(target, stat.S_IRWXU)
+        func(target)
+    shutil.rmtree(path, onerror=handle_remove_readonly)
+
+class WorkspaceManager:
+    """Owns every working tree under CLONED_REPOS_DIR.
+
+    Workspaces live at <root>/<owner>/<repo>/<commit>, next to a
+    <commit>.lock file. The lock file's mtime is the workspace's last use
+    and its content records the measured size. A workspace is pinned
+    while someone holds a shared flock on its lock file, and eviction only
+    deletes workspaces it can lock exclusively. Pins are released
+    automatically when the process holding them dies. New clones are built
+    in <root>/.staging and renamed into place, so a half-written clone is
+    never visible under its final name.
+    """
+
+    _gc_done = False
+    _gc_lock = threading.Lock()
+
+    def __init__(self, root: Optional[str] = None, quota_bytes: Optional[int] = None):
+        self.root = os.path.realpath(root or settings.CLONED_REPOS_DIR)
+        self.quota_bytes = settings.WORKSPACE_QUOTA_BYTES if quota_bytes is None else quota_bytes
+        self._local_pins: Dict[str, int] = {}
+        self._local_lock = threading.Lock()
+
+    def path_for(self, owner: str, repo: str, commit: str) -> str:
+        return os.path.join(self.root, safe_name(owner), safe_name(repo), safe_name(commit))
+
+    def acquire(self, owner: str, repo: str, commit: str) -> Optional[Workspace]:
+        """Pin and return the existing workspace for a commit, or None if there is none"""
+        path = self.path_for(owner, repo, commit)
+        lock_path = path + LOCK_SUFFIX
+        if not os.path.exists(lock_path):
+            return None
+        workspace = Workspace(owner, repo, commit, path, lock_path)
+        self._pin(workspace)
+        # The workspace may have been evicted between the exists() and the lock
+        if not os.path.isdir(path) or not self._lock_is_current(workspace):
+            self.release(workspace, measure=False)
+            return None
+        self.touch(path)
+        return workspace
+
+    def create(
+        self,
+        owner: str,
+        repo: str,
+        populate: Callable[[str], str],
+        moved: Optional[Callable[[str], None]] = None
+    ) -> Workspace:
+        """Build a new workspace and return it pinned.
+
+        populate(dest) must fill dest (e.g. clone into it) and return the
+        commit SHA it checked out. moved(path), if given, is called once the
+        workspace has been renamed to its final path. If another worker
+        finished the same commit first, the fresh copy is discarded and
+        theirs is used.
+        """
+        self.collect_garbage_once()
+        self.enforce_quota()
+
+        staging = os.path.join(self.root, STAGING_DIR, uuid.uuid4().hex)
+        os.makedirs(os.path.dirname(staging), exist_ok=True)
+        try:
+            commit = populate(staging)
+            existing = self.acquire(owner, repo, commit)
+            if existing:
+                return existing
+
+            path = self.path_for(owner, repo, commit)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            workspace = Workspace(owner, repo, commit, path, path + LOCK_SUFFIX)
+            # Pin before the workspace becomes visible so eviction cannot take it
+            self._pin(workspace)
+            try:
+                os.rename(staging, path)
+            except OSError:
+                self.release(workspace, measure=False)
+                existing = self.acquire(owner, repo, commit)
+                if existing:
+                    return existing
+                raise
+            if moved:
+                moved(path)
+            self.touch(path)
+            logger.info(f"Created workspace {path}")
+            return workspace
+        finally:
+            if os.path.exists(staging):
+                remove_tree(staging)
+
+    def release(self, workspace: Workspace, measure: bool = True):
+        """Unpin a workspace, recording its size first so quota checks stay cheap"""
+        if measure and os.path.isdir(workspace.path):
+            self._write_meta(workspace.lock_path, {'size': self._measure(workspace.path)})
+        self._unpin(workspace)
+        if measure:
+            self.enforce_quota()
+
+    def discard(self, workspace: Workspace) -> bool:
+        """Unpin a workspace and delete it, unless someone else still has it pinned"""
+        self._unpin(workspace)
+        return self._evict(workspace.lock_path, workspace.path)
+
+    def find(self, owner: str, repo: str, commit: Optional[str] = None) -> Optional[str]:
+        """Path of the workspace for a commit, or the most recently used one for the repository"""
+        if commit:
+            path = self.path_for(owner, repo, commit)
+            if os.path.isdir(path):
+                self.touch(path)
+                return path
+            return None
+        candidates = [w for w in self._scan() if (w[0], w[1]) == (safe_name(owner), safe_name(repo))]
+        if not candidates:
+            return None
+        path = max(candidates, key=lambda w: w[4])[3]
+        self.touch(path)
+        return path
+
+    def workspaces_for(self, owner: str, repo: str) -> List[str]:
+        repo_dir = os.path.join(self.root, safe_name(owner), safe_name(repo))
+        if not os.path.isdir(repo_dir):
+            return []
+        return [
+            os.path.join(repo_dir, name) for name in os.listdir(repo_dir)
+            if os.path.isdir(os.path.join(repo_dir, name))
+        ]
+
+    def remove_repository(self, owner: str, repo: str):
+        """Delete every workspace of a repository that nobody is using"""
+        for path in self.workspaces_for(owner, repo):
+            self._evict(path + LOCK_SUFFIX, path)
+        repo_dir = os.path.join(self.root, safe_name(owner), safe_name(repo))
+        for directory in (repo_dir, os.path.dirname(repo_dir)):
+            try:
+                os.rmdir(directory)
+            except OSError:
+                break
+
+    def touch(self, path: str):
+        try:
+            os.utime(path + LOCK_SUFFIX)
+        except OSError:
+            pass
+
+    def enforce_quota(self):
+        """Evict least recently used, unpinned workspaces until usage fits the quota"""
+        if not self.quota_bytes:
+            return
+        workspaces = sorted(self._scan(), key=lambda w: w[4])
+        total = sum(w[5] for w in workspaces)
+        for owner, repo, commit, path, last_used, size in workspaces:
+            if total <= self.quota_bytes:
+                break
+            if self._evict(path + LOCK_SUFFIX, path):
+                logger.info(f"Evicted workspace {path} ({size} bytes)")
+                total -= size
+        if total > self.quota_bytes:
+            logger.warning(f"Workspaces use {total} bytes, over the {self.quota_bytes} byte quota; the rest are pinned")
+
+    def collect_garbage_once(self):
+        """Garbage-collect once per process, the first time anyone needs it.
+
+        Skipped while another process on the host is collecting, so a fleet
+        of workers starting together does not scan the same tree at once.
+        """
+        with WorkspaceManager._gc_lock:
+            if WorkspaceManager._gc_done:
+                return
+            WorkspaceManager._gc_done = True
+        try:
+            with repository_lock(f"workspace-gc:{self.root}", timeout=0):
+                self.collect_garbage()
+        except LockTimeout:
+            logger.debug("Workspace garbage collection is already running in another process")
+
+    def collect_garbage(self):
+        """Remove leftovers that no workspace owns.
+
+        That is staging directories of crashed clones, workspace directories
+        without a lock file (never finished), and lock files whose directory
+        is gone. Pre-workspace checkouts directly under the root are left alone.
+        """
+        if not os.path.isdir(self.root):
+            return
+        staging_root = os.path.join(self.root, STAGING_DIR)
+        if os.path.isdir(staging_root):
+            cutoff = time.time() - settings.WORKSPACE_STAGING_MAX_AGE
+            for name in os.listdir(staging_root):
+                path = os.path.join(staging_root, name)
+                # Fresh staging dirs may belong to a clone that is still running
+                if os.path.getmtime(path) < cutoff:
+                    logger.info(f"Removing abandoned staging directory {path}")
+                    remove_tree(path)
+
+        for owner in os.listdir(self.root):
+            owner_dir = os.path.join(self.root, owner)
+            if owner == STAGING_DIR or not os.path.isdir(owner_dir):
+                continue
+            if os.path.isdir(os.path.join(owner_dir, '.git')):
+                continue  # checkout from before workspaces existed
+            for repo in os.listdir(owner_dir):
+                repo_dir = os.path.join(owner_dir, repo)
+                if not os.path.isdir(repo_dir):
+                    continue
+                for name in os.listdir(repo_dir):
+                    path = os.path.join(repo_dir, name)
+                    if name.endswith(LOCK_SUFFIX):
+                        if not os.path.isdir(path[:-len(LOCK_SUFFIX)]):
+                            self._evict(path, None)
+                    elif os.path.isdir(path) and not os.path.exists(path + LOCK_SUFFIX):
+                        logger.info(f"Removing orphaned workspace {path}")
+                        remove_tree(path)
+
+    def _scan(self):
+        """Yield (owner, repo, commit, path, last_used, size) for every workspace"""
+        if not os.path.isdir(self.root):
+            return
+        for owner in os.listdir(self.root):
+            owner_dir = os.path.join(self.root, owner)
+            if owner == STAGING_DIR or not os.path.isdir(owner_dir):
+                continue
+            if os.path.isdir(os.path.join(owner_dir, '.git')):
+                continue
+            for repo in os.listdir(owner_dir):
+                repo_dir = os.path.join(owner_dir, repo)
+                if not os.path.isdir(repo_dir):
+                    continue
+                for name in os.listdir(repo_dir):
+                    if not name.endswith(LOCK_SUFFIX):
+                        continue
+                    lock_path = os.path.join(repo_dir, name)
+                    path = lock_path[:-len(LOCK_SUFFIX)]
+                    if not os.path.isdir(path):
+                        continue
+                    try:
+                        last_used = os.path.getmtime(lock_path)
+                    except OSError:
+                        continue
+                    size = self._read_meta(lock_path).get('size', 0)
+                    yield owner, repo, name[:-len(LOCK_SUFFIX)], path, last_used, size
+
+    def _pin(self, workspace: Workspace):
+        with self._local_lock:
+            self._local_pins[workspace.path] = self._local_pins.get(workspace.path, 0) + 1
+        workspace.lock_file = open(workspace.lock_path, 'a+')
+        if fcntl:
+            fcntl.flock(workspace.lock_file.fileno(), fcntl.LOCK_SH)
+
+    def _unpin(self, workspace: Workspace):
+        if workspace.lock_file:
+            workspace.lock_file.close()  # drops the flock
+            workspace.lock_file = None
+        with self._local_lock:
+            count = self._local_pins.get(workspace.path, 0) - 1
+            if count > 0:
+                self._local_pins[workspace.path] = count
+            else:
+                self._local_pins.pop(workspace.path, None)
+
+    def _lock_is_current(self, workspace: Workspace) -> bool:
+        try:
+            return os.path.samestat(os.fstat(workspace.lock_file.fileno()), os.stat(workspace.lock_path))
+        except OSError:
+            return False
+
+    def _evict(self, lock_path: str, path: Optional[str]) -> bool:
+        """Delete a workspace if nobody has it pinned; returns whether it was deleted"""
+        if path and self._local_pins.get(path):
+            return False
+        try:
+            lock_file = open(lock_path, 'a+')
+        except OSError:
+            return False
+        try:
+            if fcntl:
+                try:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    return False
+            if path and os.path.isdir(path):
+                self._remove_checkout(path)
+            os.unlink(lock_path)
+            return True
+        except OSError as e:
+            logger.warning(f"Failed to evict {path or lock_path}: {e}")
+            return False
+        finally:
+            lock_file.close()
+
+    def _remove_checkout(self, path: str):
+        """Delete a workspace, the cat-file processes reading it and, for a worktree, its entry in the mirror"""
+        git_dir = find_git_dir(path)
+        if git_dir:
+            cat_file_pool.discard(git_dir)
+        remove_tree(path)
+        # What `git worktree remove` does, without waiting for the mirror's next prune
+        if git_dir and os.path.basename(os.path.dirname(git_dir)) == 'worktrees':
+            remove_tree(git_dir)
+
+    def _measure(self, path: str) -> int:
+        total = 0
+        for dirpath, _, filenames in os.walk(path):
+            for filename in filenames:
+                try:
+                    total += os.lstat(os.path.join(dirpath, filename)).st_size
+                except OSError:
+                    pass
+        return total
+
+    def _read_meta(self, lock_path: str) -> Dict:
+        try:
+            with open(lock_path) as f:
+                return json.loads(f.read() or '{}')
+        except (OSError, ValueError):
+            return {}
+
+    def _write_meta(self, lock_path: str, meta: Dict):
+        # Rewrite in place: replacing the file would orphan the flocks held on it
+        with open(lock_path, 'r+') as f:
+            f.seek(0)
+            f.truncate()
+            f.write(json.dumps(meta))
+
+workspace_manager = WorkspaceManager()
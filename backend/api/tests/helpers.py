@@ -0,0 +1,56 @@
+import os
+import shutil
+import subprocess
+import tempfile
+from unittest import mock
+from django.test import TestCase
+from rest_framework.test import APIClient
+from api.models import CandidateProfile, LinkedRepository, User
+from api.services.repo_reader import get_repo_reader
+
+def make_candidate(username: str = 'candidate') -> CandidateProfile:
+    user = User.objects.create_user(username=username, password='secret', role='candidate')
+    return CandidateProfile.objects.create(user=user, github_username=username)
+
+def make_repository(candidate: CandidateProfile, name: str = 'octo/project', **fields) -> LinkedRepository:
+    return LinkedRepository.objects.create(
+        candidate=candidate, repo_name=name, repo_url=f'https://github.com/{name}', **fields
+    )
+
+def make_git_repo(files: dict) -> str:
+    """A committed git repository in a new temporary directory, holding files (path -> bytes)"""
+    repo_dir = tempfile.mkdtemp(prefix='api-tests-')
+    for path, content in files.items():
+        full_path = os.path.join(repo_dir, path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with open(full_path, 'wb') as f:
+            f.write(content)
+    def git(*args):
+        subprocess.run(['git', '-C', repo_dir, *args], check=True, capture_output=True)
+    git('init', '-q')
+    git('add', '-A')
+    git('-c', 'user.name=Test', '-c', 'user.email=test@example.com', 'commit', '-q', '-m', 'Initial commit')
+    return repo_dir
+
+class RepositoryFilesTestCase(TestCase):
+    """Browsing endpoints of a linked repository whose files are FILES, committed to a real git repository"""
+    FILES: dict = {}
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.repo_dir = make_git_repo(cls.FILES)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.repo_dir, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        candidate = make_candidate()
+        self.repository = make_repository(candidate)
+        self.client = APIClient()
+        self.client.force_authenticate(candidate.user)
+        patcher = mock.patch('api.views.get_repository_reader', return_value=get_repo_reader(self.repo_dir))
+        patcher.start()
+        self.addCleanup(patcher.stop)
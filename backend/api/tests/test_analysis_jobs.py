@@ -0,0 +1,238 @@
+from datetime import timedelta
+from unittest import mock
+from django.db.models import QuerySet
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from api.models import AnalysisJob
+from api.services.analysis_jobs import AnalysisWorker, enqueue, ready_jobs, requeue_expired
+from api.tests.helpers import make_candidate, make_repository
+
+@override_settings(
+    ANALYSIS_JOB_LEASE_SECONDS=120, ANALYSIS_JOB_HEARTBEAT_SECONDS=30,
+    ANALYSIS_JOB_RETRY_DELAY_SECONDS=10, ANALYSIS_JOB_MAX_ATTEMPTS=2
+)
+@mock.patch.object(AnalysisWorker, '_start_heartbeat')
+class LeaseTests(TestCase):
+    def setUp(self):
+        self.repository = make_repository(make_candidate())
+
+    def expire(self, job):
+        AnalysisJob.objects.filter(id=job.id).update(lease_expires_at=timezone.now() - timedelta(seconds=1))
+
+    def test_claim_leases_the_job_to_one_worker(self, _):
+        enqueue(self.repository, 'quick')
+        first, second = AnalysisWorker('first'), AnalysisWorker('second')
+
+        job = first.claim()
+        self.assertEqual(job.status, 'running')
+        self.assertEqual(job.worker, 'first')
+        self.assertEqual(job.attempts, 1)
+        self.assertGreater(job.lease_expires_at, timezone.now())
+        self.assertIsNone(second.claim())
+
+    def test_enqueue_reuses_the_waiting_job(self, _):
+        job = enqueue(self.repository, 'quick', commit='a' * 40)
+        again = enqueue(self.repository, 'full', commit='b' * 40, delay=60)
+
+        self.assertEqual(job.id, again.id)
+        job.refresh_from_db()
+        self.assertEqual((job.mode, job.commit), ('full', 'b' * 40))
+        self.assertFalse(ready_jobs().exists())
+
+    def test_push_during_a_claim_queues_a_new_job(self, _):
+        job = enqueue(self.repository, 'quick', commit='a' * 40, delay=30)
+        AnalysisJob.objects.filter(id=job.id).update(available_at=timezone.now())
+        worker = AnalysisWorker('first')
+        first = QuerySet.first
+
+        def claimed_after_the_lookup(queryset):
+            found = first(queryset)
+            if found is not None and not worker.held:
+                worker.claim()
+            return found
+
+        with mock.patch.object(QuerySet, 'first', claimed_after_the_lookup):
+            again = enqueue(self.repository, 'quick', commit='b' * 40, delay=30)
+
+        self.assertNotEqual(again.id, job.id)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.commit), ('running', 'a' * 40))
+        queued = AnalysisJob.objects.get(repository=self.repository, status='queued')
+        self.assertEqual(queued.commit, 'b' * 40)
+        self.assertGreater(queued.available_at, timezone.now())
+
+    def test_racing_enqueues_share_one_job(self, _):
+        job = enqueue(self.repository, 'quick', commit='a' * 40)
+        first = QuerySet.first
+        lookups = []
+
+        def missed_by_the_first_lookup(queryset):
+            lookups.append(queryset)
+            return None if len(lookups) == 1 else first(queryset)
+
+        with mock.patch.object(QuerySet, 'first', missed_by_the_first_lookup):
+            again = enqueue(self.repository, 'full', commit='b' * 40)
+
+        self.assertEqual(again.id, job.id)
+        self.assertEqual(again.commit, 'b' * 40)
+        self.assertEqual(AnalysisJob.objects.filter(repository=self.repository).count(), 1)
+
+    def test_running_job_holds_back_the_next_one(self, _):
+        enqueue(self.repository, 'quick')
+        AnalysisWorker('first').claim()
+        enqueue(self.repository, 'full')
+
+        self.assertIsNone(AnalysisWorker('second').claim())
+
+    def test_expired_lease_is_requeued_after_a_heartbeat(self, _):
+        enqueue(self.repository, 'quick')
+        job = AnalysisWorker('first').claim()
+        self.expire(job)
+
+        self.assertEqual(requeue_expired(), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'queued')
+        self.assertEqual(job.worker, '')
+        # The retry delay (10s) is shorter than a heartbeat, so the heartbeat wins
+        self.assertGreaterEqual(job.available_at, timezone.now() + timedelta(seconds=29))
+        self.assertIn('first', job.last_error)
+
+        AnalysisJob.objects.filter(id=job.id).update(available_at=timezone.now())
+        claimed = AnalysisWorker('second').claim()
+        self.assertEqual((claimed.id, claimed.attempts), (job.id, 2))
+
+    def test_expired_job_gives_way_to_a_newer_queued_one(self, _):
+        enqueue(self.repository, 'quick', commit='a' * 40)
+        job = AnalysisWorker('first').claim()
+        newer = enqueue(self.repository, 'quick', commit='b' * 40)
+        self.expire(job)
+
+        self.assertEqual(requeue_expired(), 0)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'cancelled')
+        self.assertIn('superseded', job.last_error)
+        self.assertEqual(AnalysisJob.objects.get(status='queued').id, newer.id)
+
+    def test_job_fails_after_max_attempts(self, _):
+        enqueue(self.repository, 'quick')
+        job = AnalysisWorker('first').claim()
+        AnalysisJob.objects.filter(id=job.id).update(attempts=2)
+        self.expire(job)
+
+        self.assertEqual(requeue_expired(), 0)
+        job.refresh_from_db()
+        self.repository.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+        self.assertEqual(self.repository.analysis_status, 'failed')
+
+    def test_lost_lease_cancels_the_run(self, _):
+        enqueue(self.repository, 'quick')
+        worker = AnalysisWorker('first')
+        job = worker.claim()
+        self.expire(job)
+        requeue_expired()
+
+        with mock.patch('api.services.analysis_runner.cancel_run') as cancel_run:
+            worker.heartbeat()
+        cancel_run.assert_called_once_with(self.repository.id, mock.ANY)
+        self.assertEqual(worker.held, {})
+
+    def test_heartbeat_renews_the_lease(self, _):
+        enqueue(self.repository, 'quick')
+        worker = AnalysisWorker('first')
+        job = worker.claim()
+        AnalysisJob.objects.filter(id=job.id).update(lease_expires_at=timezone.now() + timedelta(seconds=5))
+
+        worker.heartbeat()
+        job.refresh_from_db()
+        self.assertGreater(job.lease_expires_at, timezone.now() + timedelta(seconds=100))
+
+    def test_execute_records_the_outcome(self, _):
+        enqueue(self.repository, 'quick', commit='c' * 40)
+        worker = AnalysisWorker('first')
+        job = worker.claim()
+
+        with mock.patch('api.services.analysis_runner.run_analysis', return_value={'ok': True}) as run_analysis:
+            worker.execute(job)
+        self.assertEqual(run_analysis.call_args.args[1:3], ('quick', 'c' * 40))
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'complete')
+        self.assertEqual(worker.held, {})
+
+    def test_results_are_dropped_once_the_lease_is_lost(self, _):
+        from api.services import analysis_runner
+
+        enqueue(self.repository, 'quick')
+        job = AnalysisWorker('first').claim()
+        self.expire(job)
+        requeue_expired()
+        lease = AnalysisJob.objects.filter(id=job.id, worker='first', status='running')
+
+        with mock.patch.object(analysis_runner, 'analyze_repository_url', return_value={'code_quality': {}}):
+            result = analysis_runner.run_analysis(self.repository, 'quick', lease=lease)
+        self.assertEqual(result.error, 'Analysis Cancelled')
+        self.repository.refresh_from_db()
+        self.assertEqual(self.repository.analysis_results, {})
+
+@mock.patch.object(AnalysisWorker, '_start_heartbeat')
+@mock.patch('api.services.analysis_runner.prewarm_assessment')
+class AnalyzeNowTests(TestCase):
+    def setUp(self):
+        self.repository = make_repository(make_candidate())
+
+    def test_inline_analysis_runs_as_a_leased_job(self, *_):
+        from api.services import analysis_runner
+
+        def analyze(*args, **kwargs):
+            job = AnalysisJob.objects.get(repository=self.repository)
+            self.assertEqual(job.status, 'running')
+            self.assertIsNotNone(job.lease_expires_at)
+            return {'code_quality': {'metrics': {'bugs': 0}}}
+
+        with mock.patch.object(analysis_runner, 'analyze_repository_url', side_effect=analyze):
+            result = analysis_runner.analyze_now(self.repository, 'quick')
+        self.assertEqual(result, {'code_quality': {'metrics': {'bugs': 0}}})
+        self.assertEqual(AnalysisJob.objects.get(repository=self.repository).status, 'complete')
+        self.repository.refresh_from_db()
+        self.assertEqual(self.repository.analysis_status, 'complete')
+
+    def test_crashed_inline_analysis_fails_the_job_and_the_repository(self, *_):
+        from api.services import analysis_runner
+
+        with mock.patch.object(analysis_runner, 'analyze_repository_url', side_effect=RuntimeError('boom')):
+            result = analysis_runner.analyze_now(self.repository, 'quick')
+        self.assertEqual((result.error, result.details), ('Analysis Failed', 'boom'))
+        job = AnalysisJob.objects.get(repository=self.repository)
+        self.assertEqual((job.status, job.last_error), ('failed', 'boom'))
+        self.repository.refresh_from_db()
+        self.assertEqual(self.repository.analysis_status, 'failed')
+
+    def test_waits_for_a_job_another_worker_took(self, *_):
+        from api.services import analysis_runner
+
+        other = AnalysisWorker('other')
+
+        def enqueue_then_lose_it(*args):
+            job = enqueue(*args)
+            other.claim()
+            return job
+
+        def other_worker_fails(seconds):
+            AnalysisJob.objects.filter(worker='other').update(status='failed', last_error='Stage Timed Out: plan')
+
+        with mock.patch.object(analysis_runner, 'enqueue', side_effect=enqueue_then_lose_it), \
+                mock.patch.object(analysis_runner.time, 'sleep', side_effect=other_worker_fails) as sleep, \
+                mock.patch.object(analysis_runner, 'analyze_repository_url') as analyze:
+            result = analysis_runner.analyze_now(self.repository, 'quick')
+        self.assertEqual(sleep.call_count, 1)
+        analyze.assert_not_called()
+        self.assertEqual((result.error, result.details), ('Stage Timed Out', 'plan'))
+
+    def test_delayed_job_is_run_at_once(self, *_):
+        from api.services import analysis_runner
+
+        delayed = enqueue(self.repository, 'quick', delay=600)
+        with mock.patch.object(analysis_runner, 'analyze_repository_url', return_value={'code_quality': {}}):
+            analysis_runner.analyze_now(self.repository, 'full')
+        delayed.refresh_from_db()
+        self.assertEqual((delayed.status, delayed.mode), ('complete', 'full'))
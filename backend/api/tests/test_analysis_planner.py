@@ -0,0 +1,73 @@
+from django.test import SimpleTestCase, override_settings
+from api.services.analysis_planner import AnalysisPlanner, is_checked_out, sample_files, scope_directories
+
+@override_settings(
+    ANALYSIS_PLAN_INGEST_MAX_FILES=10, ANALYSIS_PLAN_INGEST_MAX_BYTES=10_000,
+    ANALYSIS_PLAN_INGEST_MAX_FILE_BYTES=2_000, ANALYSIS_PLAN_SCAN_MAX_FILES=40,
+    ANALYSIS_PLAN_SCAN_MAX_BYTES=100_000
+)
+class PlanTests(SimpleTestCase):
+    def plan(self, files):
+        return AnalysisPlanner(github=object()).plan(files, source='checkout')
+
+    def test_small_repository_is_analyzed_in_full(self):
+        plan = self.plan([('README.md', 500), ('app.py', 1_000), ('node_modules/lib/index.js', 500_000)])
+        self.assertEqual(plan.strategy, 'full')
+        self.assertIsNone(plan.ingest_paths)
+        self.assertIsNone(plan.scan_paths)
+        # Sparse-excluded paths are never checked out, so they do not count
+        self.assertEqual(plan.file_count, 2)
+
+    def test_too_much_text_is_sampled(self):
+        files = [('README.md', 500), ('package.json', 300)] + [(f'src/module_{n}.py', 1_500) for n in range(20)]
+        files += [('tests/test_app.py', 100), ('src/deep/nested/util.py', 100), ('docs/big.py', 5_000)]
+        plan = self.plan(files)
+
+        self.assertEqual(plan.strategy, 'sampled')
+        self.assertIsNone(plan.scan_paths)
+        # Manifests come first
+        self.assertEqual(set(plan.ingest_paths[:2]), {'README.md', 'package.json'})
+        self.assertLessEqual(len(plan.ingest_paths), 10)
+        self.assertNotIn('tests/test_app.py', plan.ingest_paths)
+        self.assertNotIn('docs/big.py', plan.ingest_paths)
+        self.assertEqual(plan.languages, {'Python': 20 * 1_500 + 100 + 100 + 5_000})
+
+    def test_too_much_source_is_scoped_to_the_largest_directories(self):
+        files = [('README.md', 500)]
+        files += [(f'packages/api/src/file_{n}.py', 2_500) for n in range(30)]
+        files += [(f'packages/web/src/file_{n}.ts', 1_000) for n in range(20)]
+        files += [(f'packages/docs/file_{n}.py', 500) for n in range(5)]
+        plan = self.plan(files)
+
+        self.assertEqual(plan.strategy, 'scoped')
+        # Whole packages that fit, then single files of the one that does not
+        self.assertEqual(plan.scan_paths[:2], ['packages/api', 'packages/docs'])
+        self.assertTrue(all(path.startswith('packages/web/src/') for path in plan.scan_paths[2:]))
+        scanned = sum(size for path, size in files if any(
+            path == entry or path.startswith(entry + '/') for entry in plan.scan_paths
+        ))
+        self.assertLessEqual(scanned, 100_000)
+        # The AI summary only sees what is scanned, plus the root manifest
+        self.assertTrue(all(
+            path == 'README.md' or any(path == entry or path.startswith(entry + '/') for entry in plan.scan_paths)
+            for path in plan.ingest_paths
+        ))
+
+class HelperTests(SimpleTestCase):
+    def test_is_checked_out(self):
+        self.assertTrue(is_checked_out('src/app.py'))
+        self.assertFalse(is_checked_out('node_modules/pkg/index.js'))
+        self.assertFalse(is_checked_out('.github/workflows/ci.py'))
+        self.assertFalse(is_checked_out('static/app.min.js'))
+
+    def test_scope_splits_directories_that_do_not_fit(self):
+        files = [('big/a/x.py', 50), ('big/b/y.py', 30), ('small/z.py', 20)]
+        self.assertEqual(scope_directories(files, max_bytes=75, max_files=10), ['big/a', 'small'])
+
+    def test_scope_walks_into_a_wrapper_directory(self):
+        files = [('src/a/x.py', 60), ('src/b/y.py', 30), ('setup.py', 10)]
+        self.assertEqual(scope_directories(files, max_bytes=70, max_files=10), ['src/a'])
+
+    def test_sample_respects_the_byte_budget(self):
+        files = [('README.md', 50), ('a.py', 60), ('b.py', 40)]
+        self.assertEqual(sample_files(files, None, 'Python', 10, 100, 1_000), ['README.md', 'b.py'])
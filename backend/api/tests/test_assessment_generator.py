@@ -0,0 +1,52 @@
+from django.test import SimpleTestCase
+from api.services.assessment_generator import AssessmentGenerator
+
+def raw(**fields):
+    return {
+        'question': 'Which database does the project use?',
+        'options': ['A) SQLite', 'B) PostgreSQL', 'C) MySQL', 'D) MongoDB'],
+        'correct_answer': 0,
+        'explanation': 'settings.py configures SQLite.',
+        **fields,
+    }
+
+class RepairQuestionTests(SimpleTestCase):
+    def setUp(self):
+        self.generator = AssessmentGenerator(huggingface_token='')
+
+    def test_valid_question_is_normalised(self):
+        repaired = self.generator._repair_question(raw(question='  Which database does the project use?  '))
+        self.assertEqual(repaired, {
+            'question': 'Which database does the project use?',
+            'options': ['A) SQLite', 'B) PostgreSQL', 'C) MySQL', 'D) MongoDB'],
+            'correct_answer': 0,
+            'explanation': 'settings.py configures SQLite.',
+            'topic': 'project',
+        })
+
+    def test_answer_forms(self):
+        for answer in (1, 1.0, '1', 'B', 'b)', 'Option B', 'PostgreSQL', 'B) PostgreSQL'):
+            with self.subTest(answer=answer):
+                self.assertEqual(self.generator._repair_question(raw(correct_answer=answer))['correct_answer'], 1)
+
+    def test_options_as_a_mapping(self):
+        options = {'B': 'PostgreSQL', 'A': 'SQLite', 'D': 'MongoDB', 'C': 'MySQL'}
+        repaired = self.generator._repair_question(raw(options=options, text='Which database?', question=None))
+        self.assertEqual(repaired['options'], ['A) SQLite', 'B) PostgreSQL', 'C) MySQL', 'D) MongoDB'])
+        self.assertEqual(repaired['question'], 'Which database?')
+
+    def test_unusable_questions_are_dropped(self):
+        for broken in (
+            'not a dict',
+            raw(question=''),
+            raw(explanation=None),
+            raw(options=['A) SQLite', 'B) PostgreSQL', 'C) MySQL']),
+            raw(options=['A) SQLite', 'B) sqlite', 'C) MySQL', 'D) MongoDB']),
+            raw(options=['A) SQLite', 'B) ', 'C) MySQL', 'D) MongoDB']),
+            raw(correct_answer=4),
+            raw(correct_answer=True),
+            raw(correct_answer='E'),
+            raw(correct_answer=None),
+        ):
+            with self.subTest(question=broken):
+                self.assertIsNone(self.generator._repair_question(broken))
@@ -0,0 +1,103 @@
+import subprocess
+import threading
+import time
+from unittest import mock
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+from api.models import AnalysisJob
+from api.services.analysis_jobs import AnalysisWorker, enqueue
+from api.services.cancellation import (
+    AnalysisCancelled, CancelToken, activate, check_cancelled, communicate, start_process
+)
+from api.tests.helpers import make_candidate, make_repository
+
+class CancelTokenTests(TestCase):
+    def setUp(self):
+        self.repository = make_repository(make_candidate(), analysis_status='analyzing')
+
+    def test_run_is_cancelled_once_nobody_waits_for_it(self):
+        token = CancelToken(lambda: [self.repository.id])
+        token.poll()
+        self.assertFalse(token.cancelled)
+
+        self.repository.analysis_status = 'cancelled'
+        self.repository.save()
+        token.poll()
+        self.assertTrue(token.cancelled)
+        with self.assertRaises(AnalysisCancelled):
+            token.check()
+
+    @override_settings(ANALYSIS_STAGE_TIMEOUTS={'clone': 0.01})
+    def test_stage_deadline(self):
+        token = CancelToken()
+        token.begin_stage('clone')
+        time.sleep(0.02)
+        with self.assertRaisesMessage(AnalysisCancelled, 'clone'):
+            token.check()
+
+    def test_cancel_kills_the_running_process(self):
+        token = CancelToken()
+        process, limiter = start_process(['sleep', '30'], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        threading.Timer(0.2, token.cancel, args=('Stop',)).start()
+        started = time.monotonic()
+        with activate(token), self.assertRaises(AnalysisCancelled):
+            communicate(process, limiter)
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertIsNotNone(process.poll())
+
+class CancelViewTests(TestCase):
+    def setUp(self):
+        self.candidate = make_candidate()
+        self.repository = make_repository(self.candidate)
+        self.client = APIClient()
+        self.client.force_authenticate(self.candidate.user)
+        self.url = reverse('cancel-analysis', args=[self.repository.id])
+
+    @override_settings(ANALYSIS_QUEUE='workers')
+    def test_cancel_drops_the_queued_job(self):
+        job = enqueue(self.repository, 'quick')
+
+        response = self.client.post(self.url)
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['analysis_status'], 'cancelled')
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'cancelled')
+
+    def test_nothing_to_cancel(self):
+        self.assertEqual(self.client.post(self.url).status_code, 409)
+
+    @mock.patch.object(AnalysisWorker, '_start_heartbeat')
+    def test_job_of_a_cancelled_repository_does_not_start(self, _):
+        enqueue(self.repository, 'quick')
+        worker = AnalysisWorker('first')
+        job = worker.claim()
+        self.client.post(self.url)
+
+        with mock.patch('api.services.analysis_runner.run_analysis') as run_analysis:
+            worker.execute(job)
+        run_analysis.assert_not_called()
+        self.assertEqual(AnalysisJob.objects.get(id=job.id).status, 'cancelled')
+
+@override_settings(ANALYSIS_STAGE_TIMEOUTS={'plan': 0.01}, ANALYSIS_QUEUE='workers')
+class StageTimeoutTests(TestCase):
+    def setUp(self):
+        self.repository = make_repository(make_candidate())
+
+    @mock.patch.object(AnalysisWorker, '_start_heartbeat')
+    def test_plan_timeout_fails_the_job_and_the_repository(self, _):
+        def slow_plan(*args, **kwargs):
+            time.sleep(0.05)  # e.g. waiting out a GitHub rate limit
+            check_cancelled()
+
+        enqueue(self.repository, 'quick', commit='a' * 40)
+        worker = AnalysisWorker('first')
+        job = worker.claim()
+        with mock.patch('api.services.analysis_planner.AnalysisPlanner.plan_from_github', slow_plan):
+            worker.execute(job)
+
+        job.refresh_from_db()
+        self.repository.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+        self.assertIn('Stage Timed Out', job.last_error)
+        self.assertEqual(self.repository.analysis_status, 'failed')
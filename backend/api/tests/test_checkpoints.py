@@ -0,0 +1,64 @@
+from django.conf import settings
+from django.test import SimpleTestCase, override_settings
+from api.services.checkpoints import CheckpointStore, StageAbandoned
+from api.services.repo_analyzer import ErrorResponse, RepoAnalyzer
+
+# In memory, so the tests neither read nor leave behind real checkpoints
+CHECKPOINT_CACHES = {
+    alias: {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': f'tests-{alias}'}
+    for alias in settings.CACHES
+}
+
+@override_settings(CACHES=CHECKPOINT_CACHES, ANALYSIS_CHECKPOINT_MAX_BYTES=1024)
+class CheckpointStoreTests(SimpleTestCase):
+    def test_keyed_by_repository_commit_and_mode(self):
+        store = CheckpointStore('https://github.com/Octo/Project.git', 'abc', 'full')
+        store.save('ingest', {'content': 'x'})
+
+        self.assertEqual(CheckpointStore('https://github.com/octo/project/', 'abc', 'full').get('ingest'), {'content': 'x'})
+        self.assertIsNone(CheckpointStore('https://github.com/octo/project', 'def', 'full').get('ingest'))
+        self.assertIsNone(CheckpointStore('https://github.com/octo/project', 'abc', 'quick').get('ingest'))
+
+    def test_large_outputs_are_not_saved(self):
+        store = CheckpointStore('https://github.com/octo/large', 'abc', 'full')
+        store.save('ingest', 'x' * 2048)
+        self.assertIsNone(store.get('ingest'))
+
+    def test_discard_and_clear(self):
+        store = CheckpointStore('https://github.com/octo/cleared', 'abc', 'full')
+        store.save('scan', {'task': 1})
+        store.save('results', {'metrics': {}})
+        store.discard('scan')
+        self.assertIsNone(store.get('scan'))
+        self.assertIsNotNone(store.get('results'))
+        store.clear()
+        self.assertIsNone(store.get('results'))
+
+@override_settings(CACHES=CHECKPOINT_CACHES)
+class StageResumeTests(SimpleTestCase):
+    def analyzer(self) -> RepoAnalyzer:
+        analyzer = RepoAnalyzer(github_token='', huggingface_token='', sonar_token='')
+        analyzer.checkpoints = CheckpointStore('https://github.com/octo/resume', 'abc', 'full')
+        return analyzer
+
+    def test_completed_stage_resumes_from_its_checkpoint(self):
+        self.assertEqual(self.analyzer()._run_stage('ingest', lambda: {'content': 'first run'}), {'content': 'first run'})
+
+        def must_not_run():
+            raise AssertionError('stage ran again')
+        # A new analyzer, as after a worker restart
+        self.assertEqual(self.analyzer()._run_stage('ingest', must_not_run), {'content': 'first run'})
+
+    def test_abandoned_stage_is_not_retried_or_saved(self):
+        analyzer = self.analyzer()
+        calls = []
+
+        def abandon():
+            calls.append(1)
+            raise StageAbandoned('task failed')
+        result = analyzer._run_stage('scan', abandon)
+
+        self.assertIsInstance(result, ErrorResponse)
+        self.assertEqual(result.details, 'task failed')
+        self.assertEqual(len(calls), 1)
+        self.assertIsNone(analyzer.checkpoints.get('scan'))
@@ -0,0 +1,29 @@
+from unittest import mock
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
+from api.models import LinkedRepository
+from api.tests.helpers import make_candidate, make_repository
+
+@mock.patch('api.views.workspace_manager.remove_repository')
+class DeleteRepositoryTests(TestCase):
+    def setUp(self):
+        self.candidate = make_candidate()
+        self.repository = make_repository(self.candidate)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.candidate.user)
+
+    def delete(self):
+        return self.client.delete(reverse('delete-repository', args=[self.repository.id]))
+
+    def test_workspaces_of_a_repository_nobody_else_linked_are_removed(self, remove_repository):
+        self.assertEqual(self.delete().status_code, 204)
+        remove_repository.assert_called_once_with('octo', 'project')
+        self.assertFalse(LinkedRepository.objects.exists())
+
+    def test_workspaces_another_candidate_uses_are_kept(self, remove_repository):
+        other = make_repository(make_candidate('other'), name='Octo/Project')
+
+        self.assertEqual(self.delete().status_code, 204)
+        remove_repository.assert_not_called()
+        self.assertEqual(list(LinkedRepository.objects.all()), [other])
@@ -0,0 +1,143 @@
+from unittest import mock
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+from api.tests.helpers import RepositoryFilesTestCase
+from api.views import line_range_offsets, parse_byte_range
+
+LINES = b''.join(f'line {n}\n'.encode() for n in range(1, 101))
+
+class ParseByteRangeTests(SimpleTestCase):
+    def test_ranges(self):
+        self.assertEqual(parse_byte_range('bytes=0-9', 100), (0, 10))
+        self.assertEqual(parse_byte_range('bytes=90-', 100), (90, 100))
+        self.assertEqual(parse_byte_range('bytes=-10', 100), (90, 100))
+        self.assertEqual(parse_byte_range('bytes=50-500', 100), (50, 100))
+        self.assertEqual(parse_byte_range('bytes=-500', 100), (0, 100))
+
+    def test_unsatisfiable(self):
+        self.assertIsNone(parse_byte_range('bytes=100-', 100))
+        self.assertIsNone(parse_byte_range('bytes=10-5', 100))
+        self.assertIsNone(parse_byte_range('bytes=-0', 100))
+        self.assertIsNone(parse_byte_range('bytes=-5', 0))
+
+    def test_malformed_or_multiple(self):
+        for header in ('items=0-1', 'bytes=0-1,5-6', 'bytes=a-b'):
+            with self.subTest(header=header), self.assertRaises(ValueError):
+                parse_byte_range(header, 100)
+
+class LineRangeOffsetsTests(SimpleTestCase):
+    def offsets(self, start_line, end_line, chunk_size=7, max_bytes=10_000, data=LINES):
+        chunks = [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)]
+        return line_range_offsets(iter(chunks), start_line, end_line, max_bytes)
+
+    def test_lines_across_chunk_boundaries(self):
+        for chunk_size in (1, 7, 4096):
+            with self.subTest(chunk_size=chunk_size):
+                start, end, last = self.offsets(3, 5, chunk_size)
+                self.assertEqual(LINES[start:end], b'line 3\nline 4\nline 5\n')
+                self.assertEqual(last, 5)
+
+    def test_open_ended_and_past_the_end(self):
+        start, end, last = self.offsets(99, None)
+        self.assertEqual((LINES[start:end], last), (b'line 99\nline 100\n', 100))
+        start, end, last = self.offsets(98, 500)
+        self.assertEqual((LINES[start:end], last), (b'line 98\nline 99\nline 100\n', 100))
+        start, end, last = self.offsets(200, None)
+        self.assertEqual((start, end, last), (len(LINES), len(LINES), 199))
+
+    def test_last_line_without_newline(self):
+        start, end, last = self.offsets(2, None, data=b'one\ntwo')
+        self.assertEqual((b'one\ntwo'[start:end], last), (b'two', 2))
+
+    def test_stops_past_max_bytes(self):
+        start, end, _ = self.offsets(1, None, chunk_size=64, max_bytes=100)
+        self.assertEqual(start, 0)
+        self.assertLess(end, len(LINES))
+        self.assertGreater(end, 100)
+
+@override_settings(FILE_CONTENT_MAX_BYTES=1_000)
+class FileContentTests(RepositoryFilesTestCase):
+    FILES = {
+        'lines.txt': LINES,
+        'big.txt': b'x' * 5_000,
+        'binary.dat': b'\x00\x01\x02',
+        'src/app.py': b'print("hello")\n',
+    }
+
+    def content(self, path, **headers):
+        url = reverse('file-content', args=[self.repository.id])
+        return self.client.get(url, {'path': path, **headers.pop('query', {})}, **headers)
+
+    def body(self, response) -> bytes:
+        return b''.join(response.streaming_content)
+
+    def test_whole_file_with_etag(self):
+        response = self.content('src/app.py')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.body(response), b'print("hello")\n')
+        self.assertEqual(response['X-Content-Truncated'], 'false')
+
+        cached = self.content('src/app.py', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+
+    def test_large_file_is_truncated(self):
+        response = self.content('big.txt')
+        self.assertEqual(len(self.body(response)), 1_000)
+        self.assertEqual(response['X-Content-Truncated'], 'true')
+        self.assertEqual(response['X-Content-Total-Size'], '5000')
+
+    def test_byte_range(self):
+        response = self.content('lines.txt', HTTP_RANGE='bytes=0-6')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(self.body(response), b'line 1\n')
+        self.assertEqual(response['Content-Range'], f'bytes 0-6/{len(LINES)}')
+
+        response = self.content('lines.txt', HTTP_RANGE=f'bytes={len(LINES)}-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(LINES)}')
+
+        # Several ranges are not supported, so the whole file is sent
+        self.assertEqual(self.content('lines.txt', HTTP_RANGE='bytes=0-1,4-5').status_code, 200)
+
+    def test_line_range(self):
+        response = self.content('lines.txt', query={'start_line': 10, 'end_line': 12})
+        self.assertEqual(self.body(response), b'line 10\nline 11\nline 12\n')
+        self.assertEqual((response['X-Line-Start'], response['X-Line-End']), ('10', '12'))
+
+        self.assertEqual(self.content('lines.txt', query={'start_line': 5, 'end_line': 2}).status_code, 400)
+        self.assertEqual(self.content('lines.txt', query={'start_line': 'x'}).status_code, 400)
+
+    def test_rejected_paths(self):
+        self.assertEqual(self.content('../etc/passwd').status_code, 400)
+        self.assertEqual(self.content('missing.py').status_code, 404)
+        self.assertEqual(self.content('binary.dat').status_code, 400)
+
+@override_settings(FILE_CONTENT_MAX_BYTES=1_000)
+class FileSummaryTests(RepositoryFilesTestCase):
+    FILES = {
+        'big.txt': b'x' * 5_000,
+        'src/app.py': b'print("hello")\n',
+    }
+
+    def summary(self, path):
+        return self.client.get(reverse('file-summary', args=[self.repository.id]), {'path': path})
+
+    def test_large_file_gets_a_metadata_only_summary(self):
+        with mock.patch('api.services.repo_analyzer.RepoAnalyzer') as analyzer:
+            response = self.summary('big.txt')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['size'], response.data['truncated']), (5_000, True))
+        analyzer.assert_not_called()
+
+    def test_small_file_is_summarized(self):
+        with mock.patch('api.services.repo_analyzer.RepoAnalyzer') as analyzer:
+            analyzer.return_value._generate_ai_review.return_value = {'purpose': 'Greets'}
+            response = self.summary('/src/app.py')
+        self.assertEqual(response.data, {'purpose': 'Greets'})
+        args = analyzer.return_value._generate_ai_review.call_args.args
+        self.assertEqual(args[1:3], ('src/app.py', 'print("hello")\n'))
+
+    def test_rejected_paths(self):
+        self.assertEqual(self.summary('../etc/passwd').status_code, 400)
+        self.assertEqual(self.summary('src/../../secret').status_code, 400)
+        self.assertEqual(self.summary('missing.py').status_code, 404)
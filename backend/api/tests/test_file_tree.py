@@ -0,0 +1,42 @@
+from django.test import override_settings
+from django.urls import reverse
+from api.tests.helpers import RepositoryFilesTestCase
+
+@override_settings(FILE_TREE_PAGE_SIZE=2)
+class FileTreeTests(RepositoryFilesTestCase):
+    FILES = {
+        'README.md': b'# Project\n',
+        'lines.txt': b'one\ntwo\n',
+        'big.txt': b'x' * 5_000,
+        'binary.dat': b'\x00\x01\x02',
+        '.env': b'SECRET=1\n',
+        'src/app.py': b'print("hello")\n',
+        'src/lib/util.py': b'pass\n',
+    }
+
+    def test_file_tree(self):
+        response = self.client.get(reverse('repository-files', args=[self.repository.id]))
+        self.assertEqual(response.status_code, 200)
+        names = [item['name'] for item in response.data]
+        # Directories first, hidden files left out
+        self.assertEqual(names, ['src', 'README.md', 'big.txt', 'binary.dat', 'lines.txt'])
+        src = response.data[0]
+        self.assertEqual([child['name'] for child in src['children']], ['lib', 'app.py'])
+        self.assertEqual(src['children'][1]['size'], len(b'print("hello")\n'))
+        self.assertEqual(src['children'][1]['language'], 'Python')
+
+    def test_directory_listing_pages(self):
+        url = reverse('repository-directory', args=[self.repository.id])
+        first = self.client.get(url).data
+        self.assertEqual([item['name'] for item in first['items']], ['src', 'README.md'])
+        self.assertEqual((first['total'], first['has_more']), (5, True))
+        self.assertEqual(first['items'][0]['child_count'], 2)
+
+        last = self.client.get(url, {'page': 3}).data
+        self.assertEqual([item['name'] for item in last['items']], ['lines.txt'])
+        self.assertFalse(last['has_more'])
+
+        self.assertEqual(self.client.get(url, {'path': 'src/lib'}).data['total'], 1)
+        self.assertEqual(self.client.get(url, {'path': '../'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'path': 'missing'}).status_code, 404)
+        self.assertEqual(self.client.get(url, {'page': 'x'}).status_code, 400)
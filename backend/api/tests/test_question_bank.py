@@ -0,0 +1,84 @@
+import random
+from django.test import SimpleTestCase, TestCase, override_settings
+from api.models import BankedQuestion
+from api.services.question_bank import QuestionBank, shuffle_options, strip_option_prefix
+
+COMMIT = 'c' * 40
+
+def question(text, topic='project', correct=0):
+    return {
+        'text': text,
+        'options': [f'A) {text} one', f'B) {text} two', f'C) {text} three', f'D) {text} four'],
+        'correct_answer': correct,
+        'explanation': f'Option {"ABCD"[correct]} is right.',
+        'topic': topic,
+    }
+
+class ShuffleTests(SimpleTestCase):
+    def test_strip_option_prefix(self):
+        for option in ('A) Django', '(b) Django', 'C. Django', 'd: Django'):
+            self.assertEqual(strip_option_prefix(option), 'Django')
+        self.assertEqual(strip_option_prefix('Django'), 'Django')
+
+    def test_answer_and_explanation_follow_the_options(self):
+        original = {
+            'text': 'Which framework?',
+            'options': ['Flask', 'Django', 'FastAPI', 'Pyramid'],
+            'correct_answer': 1,
+            'explanation': 'Option B: the settings module is Django.',
+        }
+        for seed in range(10):
+            shuffled = shuffle_options(original, random.Random(seed))
+            letter = 'ABCD'[shuffled['correct_answer']]
+            self.assertEqual(shuffled['options'][shuffled['correct_answer']], f'{letter}) Django')
+            self.assertEqual(shuffled['explanation'], f'Option {letter}: the settings module is Django.')
+            self.assertEqual(sorted(strip_option_prefix(o) for o in shuffled['options']), sorted(original['options']))
+
+@override_settings(ASSESSMENT_QUESTION_COUNT=5, ASSESSMENT_BANK_MIN_PROJECT_QUESTIONS=2)
+class DrawTests(TestCase):
+    def setUp(self):
+        self.bank = QuestionBank(random.Random(7))
+
+    def test_store_keeps_each_question_once_per_commit(self):
+        questions = [question('Where is routing?'), question('Which ORM?', topic='django'), question('What is X?', topic='cobol')]
+        self.bank.store(COMMIT, questions, ['Django'])
+        self.bank.store(COMMIT, questions, ['Django'])
+
+        self.assertEqual(BankedQuestion.objects.count(), 3)
+        self.assertEqual(BankedQuestion.objects.get(text='Which ORM?').topic, 'django')
+        # A technology the project does not use is banked as a project question
+        self.assertEqual(BankedQuestion.objects.get(text='What is X?').topic, 'project')
+        self.assertEqual(BankedQuestion.objects.first().options[0], 'Where is routing? one')
+
+    def test_draw_needs_enough_project_questions(self):
+        self.bank.store(COMMIT, [question('Only one')], [])
+        self.bank.store('d' * 40, [question(f'Django {n}', topic='django') for n in range(5)], ['Django'])
+        self.assertIsNone(self.bank.draw(COMMIT, ['Django']))
+        self.assertIsNone(self.bank.draw(None, ['Django']))
+
+    def test_draw_mixes_project_and_technology_questions(self):
+        self.bank.store(COMMIT, [question(f'Project {n}') for n in range(2)], [])
+        self.bank.store('d' * 40, [question(f'Django {n}', topic='django') for n in range(3)], ['Django'])
+
+        drawn = self.bank.draw(COMMIT, ['Django'])
+        self.assertEqual(len(drawn), 5)
+        texts = [q['text'] for q in drawn]
+        self.assertEqual(len(set(texts)), 5)
+        self.assertTrue({'Project 0', 'Project 1'} <= set(texts))
+        self.assertEqual(set(BankedQuestion.objects.values_list('times_served', flat=True)), {1})
+        for drawn_question in drawn:
+            answer = strip_option_prefix(drawn_question['options'][drawn_question['correct_answer']])
+            self.assertEqual(answer, f"{drawn_question['text']} one")
+
+    def test_technology_questions_banked_twice_count_once(self):
+        self.bank.store(COMMIT, [question(f'Project {n}') for n in range(2)], [])
+        shared = [question(f'Django {n}', topic='django') for n in range(2)]
+        self.bank.store('d' * 40, shared, ['Django'])
+        self.bank.store('e' * 40, shared, ['Django'])
+        # Two distinct technology questions are one short of five
+        self.assertIsNone(self.bank.draw(COMMIT, ['Django']))
+
+    @override_settings(ASSESSMENT_QUESTION_COUNT=2, ASSESSMENT_BANK_MIN_PROJECT_QUESTIONS=3)
+    def test_minimum_is_capped_at_the_question_count(self):
+        self.bank.store(COMMIT, [question(f'Project {n}') for n in range(2)], [])
+        self.assertEqual(len(self.bank.draw(COMMIT, [])), 2)
@@ -0,0 +1,149 @@
+import os
+import shutil
+import subprocess
+import tempfile
+from unittest import mock
+from django.test import SimpleTestCase, override_settings
+from api.models import LinkedRepository
+from api.services.git_clone import MirrorCache
+from api.services.repo_reader import (
+    GitObjectReader, WorktreeReader, find_git_dir, get_repo_reader, normalize_repo_path, sparse_excluded
+)
+from api.tests.helpers import make_git_repo
+
+FILES = {
+    'README.md': b'# Project\n',
+    'src/app.py': b'print("hello")\n' * 10_000,
+    'src/lib/util.py': b'def util():\n    return 1\n',
+    'static/logo.png': b'\x89PNG',
+}
+
+class NormalizeRepoPathTests(SimpleTestCase):
+    def test_slashes_are_stripped(self):
+        self.assertEqual(normalize_repo_path('/src/app.py/'), 'src/app.py')
+        self.assertEqual(normalize_repo_path('src\\lib\\util.py'), 'src/lib/util.py')
+        self.assertEqual(normalize_repo_path(''), '')
+        self.assertEqual(normalize_repo_path(None), '')
+
+    def test_traversal_is_rejected(self):
+        for path in ('../etc/passwd', 'src/../../secret', './src', 'src/./app.py', 'src\\..\\..', 'a\nb'):
+            with self.subTest(path=path), self.assertRaises(ValueError):
+                normalize_repo_path(path)
+
+    def test_sparse_excluded(self):
+        self.assertTrue(sparse_excluded('static/logo.png'))
+        self.assertTrue(sparse_excluded('web/node_modules/react/index.js'))
+        self.assertFalse(sparse_excluded('src/app.py'))
+        with override_settings(GIT_CLONE_FILTER=''):
+            self.assertFalse(sparse_excluded('static/logo.png'))
+
+class ReaderTests(SimpleTestCase):
+    """Both readers serve the same tree and bytes"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.repo_dir = make_git_repo(FILES)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.repo_dir, ignore_errors=True)
+        super().tearDownClass()
+
+    def readers(self):
+        return [WorktreeReader(self.repo_dir), GitObjectReader(os.path.join(self.repo_dir, '.git'))]
+
+    def test_get_repo_reader_prefers_git_objects(self):
+        self.assertIsInstance(get_repo_reader(self.repo_dir), GitObjectReader)
+        self.assertEqual(find_git_dir(self.repo_dir), os.path.join(self.repo_dir, '.git'))
+        with override_settings(REPO_READER_USE_GIT_OBJECTS=False):
+            self.assertIsInstance(get_repo_reader(self.repo_dir), WorktreeReader)
+        self.assertIsNone(get_repo_reader(os.path.join(self.repo_dir, 'missing')))
+
+    def test_list_dir(self):
+        for reader in self.readers():
+            with self.subTest(reader=type(reader).__name__):
+                entries = {entry.name: entry for entry in reader.list_dir('src')}
+                self.assertEqual(entries['app.py'].path, 'src/app.py')
+                self.assertEqual(entries['app.py'].type, 'file')
+                self.assertEqual(entries['lib'].type, 'directory')
+                self.assertIsNone(reader.list_dir('src/app.py'))
+                self.assertIsNone(reader.list_dir('missing'))
+
+    def test_stat_and_stream(self):
+        worktree, objects = self.readers()
+        content = FILES['src/app.py']
+        self.assertEqual(worktree.stat('src/app.py'), objects.stat('src/app.py'))
+        self.assertEqual(objects.stat('src/app.py').size, len(content))
+        for reader in (worktree, objects):
+            with self.subTest(reader=type(reader).__name__):
+                self.assertEqual(b''.join(reader.stream('src/app.py')), content)
+                self.assertEqual(b''.join(reader.stream('src/app.py', 100, 50)), content[100:150])
+                self.assertEqual(reader.read('src/lib/util.py'), FILES['src/lib/util.py'])
+                self.assertIsNone(reader.stat('src'))
+                self.assertIsNone(reader.stat('missing.py'))
+                with self.assertRaises(ValueError):
+                    reader.stat('../outside')
+
+    def test_sparse_excluded_blobs_are_not_served_from_git(self):
+        objects = GitObjectReader(os.path.join(self.repo_dir, '.git'))
+        self.assertIsNone(objects.stat('static/logo.png'))
+        with self.assertRaises(FileNotFoundError):
+            objects.read('static/logo.png')
+
+    def test_worktree_symlink_out_of_the_repository_is_rejected(self):
+        link = os.path.join(self.repo_dir, 'escape')
+        os.symlink('/etc', link)
+        try:
+            with self.assertRaises(ValueError):
+                WorktreeReader(self.repo_dir).stat('escape/passwd')
+        finally:
+            os.remove(link)
+
+class RepositoryReaderTests(SimpleTestCase):
+    """get_repository_reader once the analyzed commit's workspace is gone"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.repo_dir = make_git_repo(FILES)
+        cls.commit = subprocess.run(
+            ['git', '-C', cls.repo_dir, 'rev-parse', 'HEAD'], check=True, capture_output=True, text=True
+        ).stdout.strip()
+        cls.cache_dir = tempfile.mkdtemp(prefix='api-tests-')
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.repo_dir, ignore_errors=True)
+        shutil.rmtree(cls.cache_dir, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        settings_override = override_settings(
+            GIT_MIRROR_CACHE=True, GIT_MIRROR_DIR=os.path.join(self.cache_dir, 'mirrors'),
+            REPO_READER_USE_GIT_OBJECTS=False, CLONED_REPOS_DIR=os.path.join(self.cache_dir, 'cloned')
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        evicted = mock.patch('api.views.workspace_manager.find', return_value=None)
+        evicted.start()
+        self.addCleanup(evicted.stop)
+
+    def analyzed(self, commit):
+        return LinkedRepository(
+            repo_name='octo/project', repo_url='https://github.com/octo/project',
+            analysis_results={'project_info': {'commit': commit}}
+        )
+
+    def test_evicted_workspace_is_read_from_the_mirror(self):
+        from api.views import get_repository_reader
+
+        mirror = MirrorCache().path_for('https://github.com/octo/project')
+        subprocess.run(['git', 'clone', '-q', '--bare', self.repo_dir, mirror], check=True, capture_output=True)
+        self.addCleanup(shutil.rmtree, mirror, True)
+
+        reader = get_repository_reader(self.analyzed(self.commit))
+        self.assertIsInstance(reader, GitObjectReader)
+        self.assertEqual(reader.read('src/lib/util.py'), FILES['src/lib/util.py'])
+        # A commit the mirror does not have is not read from it
+        self.assertIsNone(get_repository_reader(self.analyzed('f' * 40)))
@@ -0,0 +1,51 @@
+from django.test import SimpleTestCase
+from api.services.structured_output import (
+    FILE_SUMMARY_SCHEMA, REVIEW_SCHEMA, StructuredOutputError, parse_structured, repair_json
+)
+
+EXPECTED = {'name': 'Shop', 'description': 'An online shop', 'technologies': ['Django', 'React']}
+
+class ParseStructuredTests(SimpleTestCase):
+    def parse(self, text):
+        return parse_structured(text, REVIEW_SCHEMA, kind='test')
+
+    def test_plain_json(self):
+        self.assertEqual(self.parse('{"name": "Shop", "description": "An online shop", "technologies": ["Django", "React"]}'), EXPECTED)
+
+    def test_fenced_with_prose(self):
+        text = (
+            'Here is the review:\n```json\n'
+            '{"name": "Shop", "description": "An online shop", "technologies": ["Django", "React"]}\n'
+            '```\nLet me know if you need more.'
+        )
+        self.assertEqual(self.parse(text), EXPECTED)
+
+    def test_lenient_repairs(self):
+        text = (
+            "{\n  // the project name\n  “name”: “Shop”,\n"
+            '  "description": "An online shop", /* [short] */\n'
+            '  "technologies": ["Django", "React",],\n  "private": True,\n}'
+        )
+        self.assertEqual(self.parse(text), EXPECTED)
+
+    def test_truncated_output_is_closed(self):
+        self.assertEqual(
+            self.parse('{"name": "Shop", "description": "An online shop", "technologies": ["Django", "React"'),
+            EXPECTED
+        )
+
+    def test_fields_are_coerced(self):
+        text = '{"Name": "Shop", "Description": ["An online", "shop"], "Technologies Used": "Django, React"}'
+        self.assertEqual(self.parse(text), EXPECTED)
+
+    def test_missing_field_or_no_object(self):
+        with self.assertRaises(StructuredOutputError):
+            self.parse('{"name": "Shop", "technologies": []}')
+        with self.assertRaises(StructuredOutputError):
+            self.parse('I could not review this repository.')
+        with self.assertRaises(StructuredOutputError):
+            parse_structured('', FILE_SUMMARY_SCHEMA, kind='test')
+
+    def test_repair_leaves_strings_alone(self):
+        text = '{"a": "True // not a comment, ]", "b": None, "c": "line\none"}'
+        self.assertEqual(repair_json(text), '{"a": "True // not a comment, ]", "b": null, "c": "line\\none"}')
@@ -0,0 +1,93 @@
+import json
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from api.models import AnalysisJob
+from api.services.webhooks import sign_payload, verify_signature
+from api.tests.helpers import make_candidate, make_repository
+
+SECRET = 'webhook-secret'
+
+def push(ref='refs/heads/main', after='a' * 40, **fields):
+    return {
+        'ref': ref,
+        'before': '0' * 40,
+        'after': after,
+        'repository': {
+            'full_name': 'octo/project',
+            'html_url': 'https://github.com/octo/project',
+            'default_branch': 'main',
+        },
+        **fields,
+    }
+
+class SignatureTests(TestCase):
+    def test_verify_signature(self):
+        body = b'{"zen": "hi"}'
+        self.assertTrue(verify_signature(SECRET, body, sign_payload(SECRET, body)))
+        self.assertFalse(verify_signature(SECRET, body + b' ', sign_payload(SECRET, body)))
+        self.assertFalse(verify_signature(SECRET, body, None))
+        # No secret configured: nothing verifies
+        self.assertFalse(verify_signature('', body, sign_payload('', body)))
+
+@override_settings(GITHUB_WEBHOOK_SECRET=SECRET, WEBHOOK_COALESCE_SECONDS=30, ANALYSIS_QUEUE='workers')
+class PushWebhookTests(TestCase):
+    def setUp(self):
+        self.repository = make_repository(make_candidate(), analysis_status='complete')
+        self.client = APIClient()
+        self.url = reverse('github-webhook')
+
+    def deliver(self, payload, event='push', secret=SECRET):
+        body = json.dumps(payload).encode()
+        return self.client.post(
+            self.url, body, content_type='application/json',
+            HTTP_X_GITHUB_EVENT=event, HTTP_X_HUB_SIGNATURE_256=sign_payload(secret, body)
+        )
+
+    def test_bad_signature_is_rejected(self):
+        self.assertEqual(self.deliver(push(), secret='wrong').status_code, 403)
+        self.assertFalse(AnalysisJob.objects.exists())
+
+    def test_ping(self):
+        self.assertEqual(self.deliver({}, event='ping').data, {'status': 'pong'})
+
+    def test_other_branches_are_ignored(self):
+        response = self.deliver(push(ref='refs/heads/feature'))
+        self.assertEqual(response.data['status'], 'ignored')
+        self.assertFalse(AnalysisJob.objects.exists())
+
+    def test_branch_deletion_is_ignored(self):
+        response = self.deliver(push(after='0' * 40, deleted=True))
+        self.assertEqual(response.data['status'], 'ignored')
+
+    def test_push_to_default_branch_queues_the_commit(self):
+        response = self.deliver(push())
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['status'], 'queued')
+
+        job = AnalysisJob.objects.get(repository=self.repository)
+        self.assertEqual((job.status, job.commit), ('queued', 'a' * 40))
+        self.assertGreater(job.available_at, timezone.now())
+
+    def test_pushes_in_a_burst_coalesce(self):
+        self.deliver(push(after='a' * 40))
+        response = self.deliver(push(after='b' * 40))
+
+        self.assertEqual(response.data['status'], 'coalesced')
+        job = AnalysisJob.objects.get(repository=self.repository)
+        self.assertEqual(job.commit, 'b' * 40)
+
+    def test_unlinked_repository_is_ignored(self):
+        payload = push()
+        payload['repository'].update(full_name='octo/other', html_url='https://github.com/octo/other')
+        self.assertEqual(self.deliver(payload).data['status'], 'ignored')
+
+    def test_linked_url_matches_whatever_its_case(self):
+        renamed = make_repository(make_candidate('other'), name='someone/fork', analysis_status='complete')
+        renamed.repo_url = 'https://github.com/Octo/Project.git'
+        renamed.save(update_fields=['repo_url'])
+
+        response = self.deliver(push())
+        self.assertEqual(response.data['repositories'], 2)
+        self.assertTrue(AnalysisJob.objects.filter(repository=renamed, status='queued').exists())
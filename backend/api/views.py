@@ -1,16 +1,28 @@
 from django.shortcuts import render, get_object_or_404
 from rest_framework import status, viewsets
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, authentication_classes, permission_classes
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
 import requests
 from django.core.mail import send_mail
+from django.http import (
+    FileResponse, HttpResponse, HttpResponseNotAllowed, HttpResponseNotModified, JsonResponse, StreamingHttpResponse
+)
+from django.core import signing
+from django.core.handlers.asgi import ASGIRequest
+from asgiref.sync import sync_to_async
+from django.utils.http import parse_etags
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 from django.conf import settings
 from functools import reduce
 import operator
+import re
+import asyncio
+import time
 from .models import User, CandidateProfile, LinkedRepository, Assessment, AssessmentAttempt, EmployerProfile
 from .serializers import (
     CandidateDetailSerializer, UserSerializer, CandidateProfileSerializer, LinkedRepositorySerializer,
@@ -18,14 +30,20 @@ from .serializers import (
 )
 from .services.repo_analyzer import RepoAnalyzer
 from .services.repo_analyzer import ErrorResponse
-from .services.assessment_generator import AssessmentGenerator
+from .services.analysis_runner import analyze_now, cancel_analysis, submit_analysis
+from .services.assessment_prewarm import create_assessment
+from .services.git_clone import MirrorCache
+from .services.github_client import GitHubClient, GitHubError, token_key
+from .services.rate_limits import rate_limits
+from .services.webhooks import handle_push, verify_signature
+from .services.structured_output import FILE_SUMMARY_SCHEMA
+from .services.repo_reader import GitObjectReader, TreeEntry, cat_file_pool, get_repo_reader, normalize_repo_path
+from .services.workspace_manager import remove_tree, split_repo_url, workspace_manager
 from django.utils import timezone
+from contextlib import closing
 import json
 from loguru import logger
 import os
-import shutil
-import errno
-import stat
 from django.db.models import Q
 
 @api_view(['GET'])
@@ -137,20 +155,18 @@ def github_callback(request):
         access_token = data.get('access_token')
         
         # Get user's GitHub profile
-        github_user = requests.get(
-            'https://api.github.com/user',
-            headers={'Authorization': f'token {access_token}'}
-        ).json()
+        github = GitHubClient(access_token)
+        try:
+            github_user = github.get('/user', max_age=0)
+            github_emails = github.get('/user/emails', max_age=0)
+        except GitHubError as e:
+            return Response(
+                {'error': f'Failed to fetch GitHub profile: {e}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
         github_username = github_user['login']
         #print(github_user)
-
-        emails_response = requests.get(
-            'https://api.github.com/user/emails',
-            headers={'Authorization': f'token {access_token}'}
-        )
-        #emails_response.raise_for_status()
-        github_emails = emails_response.json()
         print(github_emails)
 
         # Find the primary verified email
@@ -230,30 +246,24 @@ def github_repositories(request):
         )
     
     try:
-        # Fetch user's repositories from GitHub
-        response = requests.get(
-            'https://api.github.com/user/repos',
-            headers={
-                'Authorization': f'token {user.github_token}',
-                'Accept': 'application/vnd.github.v3+json'
-            }
-        )
-        
-        if response.status_code == 200:
-            repos = response.json()
-            # Filter and format the repository data
-            formatted_repos = [{
-                'full_name': repo['full_name'],
-                'description': repo['description'],
-                'language': repo['language']
-            } for repo in repos]
-            
-            return Response(formatted_repos)
+        # Fetch all of the user's repositories from GitHub, page by page
+        try:
+            repos = GitHubClient(user.github_token).list_user_repositories()
+        except GitHubError as e:
+            logger.warning(f"Listing GitHub repositories failed: {e}")
+            return Response(
+                {'error': 'Failed to fetch repositories'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        # Filter and format the repository data
+        formatted_repos = [{
+            'full_name': repo['full_name'],
+            'description': repo['description'],
+            'language': repo['language']
+        } for repo in repos]
         
-        return Response(
-            {'error': 'Failed to fetch repositories'}, 
-            status=status.HTTP_400_BAD_REQUEST
-        )
+        return Response(formatted_repos)
         
     except Exception as e:
         return Response(
@@ -261,11 +271,63 @@ def github_repositories(request):
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def github_rate_limit(request):
+    """Remaining GitHub budget of the user's token and of the token analyses run with"""
+    return Response({
+        'user': rate_limits.snapshot([token_key(request.user.github_token)]) if request.user.github_token else [],
+        'analysis': rate_limits.snapshot([token_key(settings.GITHUB_TOKEN)]),
+    })
+
+@api_view(['POST'])
+@authentication_classes([])
+@permission_classes([AllowAny])
+def github_webhook(request):
+    """Receive GitHub push events, authenticated by their HMAC signature"""
+    if not verify_signature(settings.GITHUB_WEBHOOK_SECRET, request.body, request.headers.get('X-Hub-Signature-256')):
+        return Response(
+            {'error': 'Invalid signature'},
+            status=status.HTTP_403_FORBIDDEN
+        )
+
+    event = request.headers.get('X-GitHub-Event')
+    if event == 'ping':
+        return Response({'status': 'pong'})
+    if event != 'push':
+        return Response({'status': 'ignored', 'reason': f'Unhandled event {event}'}, status=status.HTTP_202_ACCEPTED)
+
+    try:
+        payload = json.loads(request.body)
+    except ValueError:
+        return Response(
+            {'error': 'Invalid payload'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    return Response(handle_push(payload, on_complete=update_candidate_skills), status=status.HTTP_202_ACCEPTED)
+
+def analysis_error_message(error: ErrorResponse) -> str:
+    if error.error == "SonarQube Analysis Failed":
+        return 'SonarQube analysis failed'
+    if error.error == "Analysis Busy":
+        return 'Repository is already being analyzed, try again later'
+    if error.error == "Stage Timed Out":
+        return 'Analysis took too long and was stopped'
+    return 'Analysis failed'
+
+ANALYSIS_MODES = ('quick', 'full')
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def add_repository(request):
     try:
         repo_name = request.data.get('full_name')
+        analysis_mode = request.data.get('analysis_mode') or settings.ANALYSIS_DEFAULT_MODE
+        if analysis_mode not in ANALYSIS_MODES:
+            return Response(
+                {'error': f"analysis_mode must be one of {', '.join(ANALYSIS_MODES)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
         # Check if repository is already linked
         if LinkedRepository.objects.filter(
@@ -278,17 +340,13 @@ def add_repository(request):
             )
         
         # Get repository details from GitHub
-        response = requests.get(
-            f'https://api.github.com/repos/{repo_name}',
-            headers={
-                'Authorization': f'token {request.user.github_token}',
-                'Accept': 'application/vnd.github.v3+json'
-            }
-        )
+        try:
+            repo_data = GitHubClient(request.user.github_token).get_repository(repo_name)
+        except GitHubError as e:
+            logger.warning(f"Fetching {repo_name} from GitHub failed: {e}")
+            repo_data = None
         
-        if response.status_code == 200:
-            repo_data = response.json()
-            
+        if repo_data is not None:
             # Create new linked repository with pending status
             repository = LinkedRepository.objects.create(
                 candidate=request.user.candidate_profile,
@@ -299,60 +357,25 @@ def add_repository(request):
                 analysis_status='pending'  # Set initial status as pending
             )
             
-            # Start analysis immediately
-            try:
-                analyzer = RepoAnalyzer(
-                    github_token=settings.GITHUB_TOKEN,
-                    huggingface_token=settings.HUGGINGFACE_TOKEN,
-                    sonar_token=settings.SONAR_TOKEN,
-                )
-                
-                # Generate review
-                review_data = analyzer.analyze_repository(repository.repo_url)
-                
-                # Check if result is an error response
-                if isinstance(review_data, ErrorResponse):
-                    logger.error("Analysis failed:")
-                    print(json.dumps(review_data.to_json(), indent=2))
-                    repository.analysis_status = 'failed'
-                    repository.save()
-                    return Response(
-                        {'error': 'Analysis failed'},
-                        status=status.HTTP_500_INTERNAL_SERVER_ERROR
-                    )
-
-                analysis_json = review_data.to_json()
-                
-                # Check if SonarQube analysis failed
-                if not analysis_json.get('code_quality', {}).get('metrics'):
-                    repository.analysis_status = 'failed'
-                    repository.save()
-                    return Response(
-                        {'error': 'SonarQube analysis failed'},
-                        status=status.HTTP_500_INTERNAL_SERVER_ERROR
-                    )
-                
-                # Update repository with analysis results
-                repository.analysis_results = analysis_json
-                repository.analysis_status = 'complete'
-                repository.save()
+            if settings.ANALYSIS_ASYNC:
+                # Analyze in the background; clients follow along via the progress endpoints
+                submit_analysis(repository, analysis_mode, on_complete=update_candidate_skills)
+                serializer = LinkedRepositorySerializer(repository)
+                return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
 
-                if repository.analysis_status == 'complete' and repository.analysis_results:
-                    update_candidate_skills(repository)
-                
-            except Exception as e:
-                repository.analysis_status = 'failed'
-                repository.save()
-                error_response = ErrorResponse(
-                    error="Test Execution Failed",
-                    details=str(e)
-                )
-                print(json.dumps(error_response.to_json(), indent=2))
+            # Analyze before answering, still as a leased job; the skills update runs as its callback
+            review_data = analyze_now(repository, analysis_mode, on_complete=update_candidate_skills)
+
+            # Check if result is an error response
+            if isinstance(review_data, ErrorResponse):
+                logger.error("Analysis failed:")
+                print(json.dumps(review_data.to_json(), indent=2))
                 return Response(
-                    error_response.to_json(),
+                    {'error': analysis_error_message(review_data)},
                     status=status.HTTP_500_INTERNAL_SERVER_ERROR
                 )
-            
+
+            repository.refresh_from_db()
             serializer = LinkedRepositorySerializer(repository)
             return Response(serializer.data)
             
@@ -367,6 +390,114 @@ def add_repository(request):
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
 
+REPO_FULL_NAME = re.compile(r'^[A-Za-z0-9_.-]+/[A-Za-z0-9_.-]+$')
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def bulk_add_repositories(request):
+    """Link many repositories at once and queue their analyses.
+
+    Metadata for all of them comes from one GitHub GraphQL request, the
+    rows are created with one bulk insert, and the analyses run in the
+    background like those of add_repository.
+    """
+    full_names = request.data.get('full_names')
+    analysis_mode = request.data.get('analysis_mode') or settings.ANALYSIS_DEFAULT_MODE
+    if not isinstance(full_names, list) or not full_names:
+        return Response(
+            {'error': 'full_names must be a non-empty list'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    if len(full_names) > settings.BULK_IMPORT_MAX_REPOSITORIES:
+        return Response(
+            {'error': f'At most {settings.BULK_IMPORT_MAX_REPOSITORIES} repositories per import'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    if analysis_mode not in ANALYSIS_MODES:
+        return Response(
+            {'error': f"analysis_mode must be one of {', '.join(ANALYSIS_MODES)}"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    try:
+        candidate = request.user.candidate_profile
+    except CandidateProfile.DoesNotExist:
+        return Response({'error': 'Profile not found'}, status=status.HTTP_404_NOT_FOUND)
+
+    skipped = []
+    requested = {}  # lower-cased name -> name as given; GitHub names are case-insensitive
+    for full_name in full_names:
+        if not isinstance(full_name, str) or not REPO_FULL_NAME.match(full_name):
+            skipped.append({'full_name': full_name, 'reason': 'Invalid repository name'})
+        else:
+            requested.setdefault(full_name.lower(), full_name)
+
+    linked = set()
+    if requested:
+        linked = {
+            name.lower() for name in LinkedRepository.objects.filter(
+                reduce(operator.or_, (Q(repo_name__iexact=name) for name in requested.values())),
+                candidate=candidate
+            ).values_list('repo_name', flat=True)
+        }
+    skipped.extend(
+        {'full_name': name, 'reason': 'Repository already added'}
+        for key, name in requested.items() if key in linked
+    )
+    requested = [name for key, name in requested.items() if key not in linked]
+
+    metadata = {}
+    if requested:
+        try:
+            metadata = GitHubClient(request.user.github_token).get_repositories_metadata(requested)
+        except GitHubError as e:
+            logger.warning(f"Bulk import metadata query failed: {e}")
+            return Response(
+                {'error': 'Failed to fetch repository details'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+    # GitHub's spelling of each name, which also follows renames, is what gets stored
+    found = {}
+    for full_name in requested:
+        repo_data = metadata.get(full_name)
+        if not repo_data:
+            skipped.append({'full_name': full_name, 'reason': 'Repository not found'})
+        else:
+            found[full_name] = (repo_data.get('nameWithOwner') or full_name, repo_data)
+    if found:
+        linked |= {
+            name.lower() for name in LinkedRepository.objects.filter(
+                reduce(operator.or_, (Q(repo_name__iexact=canonical) for canonical, _ in found.values())),
+                candidate=candidate
+            ).values_list('repo_name', flat=True)
+        }
+
+    repositories = []
+    for full_name, (canonical, repo_data) in found.items():
+        if canonical.lower() in linked:
+            skipped.append({'full_name': full_name, 'reason': 'Repository already added'})
+            continue
+        linked.add(canonical.lower())
+        languages = [edge['node']['name'] for edge in (repo_data.get('languages') or {}).get('edges', [])]
+        repositories.append(LinkedRepository(
+            candidate=candidate,
+            repo_name=canonical,
+            repo_url=repo_data['url'],
+            description=repo_data.get('description') or '',
+            languages=languages or [(repo_data.get('primaryLanguage') or {}).get('name', 'Unknown')],
+            analysis_status='pending'
+        ))
+
+    created = LinkedRepository.objects.bulk_create(repositories)
+    for repository in created:
+        submit_analysis(repository, analysis_mode, on_complete=update_candidate_skills)
+
+    return Response({
+        'created': LinkedRepositorySerializer(created, many=True).data,
+        'skipped': skipped
+    }, status=status.HTTP_202_ACCEPTED)
+
 def update_candidate_skills(repo: LinkedRepository):
     """Update candidate skills based on repository analysis"""
     try:
@@ -410,33 +541,33 @@ def delete_repository(request, repo_id):
             candidate=request.user.candidate_profile
         )
         
-        # Get the repository name from the full name (owner/repo)
-        repo_name = repository.repo_name.split('/')[-1]
-        
-        # Construct the path to the cloned repository
+        owner, repo_name = split_repo_url(repository.repo_name)
+
+        # Stop the analysis first, so it lets go of its workspace
+        cancel_analysis(repository)
+
+        # Other candidates who linked the same repository browse the same
+        # workspaces and may be analyzing it; theirs are left to the quota
+        others = LinkedRepository.objects.exclude(id=repository.id)
+        shared = others.filter(Q(repo_name__iexact=repository.repo_name) | Q(repo_url__iexact=repository.repo_url))
+        if not shared.exists():
+            # Drop every workspace of this repository that no analysis is using,
+            # with the cat-file processes reading them
+            workspace_manager.remove_repository(owner, repo_name)
+
+        # Checkouts from before workspaces were keyed by owner and commit,
+        # shared by every repository of the same name
         clone_path = os.path.join(settings.CLONED_REPOS_DIR, str(repo_name))
-        print("clone_path: ", clone_path)
-
-        # Define handler for read-only files
-        def handle_remove_readonly(func, path, exc):
-            excvalue = exc[1]
-            if func in (os.rmdir, os.remove, os.unlink) and excvalue.errno == errno.EACCES:
-                # Change file permissions to writeable
-                os.chmod(path, stat.S_IRWXU | stat.S_IRWXG | stat.S_IRWXO)
-                # Try the operation again
-                func(path)
-            else:
-                raise
-
-        # Delete the cloned repository directory if it exists
-        if os.path.exists(clone_path):
+        legacy_shared = others.filter(repo_name__iendswith=f'/{repo_name}').exists()
+        if os.path.isdir(os.path.join(clone_path, '.git')) and not legacy_shared:
             try:
-                shutil.rmtree(clone_path, onerror=handle_remove_readonly)
+                cat_file_pool.discard(os.path.join(clone_path, '.git'))
+                remove_tree(clone_path)
                 print(f"Successfully deleted cloned repository at {clone_path}")
             except Exception as e:
                 print(f"Error deleting cloned repository: {str(e)}")
                 # Continue with deletion of database record even if file deletion fails
-        
+
         # Delete the database record
         repository.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
@@ -458,59 +589,33 @@ def get_repo_summary(request, repo_id):
     try:
         print("repo_id: ", repo_id)
         project = LinkedRepository.objects.get(id=repo_id)
+        analysis_mode = request.query_params.get('mode') or settings.ANALYSIS_DEFAULT_MODE
+        if analysis_mode not in ANALYSIS_MODES:
+            return Response(
+                {'error': f"mode must be one of {', '.join(ANALYSIS_MODES)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
-        # Check if analysis_results already exists and is not empty
+        # Check if analysis_results already exists and is not empty; a full
+        # request upgrades results that only came from the quick engine
         if project.analysis_results and isinstance(project.analysis_results, dict):
-            print("Returning existing analysis results")
-            return Response(project.analysis_results)
+            engine = project.analysis_results.get('code_quality', {}).get('engine', 'sonar')
+            if analysis_mode == 'quick' or engine == 'sonar':
+                print("Returning existing analysis results")
+                return Response(project.analysis_results)
             
-        # If no existing analysis, perform new analysis
+        # If no existing analysis, run one as a job and wait for it (or for the one already queued)
         print("Generating new analysis")
-        analyzer = RepoAnalyzer(
-            github_token=settings.GITHUB_TOKEN,
-            huggingface_token=settings.HUGGINGFACE_TOKEN,
-            sonar_token=settings.SONAR_TOKEN,
-        )
-        
-        # Generate review
-        review_data = analyzer.analyze_repository(project.repo_url)
+        review_data = analyze_now(project, analysis_mode)
         
         # Check if result is an error response
         if isinstance(review_data, ErrorResponse):
-            project.analysis_status = 'failed'
-            project.save()
-            return Response(
-                {'error': 'Analysis failed'},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
-            )
-
-        analysis_json = review_data.to_json()
-        
-        # Check if SonarQube analysis failed
-        if not analysis_json.get('code_quality', {}).get('metrics'):
-            project.analysis_status = 'failed'
-            project.save()
             return Response(
-                {'error': 'SonarQube analysis failed'},
+                {'error': analysis_error_message(review_data)},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
         
-        print("\n\nanalysis_json: ", analysis_json)
-        
-        # Save review
-        try:
-            project.analysis_results = analysis_json
-            project.analysis_status = 'complete'
-            project.save()
-        except Exception as e:
-            project.analysis_status = 'failed'
-            project.save()
-            return Response(
-                {'error': str(e)}, 
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
-            )
-        
-        return Response(analysis_json)
+        return Response(review_data)
 
     except LinkedRepository.DoesNotExist:
         return Response(
@@ -523,6 +628,150 @@ def get_repo_summary(request, repo_id):
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
 
+STREAM_TOKEN_SALT = 'api.progress-stream'
+
+def progress_payload(repository: LinkedRepository) -> Dict:
+    return {
+        'id': repository.id,
+        'analysis_status': repository.analysis_status,
+        'analysis_progress': repository.analysis_progress,
+        'updated_at': repository.updated_at.isoformat()
+    }
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_analysis_progress(request, repo_id):
+    """Polling fallback for clients that cannot keep a progress stream open"""
+    try:
+        repository = LinkedRepository.objects.get(
+            id=repo_id,
+            candidate=request.user.candidate_profile
+        )
+    except (LinkedRepository.DoesNotExist, CandidateProfile.DoesNotExist):
+        return Response(
+            {'error': 'Repository not found'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+    return Response(progress_payload(repository))
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def cancel_repository_analysis(request, repo_id):
+    """Stop the repository's running or queued analysis"""
+    try:
+        repository = LinkedRepository.objects.get(
+            id=repo_id,
+            candidate=request.user.candidate_profile
+        )
+    except (LinkedRepository.DoesNotExist, CandidateProfile.DoesNotExist):
+        return Response(
+            {'error': 'Repository not found'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+    if not cancel_analysis(repository):
+        return Response(
+            {'error': 'Repository is not being analyzed'},
+            status=status.HTTP_409_CONFLICT
+        )
+    repository.refresh_from_db()
+    serializer = LinkedRepositorySerializer(repository)
+    return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def issue_stream_token(request, repo_id):
+    """A short-lived token that opens this repository's progress stream.
+
+    EventSource cannot send headers, so the stream takes its credentials
+    from the URL. This token, not the access JWT, is what goes there: it
+    only opens the one stream and expires after PROGRESS_STREAM_TOKEN_SECONDS.
+    """
+    if not LinkedRepository.objects.filter(id=repo_id, candidate__user=request.user).exists():
+        return Response(
+            {'error': 'Repository not found'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+    token = signing.dumps({'user': str(request.user.pk), 'repo': str(repo_id)}, salt=STREAM_TOKEN_SALT)
+    return Response({'token': token, 'expires_in': settings.PROGRESS_STREAM_TOKEN_SECONDS})
+
+def authenticate_stream_request(request, repo_id) -> Optional[User]:
+    """The user a ?token= from issue_stream_token, or the Authorization header, belongs to"""
+    raw_token = request.GET.get('token')
+    if raw_token:
+        try:
+            claims = signing.loads(raw_token, salt=STREAM_TOKEN_SALT, max_age=settings.PROGRESS_STREAM_TOKEN_SECONDS)
+        except signing.BadSignature:
+            return None
+        if claims.get('repo') != str(repo_id):
+            return None
+        return User.objects.filter(pk=claims.get('user'), is_active=True).first()
+    authentication = JWTAuthentication()
+    try:
+        authenticated = authentication.authenticate(request)
+        return authenticated[0] if authenticated else None
+    except (InvalidToken, AuthenticationFailed):
+        return None
+
+def next_progress_event(repo_id, last_seen: Optional[str]) -> Tuple[Optional[str], Optional[str], bool]:
+    """The SSE event for the repository's progress if it changed since last_seen"""
+    repository = LinkedRepository.objects.filter(id=repo_id).first()
+    if repository is None:
+        return 'event: done\ndata: {}\n\n', last_seen, True
+    payload = progress_payload(repository)
+    finished = repository.analysis_status in ('complete', 'failed', 'cancelled')
+    if payload['updated_at'] == last_seen and not finished:
+        return None, last_seen, False
+    event = f"event: progress\ndata: {json.dumps(payload)}\n\n"
+    if finished:
+        event += f"event: done\ndata: {json.dumps({'analysis_status': repository.analysis_status})}\n\n"
+    return event, payload['updated_at'], finished
+
+async def progress_events(repo_id):
+    last_seen, last_sent = None, time.monotonic()
+    deadline = last_sent + settings.PROGRESS_STREAM_MAX_SECONDS
+    yield 'retry: 3000\n\n'
+    while time.monotonic() < deadline:
+        event, last_seen, finished = await sync_to_async(next_progress_event)(repo_id, last_seen)
+        if event:
+            yield event
+            last_sent = time.monotonic()
+        if finished:
+            return
+        if time.monotonic() - last_sent >= settings.PROGRESS_STREAM_KEEPALIVE:
+            yield ': keepalive\n\n'
+            last_sent = time.monotonic()
+        await asyncio.sleep(settings.PROGRESS_STREAM_POLL_INTERVAL)
+
+def stream_analysis_progress(request, repo_id):
+    """Push analysis progress as server-sent events until the analysis ends.
+
+    Each change to the repository's analysis_progress is sent as a
+    `progress` event, followed by one `done` event once the analysis
+    completes or fails. Streams are closed after
+    PROGRESS_STREAM_MAX_SECONDS, and EventSource reconnects by itself.
+
+    Streams are only served under ASGI, where a waiting stream costs a
+    coroutine. Under WSGI each one would hold a worker thread for the whole
+    analysis, so clients are told to poll progress/ instead.
+    """
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse(
+            {'error': 'Progress streams need the ASGI server; poll progress/ instead'},
+            status=status.HTTP_501_NOT_IMPLEMENTED
+        )
+    user = authenticate_stream_request(request, repo_id)
+    if user is None:
+        return JsonResponse({'error': 'Authentication required'}, status=status.HTTP_401_UNAUTHORIZED)
+    if not LinkedRepository.objects.filter(id=repo_id, candidate__user=user).exists():
+        return JsonResponse({'error': 'Repository not found'}, status=status.HTTP_404_NOT_FOUND)
+
+    response = StreamingHttpResponse(progress_events(repo_id), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # let nginx pass events through as they come
+    return response
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def generate_assessment(request, repo_id):
@@ -539,32 +788,26 @@ def generate_assessment(request, repo_id):
                 status=status.HTTP_400_BAD_REQUEST
             )
             
-        # Check if assessment already exists
-        existing_assessment = Assessment.objects.filter(repository=repository).first()
-        if existing_assessment:
+        # Check if an assessment of the analyzed commit already exists; a retake
+        # of a completed one gets a new sample of questions, usually straight from the bank
+        commit = (repository.analysis_results or {}).get('project_info', {}).get('commit') or ''
+        existing_assessment = Assessment.objects.filter(
+            repository=repository, commit=commit
+        ).order_by('-created_at').first()
+        retake = bool(request.data.get('retake')) and bool(existing_assessment and existing_assessment.completed_at)
+        if existing_assessment and not retake:
             serializer = AssessmentSerializer(existing_assessment)
             return Response(serializer.data)
             
-        # Generate new assessment
-        generator = AssessmentGenerator(settings.HUGGINGFACE_TOKEN)
-        assessment_data = generator.generate_assessment(repository.analysis_results)
+        # Not pre-warmed (or the pre-warm failed): generate it now, joining
+        # a pre-warm that is still running rather than starting a second one
+        assessment = create_assessment(repository, retake=retake)
         
-        if not assessment_data:
+        if not assessment:
             return Response(
                 {'error': 'Failed to generate assessment'},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
-            
-        # Create assessment
-        assessment = Assessment.objects.create(
-            repository=repository,
-            questions=[{
-                'text': q.text,
-                'options': q.options,
-                'correct_answer': q.correct_answer,
-                'explanation': q.explanation
-            } for q in assessment_data.questions]
-        )
         
         serializer = AssessmentSerializer(assessment)
         return Response(serializer.data)
@@ -657,41 +900,6 @@ def get_assessment(request, repo_id):
             status=status.HTTP_404_NOT_FOUND
         )
 
-@api_view(['GET'])
-@permission_classes([IsAuthenticated])
-def get_file_content(request, repo_id, file_path):
-    try:
-        repository = LinkedRepository.objects.get(id=repo_id)
-        
-        # Ensure the file path is within the cloned repository directory
-        full_path = os.path.join(settings.CLONED_REPOS_DIR, repository.repo_name.split('/')[-1], file_path)
-        print("FULL PATH:", full_path)
-        
-        # Security check to prevent directory traversal
-        if not os.path.normpath(full_path).startswith(settings.CLONED_REPOS_DIR):
-            return Response(
-                {'error': 'Invalid file path'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-            
-        if os.path.exists(full_path):
-            with open(full_path, 'r', encoding='utf-8') as file:
-                content = file.readlines()
-                return Response({
-                    'content': content
-                })
-        else:
-            return Response(
-                {'error': 'File not found'},
-                status=status.HTTP_404_NOT_FOUND
-            )
-            
-    except LinkedRepository.DoesNotExist:
-        return Response(
-            {'error': 'Repository not found'},
-            status=status.HTTP_404_NOT_FOUND
-        )
-
 @api_view(['POST'])
 def register_employer(request):
     """Register a new employer"""
@@ -839,10 +1047,8 @@ def get_candidate_project(request, candidate_id, project_id):
             candidate_id=candidate_id
         )
         
-        # Get latest assessment
-        assessment = Assessment.objects.filter(
-            repository=project
-        ).order_by('-created_at').first()
+        # The first completed assessment, not the latest retake
+        assessment = project.scored_assessment()
         
         # Combine project and assessment data
         project_data = LinkedRepositorySerializer(project).data
@@ -863,68 +1069,112 @@ def get_candidate_project(request, candidate_id, project_id):
         )
 
 
+FILE_LANGUAGES = {
+    'ts': 'TypeScript',
+    'tsx': 'TypeScript',
+    'js': 'JavaScript',
+    'jsx': 'JavaScript',
+    'py': 'Python',
+    'html': 'HTML',
+    'css': 'CSS',
+    'json': 'JSON',
+    'md': 'Markdown'
+}
+
+def get_file_language(name: str) -> Optional[str]:
+    """Determine file language based on extension"""
+    return FILE_LANGUAGES.get(Path(name).suffix[1:])
+
+def get_entry_info(entry: TreeEntry, reader) -> Dict:
+    """Get file metadata"""
+    suffix = Path(entry.name).suffix
+    return {
+        'name': entry.name,
+        'path': entry.path,
+        'type': entry.type,
+        'size': reader.entry_size(entry) if entry.type == 'file' else None,
+        'extension': suffix[1:] if suffix else None,
+        'language': get_file_language(entry.name)
+    }
+
+def file_sort_key(item):
+    """Directories first, then alphabetical - the order the file browser renders"""
+    return (item.type != 'directory', item.name)
+
+def get_repository_reader(repo: LinkedRepository):
+    """Reader for the analyzed revision of a repository.
+
+    Prefers the workspace of the analyzed commit. If that workspace has been
+    evicted, the commit is still readable from the repository's mirror, or
+    from the shared object cache that full-depth clones fill.
+    Repositories analyzed before commits were recorded fall back to their
+    most recent workspace or their old flat checkout. With analysis workers
+    on other hosts these directories must be shared storage (see
+    ANALYSIS_QUEUE in settings), or there is nothing to read here.
+    """
+    owner, name = split_repo_url(repo.repo_name)
+    commit = ((repo.analysis_results or {}).get('project_info') or {}).get('commit')
+    repo_dir = workspace_manager.find(owner, name, commit) if commit else workspace_manager.find(owner, name)
+    if repo_dir:
+        return get_repo_reader(repo_dir)
+    if commit and settings.GIT_MIRROR_CACHE:
+        mirrors = MirrorCache()
+        mirror = mirrors.path_for(repo.repo_url)
+        # A bare repository, so read through git whatever REPO_READER_USE_GIT_OBJECTS says; blobs
+        # the analysis never checked out are not in the blob-less mirror, and read as missing
+        if os.path.isdir(mirror) and mirrors.has_commit(mirror, commit):
+            return GitObjectReader(mirror, commit)
+    if commit and settings.REPO_READER_USE_GIT_OBJECTS and os.path.isdir(settings.GIT_OBJECT_CACHE_DIR):
+        return get_repo_reader(settings.GIT_OBJECT_CACHE_DIR, rev=commit)
+    return get_repo_reader(os.path.join(settings.CLONED_REPOS_DIR, name))
+
+def visible_entries(reader, dir_path: str) -> Optional[List[TreeEntry]]:
+    """Non-hidden children of a directory in browser order, or None if it is not a directory"""
+    entries = reader.list_dir(dir_path)
+    if entries is None:
+        return None
+    return sorted(
+        (entry for entry in entries if not entry.name.startswith('.')),
+        key=file_sort_key
+    )
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_repository_files(request, repo_id):
     """Get repository file structure"""
     try:
         repo = LinkedRepository.objects.get(id=repo_id)
-        repo_name = repo.repo_name.split("/")[-1]
-        repo_path = os.path.join(settings.CLONED_REPOS_DIR, repo_name)
-        print("REPO PATH:", repo_path)
-        
-        if not os.path.exists(repo_path):
+        reader = get_repository_reader(repo)
+
+        if reader is None:
             return Response(
                 {'error': 'Repository files not found'},
                 status=status.HTTP_404_NOT_FOUND
             )
-        
-        def get_file_info(path: Path) -> Dict:
-            """Get file metadata"""
-            stats = path.stat()
-            return {
-                'name': path.name,
-                'path': str(path.relative_to(repo_path)),
-                'type': 'directory' if path.is_dir() else 'file',
-                'size': stats.st_size if path.is_file() else None,
-                'extension': path.suffix[1:] if path.suffix else None,
-                'language': get_file_language(path)
-            }
-        
-        def get_file_language(path: Path) -> Optional[str]:
-            """Determine file language based on extension"""
-            ext_map = {
-                'ts': 'TypeScript',
-                'tsx': 'TypeScript',
-                'js': 'JavaScript',
-                'jsx': 'JavaScript',
-                'py': 'Python',
-                'html': 'HTML',
-                'css': 'CSS',
-                'json': 'JSON',
-                'md': 'Markdown'
-            }
-            return ext_map.get(path.suffix[1:])
-        
-        def scan_directory(path: Path) -> List[Dict]:
+
+        def scan_directory(dir_path: str) -> List[Dict]:
             """Recursively scan directory"""
             items = []
             try:
-                for item in path.iterdir():
-                    if item.name.startswith('.'):
-                        continue
-                        
-                    info = get_file_info(item)
-                    if item.is_dir():
-                        info['children'] = scan_directory(item)
-                    items.append(info)
+                entries = visible_entries(reader, dir_path) or []
             except Exception as e:
-                print(f"Error scanning {path}: {e}")
-            return sorted(items, key=lambda x: (x['type'] != 'directory', x['name']))
-        
-        file_tree = scan_directory(Path(repo_path))
+                logger.warning(f"Error scanning {dir_path}: {e}")
+                return items
+            for entry in entries:
+                try:
+                    info = get_entry_info(entry, reader)
+                except (OSError, ValueError) as e:
+                    # ValueError: a symlink that points outside the repository
+                    logger.warning(f"Error reading {entry.path}: {e}")
+                    continue
+                if entry.type == 'directory':
+                    info['children'] = scan_directory(entry.path)
+                items.append(info)
+            return items
+
+        file_tree = scan_directory('')
         return Response(file_tree)
-        
+
     except LinkedRepository.DoesNotExist:
         return Response(
             {'error': 'Repository not found'},
@@ -938,46 +1188,253 @@ def get_repository_files(request, repo_id):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
-def get_file_content(request, repo_id):
-    """Get file content"""
+def get_directory_listing(request, repo_id):
+    """Get one page of the immediate children of a repository directory"""
     try:
         repo = LinkedRepository.objects.get(id=repo_id)
-        file_path = request.GET.get('path')
-        
+        reader = get_repository_reader(repo)
+
+        try:
+            page = max(int(request.GET.get('page', 1)), 1)
+            page_size = int(request.GET.get('page_size', settings.FILE_TREE_PAGE_SIZE))
+        except ValueError:
+            return Response(
+                {'error': 'page and page_size must be integers'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        page_size = min(max(page_size, 1), settings.FILE_TREE_MAX_PAGE_SIZE)
+
+        if reader is None:
+            return Response(
+                {'error': 'Repository files not found'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+        try:
+            dir_path = normalize_repo_path(request.GET.get('path', ''))
+            entries = visible_entries(reader, dir_path)
+        except ValueError:
+            return Response(
+                {'error': 'Invalid directory path'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        if entries is None:
+            return Response(
+                {'error': 'Directory not found'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+        # Only the entries on the requested page are sized or counted
+        start = (page - 1) * page_size
+        items = []
+        for entry in entries[start:start + page_size]:
+            try:
+                info = get_entry_info(entry, reader)
+                if entry.type == 'directory':
+                    info['child_count'] = reader.count_visible_children(entry)
+            except (OSError, ValueError) as e:
+                # ValueError: a symlink that points outside the repository
+                logger.warning(f"Error reading {entry.path}: {e}")
+                continue
+            items.append(info)
+
+        return Response({
+            'path': dir_path,
+            'items': items,
+            'page': page,
+            'page_size': page_size,
+            'total': len(entries),
+            'has_more': start + page_size < len(entries)
+        })
+
+    except LinkedRepository.DoesNotExist:
+        return Response(
+            {'error': 'Repository not found'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+    except Exception as e:
+        return Response(
+            {'error': str(e)},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+def parse_byte_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Parse a single 'bytes=' Range header into a half-open (start, end) pair.
+
+    Returns None when the range is unsatisfiable and raises ValueError when
+    the header is malformed or asks for several ranges, in which case the
+    header should be ignored.
+    """
+    units, _, spec = header.partition('=')
+    if units.strip() != 'bytes' or ',' in spec:
+        raise ValueError(f"Unsupported range: {header}")
+    first, _, last = spec.strip().partition('-')
+    if not first:
+        suffix = int(last)
+        return (max(size - suffix, 0), size) if suffix > 0 and size else None
+    start = int(first)
+    end = int(last) + 1 if last else size
+    if start >= size or end <= start:
+        return None
+    return start, min(end, size)
+
+def line_range_offsets(chunks, start_line: int, end_line: Optional[int], max_bytes: int) -> Tuple[int, int, int]:
+    """Byte offsets covering lines start_line..end_line (1-based, inclusive).
+
+    Scans a stream of chunks so a huge file or a single huge line never has
+    to fit in memory, and stops once the range is longer than max_bytes
+    since anything past that point would be truncated anyway. Returns
+    (start, end, last_line).
+    """
+    offset = 0
+    line_no = 1
+    line_start = 0
+    start = 0 if start_line == 1 else None
+    for chunk in chunks:
+        pos = chunk.find(b'\n')
+        while pos != -1:
+            line_start = offset + pos + 1
+            if end_line and line_no >= end_line:
+                return start, line_start, line_no
+            line_no += 1
+            if line_no == start_line:
+                start = line_start
+            pos = chunk.find(b'\n', pos + 1)
+        offset += len(chunk)
+        if start is not None and offset - start > max_bytes:
+            return start, offset, line_no
+    if start is None:
+        return offset, offset, start_line - 1
+    # A trailing newline does not start another line
+    return start, offset, line_no if offset > line_start else line_no - 1
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_file_content(request, repo_id, file_path=None):
+    """Stream file content.
+
+    Content comes from the git object store (or the working tree, passed
+    straight through with sendfile where the server supports it) and is
+    never read into memory. Supports a single HTTP byte range, a
+    start_line/end_line query range, and If-None-Match against an ETag
+    derived from the git blob SHA. Responses are capped at
+    FILE_CONTENT_MAX_BYTES; the X-Content-* headers say whether the body was
+    truncated and how large the file really is.
+    """
+    try:
+        repo = LinkedRepository.objects.get(id=repo_id)
+        file_path = file_path or request.GET.get('path')
+
         if not file_path:
             return Response(
                 {'error': 'File path is required'},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        repo_name = repo.repo_name.split("/")[-1]    
-        full_path = os.path.join(settings.CLONED_REPOS_DIR, repo_name, file_path)
-        full_path = os.path.normpath(full_path)
-        
+        reader = get_repository_reader(repo)
+        if reader is None:
+            return Response(
+                {'error': 'Repository files not found'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+
         # Security check - ensure path is within repo directory
-        repo_dir = os.path.join(settings.CLONED_REPOS_DIR, repo_name)
-        if not full_path.startswith(repo_dir):
+        try:
+            file_path = normalize_repo_path(file_path)
+            blob = reader.stat(file_path)
+        except ValueError:
             return Response(
                 {'error': 'Invalid file path'},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        
-        if not os.path.exists(full_path) or not os.path.isfile(full_path):
+
+        if blob is None:
             return Response(
                 {'error': 'File not found'},
                 status=status.HTTP_404_NOT_FOUND
             )
-            
-        try:
-            with open(full_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            return Response({'content': content})
-        except UnicodeDecodeError:
-            return Response(
-                {'error': 'File is not text-readable'},
-                status=status.HTTP_400_BAD_REQUEST
+
+        size = blob.size
+        etag = f'"{blob.sha}"'
+
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            response = HttpResponseNotModified()
+            response['ETag'] = etag
+            return response
+
+        with closing(reader.stream(file_path, 0, 8192)) as head:
+            if b'\0' in b''.join(head):
+                return Response(
+                    {'error': 'File is not text-readable'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+        max_bytes = settings.FILE_CONTENT_MAX_BYTES
+        start, end = 0, size
+        partial = False
+        headers = {}
+
+        start_line = request.GET.get('start_line')
+        end_line = request.GET.get('end_line')
+        range_header = request.headers.get('Range')
+
+        if start_line or end_line:
+            try:
+                start_line = int(start_line or 1)
+                end_line = int(end_line) if end_line else None
+            except ValueError:
+                return Response(
+                    {'error': 'start_line and end_line must be integers'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            if start_line < 1 or (end_line is not None and end_line < start_line):
+                return Response(
+                    {'error': 'Invalid line range'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            with closing(reader.stream(file_path)) as chunks:
+                start, end, last_line = line_range_offsets(chunks, start_line, end_line, max_bytes)
+            headers['X-Line-Start'] = str(start_line)
+            headers['X-Line-End'] = str(last_line)
+        elif range_header:
+            try:
+                byte_range = parse_byte_range(range_header, size)
+                if byte_range is None:
+                    response = HttpResponse(status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+                    response['Content-Range'] = f'bytes */{size}'
+                    return response
+                start, end = byte_range
+                partial = True
+            except ValueError:
+                pass
+
+        length = end - start
+        truncated = length > max_bytes
+        length = min(length, max_bytes)
+        local_path = reader.local_path(file_path)
+
+        if local_path and not truncated and not partial and start == 0:
+            response = FileResponse(open(local_path, 'rb'), content_type='text/plain; charset=utf-8')
+        else:
+            response = StreamingHttpResponse(
+                reader.stream(file_path, start, length),
+                content_type='text/plain; charset=utf-8',
+                status=status.HTTP_206_PARTIAL_CONTENT if partial else status.HTTP_200_OK
             )
-            
+            response['Content-Length'] = str(length)
+            if partial:
+                response['Content-Range'] = f'bytes {start}-{start + length - 1}/{size}'
+
+        response['ETag'] = etag
+        response['Accept-Ranges'] = 'bytes'
+        response['Cache-Control'] = 'private, no-cache'
+        response['X-Content-Total-Size'] = str(size)
+        response['X-Content-Truncated'] = 'true' if truncated else 'false'
+        for name, value in headers.items():
+            response[name] = value
+        return response
+
     except LinkedRepository.DoesNotExist:
         return Response(
             {'error': 'Repository not found'},
@@ -992,7 +1449,11 @@ def get_file_content(request, repo_id):
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_file_summary(request, repo_id):
-    """Generate AI summary for file"""
+    """Generate AI summary for file.
+
+    Files over FILE_CONTENT_MAX_BYTES are not read or sent to the model;
+    their summary only says how large they are.
+    """
     try:
         repo = LinkedRepository.objects.get(id=repo_id)
         file_path = request.GET.get('path')
@@ -1003,28 +1464,43 @@ def get_file_summary(request, repo_id):
                 {'error': 'File path is required'},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        repo_name = repo.repo_name.split("/")[-1]
-        full_path = os.path.join(settings.CLONED_REPOS_DIR, repo_name, file_path)
-        full_path = os.path.normpath(full_path)
-        
+        reader = get_repository_reader(repo)
+        if reader is None:
+            return Response(
+                {'error': 'Repository files not found'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+
         # Security check - ensure path is within repo directory
-        repo_dir = os.path.join(settings.CLONED_REPOS_DIR, repo_name)
-        if not full_path.startswith(repo_dir):
+        try:
+            file_path = normalize_repo_path(file_path)
+            blob = reader.stat(file_path)
+        except ValueError:
             return Response(
                 {'error': 'Invalid file path'},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        
-        if not os.path.exists(full_path) or not os.path.isfile(full_path):
+
+        if blob is None:
             return Response(
                 {'error': 'File not found'},
                 status=status.HTTP_404_NOT_FOUND
             )
-            
+
+        max_bytes = settings.FILE_CONTENT_MAX_BYTES
+        if blob.size > max_bytes:
+            return Response({
+                'purpose': 'Not summarized: the file is too large',
+                'components': [],
+                'description': f"{file_path} is {blob.size} bytes, over the {max_bytes} byte limit for summaries",
+                'size': blob.size,
+                'truncated': True
+            })
+
         try:
-            with open(full_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-                
+            with closing(reader.stream(file_path, 0, max_bytes)) as chunks:
+                content = b''.join(chunks).decode('utf-8')
+
             # Use the same Mistral model for consistency
             from api.services.repo_analyzer import RepoAnalyzer
             analyzer = RepoAnalyzer(
@@ -1061,13 +1537,15 @@ Focus on:
                 repo.repo_url,
                 file_path,
                 content,
-                prompt
+                prompt,
+                schema=FILE_SUMMARY_SCHEMA,
+                kind='file_summary'
             )
 
             
-            if isinstance(summary, dict) and summary.get('error'):
+            if isinstance(summary, ErrorResponse):
                 return Response(
-                    {'error': summary['error']},
+                    {'error': summary.error, 'details': summary.details},
                     status=status.HTTP_500_INTERNAL_SERVER_ERROR
                 )
                 
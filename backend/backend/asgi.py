@@ -2,6 +2,9 @@
 ASGI config for backend project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Analysis progress streams are only served through it (e.g.
+``uvicorn backend.asgi:application``), where they wait on coroutines instead
+of holding a worker thread each.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.0/howto/deployment/asgi/
@@ -14,3 +17,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 
 application = get_asgi_application()
+
+# With ANALYSIS_QUEUE=local the web process runs, and recovers, the analysis queue
+from api.services.analysis_runner import start_queue_poller  # noqa: E402
+
+start_queue_poller()
@@ -134,6 +134,16 @@ CORS_ALLOWED_ORIGINS = [
     "http://localhost:5173",  # Vite default port
 ]
 
+# Headers the file viewer reads from streamed file content responses
+CORS_EXPOSE_HEADERS = [
+    'ETag',
+    'Content-Range',
+    'X-Content-Total-Size',
+    'X-Content-Truncated',
+    'X-Line-Start',
+    'X-Line-End',
+]
+
 # Add REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
@@ -154,6 +164,169 @@ GITHUB_TOKEN = os.getenv('GITHUB_TOKEN')
 HUGGINGFACE_TOKEN = os.getenv('HUGGINGFACE_TOKEN')
 SONAR_TOKEN = os.getenv('SONAR_TOKEN')
 
+# GitHub API responses are cached per token in a file cache shared by every
+# worker. Entries younger than GITHUB_CACHE_FRESH_SECONDS are served as-is;
+# older ones are revalidated with their ETag, which costs no rate limit
+GITHUB_CACHE_ALIAS = 'github'
+GITHUB_CACHE_FRESH_SECONDS = int(os.getenv('GITHUB_CACHE_FRESH_SECONDS', 60))
+GITHUB_CACHE_TTL = int(os.getenv('GITHUB_CACHE_TTL', 24 * 60 * 60))
+GITHUB_MAX_PAGES = int(os.getenv('GITHUB_MAX_PAGES', 50))
+GITHUB_TIMEOUT = int(os.getenv('GITHUB_TIMEOUT', 15))
+
+# Rate limits: background work keeps GITHUB_RATE_LIMIT_RESERVE requests of
+# each token's budget for interactive use, and waits at most
+# GITHUB_RATE_LIMIT_MAX_WAIT seconds for a reset before giving up
+GITHUB_RATE_LIMIT_RESERVE = int(os.getenv('GITHUB_RATE_LIMIT_RESERVE', 200))
+GITHUB_RATE_LIMIT_MAX_WAIT = int(os.getenv('GITHUB_RATE_LIMIT_MAX_WAIT', 15 * 60))
+GITHUB_RATE_LIMIT_RETRIES = int(os.getenv('GITHUB_RATE_LIMIT_RETRIES', 3))
+
+# Outputs of completed analysis stages, so a retried or restarted analysis
+# resumes at the first stage that did not finish; larger outputs are not kept
+ANALYSIS_CHECKPOINT_CACHE_ALIAS = 'analysis_checkpoints'
+ANALYSIS_CHECKPOINT_TTL = int(os.getenv('ANALYSIS_CHECKPOINT_TTL', 2 * 24 * 60 * 60))
+ANALYSIS_CHECKPOINT_MAX_BYTES = int(os.getenv('ANALYSIS_CHECKPOINT_MAX_BYTES', 2 * 1024 * 1024))
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    GITHUB_CACHE_ALIAS: {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache', 'github'),
+        'TIMEOUT': GITHUB_CACHE_TTL,
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+    ANALYSIS_CHECKPOINT_CACHE_ALIAS: {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache', 'checkpoints'),
+        'TIMEOUT': ANALYSIS_CHECKPOINT_TTL,
+        'OPTIONS': {'MAX_ENTRIES': 2000},
+    },
+}
+
+# sonar-scanner executable (a path, or a command on PATH) and its worker pool.
+# SONAR_SCANNER_WORKERS=0 sizes the pool from the CPU count and the memory
+# budget (0 = half of physical memory) divided by the heap given to each JVM
+SONAR_SCANNER_PATH = os.getenv('SONAR_SCANNER_PATH', 'sonar-scanner.bat' if os.name == 'nt' else 'sonar-scanner')
+SONAR_SCANNER_WORKERS = int(os.getenv('SONAR_SCANNER_WORKERS', 0))
+SONAR_SCANNER_HEAP_MB = int(os.getenv('SONAR_SCANNER_HEAP_MB', 1024))
+SONAR_SCANNER_MEMORY_BUDGET_MB = int(os.getenv('SONAR_SCANNER_MEMORY_BUDGET_MB', 0))
+SONAR_SCANNER_TIMEOUT = int(os.getenv('SONAR_SCANNER_TIMEOUT', 30 * 60))
+SONAR_SCANNER_QUEUE_TIMEOUT = int(os.getenv('SONAR_SCANNER_QUEUE_TIMEOUT', 60 * 60))
+
+# Persistent scanner cache (JRE, plugins, analyzers) shared by every scan
+SONAR_USER_HOME = os.getenv('SONAR_USER_HOME', os.path.join(BASE_DIR, 'sonar-home'))
+
+# Built-in quick metrics engine: the "quick" analysis tier, and the fallback
+# when SonarQube fails. Repos with fewer files than the threshold skip the
+# process pool (0 workers = one per CPU)
+ANALYSIS_DEFAULT_MODE = os.getenv('ANALYSIS_DEFAULT_MODE', 'full')
+QUICK_METRICS_FALLBACK = os.getenv('QUICK_METRICS_FALLBACK', 'true').lower() == 'true'
+
+# Hard deadline of each analysis stage in seconds, retries included; a stage
+# past it is killed. A running analysis checks every
+# ANALYSIS_CANCEL_POLL_SECONDS whether it was cancelled from another process
+ANALYSIS_STAGE_TIMEOUTS = {
+    'plan': int(os.getenv('ANALYSIS_PLAN_TIMEOUT', 2 * 60)),
+    'clone': int(os.getenv('ANALYSIS_CLONE_TIMEOUT', 15 * 60)),
+    'ingest': int(os.getenv('ANALYSIS_INGEST_TIMEOUT', 10 * 60)),
+    'ai_summary': int(os.getenv('ANALYSIS_AI_SUMMARY_TIMEOUT', 5 * 60)),
+    'scan': int(os.getenv('ANALYSIS_SCAN_TIMEOUT', SONAR_SCANNER_QUEUE_TIMEOUT + SONAR_SCANNER_TIMEOUT)),
+    'results': int(os.getenv('ANALYSIS_RESULTS_TIMEOUT', 20 * 60)),
+}
+ANALYSIS_CANCEL_POLL_SECONDS = float(os.getenv('ANALYSIS_CANCEL_POLL_SECONDS', 5))
+
+# Analysis subprocesses (git, sonar-scanner) and analysis worker threads run
+# at this nice level and I/O priority (class 2 = best-effort, 3 = idle;
+# level 0-7, 7 lowest), so API requests keep their latency during scans.
+# Optional hard limits: CPU seconds and memory per subprocess (0 = none).
+# Subprocesses are started through nice, ionice and prlimit (util-linux), so
+# the limits hold from their first instruction and cover what they fork.
+# ANALYSIS_CGROUP is a delegated cgroup v2 directory; each subprocess enters
+# a cgroup of its own under it before exec, which holds the memory limit and
+# reports exact peak usage
+ANALYSIS_NICE = int(os.getenv('ANALYSIS_NICE', 10))
+ANALYSIS_IONICE_CLASS = int(os.getenv('ANALYSIS_IONICE_CLASS', 2))
+ANALYSIS_IONICE_LEVEL = int(os.getenv('ANALYSIS_IONICE_LEVEL', 7))
+ANALYSIS_CPU_LIMIT_SECONDS = int(os.getenv('ANALYSIS_CPU_LIMIT_SECONDS', 0))
+ANALYSIS_MEMORY_LIMIT_MB = int(os.getenv('ANALYSIS_MEMORY_LIMIT_MB', 0))
+ANALYSIS_CGROUP = os.getenv('ANALYSIS_CGROUP', '')
+QUICK_METRICS_WORKERS = int(os.getenv('QUICK_METRICS_WORKERS', 0))
+QUICK_METRICS_POOL_MIN_FILES = int(os.getenv('QUICK_METRICS_POOL_MIN_FILES', 50))
+
+# Pre-flight planning bounds each analysis: repositories whose text fits the
+# ingest budget go to the AI in full, larger ones send it a sample, and ones
+# past the scan budget are scanned only in their largest source directories
+ANALYSIS_PLAN_INGEST_MAX_FILES = int(os.getenv('ANALYSIS_PLAN_INGEST_MAX_FILES', 80))
+ANALYSIS_PLAN_INGEST_MAX_BYTES = int(os.getenv('ANALYSIS_PLAN_INGEST_MAX_BYTES', 200 * 1024))
+ANALYSIS_PLAN_INGEST_MAX_FILE_BYTES = int(os.getenv('ANALYSIS_PLAN_INGEST_MAX_FILE_BYTES', 32 * 1024))
+ANALYSIS_PLAN_SCAN_MAX_FILES = int(os.getenv('ANALYSIS_PLAN_SCAN_MAX_FILES', 10000))
+ANALYSIS_PLAN_SCAN_MAX_BYTES = int(os.getenv('ANALYSIS_PLAN_SCAN_MAX_BYTES', 64 * 1024 * 1024))
+
+# Analyses started by add_repository run on this many background threads and
+# report per-stage progress; set ANALYSIS_ASYNC=false to analyze inline
+ANALYSIS_ASYNC = os.getenv('ANALYSIS_ASYNC', 'true').lower() == 'true'
+ANALYSIS_WORKERS = int(os.getenv('ANALYSIS_WORKERS', 4))
+
+# Analysis jobs are queued in the database. ANALYSIS_QUEUE=local runs them on
+# the threads above in the web process, which also polls the queue every
+# ANALYSIS_JOB_POLL_SECONDS to pick up delayed, requeued and left-over jobs;
+# 'workers' leaves them to manage.py analysis_worker processes, on any host
+# sharing the database. Workers on other hosts than the web servers must
+# share CLONED_REPOS_DIR, the git-cache and cache directories and
+# ANALYSIS_LOCK_DIR with them (e.g. over NFS): the file browser reads the
+# workspaces and git caches the workers wrote, a requeued job resumes from
+# the checkpoints of the host that lost it, and the per-repository locks are
+# flocks. A running job's
+# lease is renewed every ANALYSIS_JOB_HEARTBEAT_SECONDS; once it lapses the
+# job is requeued, after a delay that doubles per attempt, until it has been
+# attempted ANALYSIS_JOB_MAX_ATTEMPTS times
+ANALYSIS_QUEUE = os.getenv('ANALYSIS_QUEUE', 'local')
+ANALYSIS_JOB_LEASE_SECONDS = int(os.getenv('ANALYSIS_JOB_LEASE_SECONDS', 120))
+ANALYSIS_JOB_HEARTBEAT_SECONDS = int(os.getenv('ANALYSIS_JOB_HEARTBEAT_SECONDS', 30))
+ANALYSIS_JOB_MAX_ATTEMPTS = int(os.getenv('ANALYSIS_JOB_MAX_ATTEMPTS', 3))
+ANALYSIS_JOB_RETRY_DELAY_SECONDS = int(os.getenv('ANALYSIS_JOB_RETRY_DELAY_SECONDS', 30))
+ANALYSIS_JOB_POLL_SECONDS = float(os.getenv('ANALYSIS_JOB_POLL_SECONDS', 5))
+
+# Refresh scheduler (manage.py refresh_repositories): how often it checks
+# every analyzed repository's head, the random spread of that interval, and
+# how many changed repositories one cycle may queue for re-analysis
+REFRESH_INTERVAL_SECONDS = int(os.getenv('REFRESH_INTERVAL_SECONDS', 60 * 60))
+REFRESH_JITTER = float(os.getenv('REFRESH_JITTER', 0.2))
+REFRESH_MAX_PER_CYCLE = int(os.getenv('REFRESH_MAX_PER_CYCLE', 20))
+
+# Push webhooks (api/github/webhook/) are verified with this secret; a push
+# is analyzed WEBHOOK_COALESCE_SECONDS after it arrives, and pushes to the
+# same repository in that window share one analysis of the newest commit
+GITHUB_WEBHOOK_SECRET = os.getenv('GITHUB_WEBHOOK_SECRET', '')
+WEBHOOK_COALESCE_SECONDS = float(os.getenv('WEBHOOK_COALESCE_SECONDS', 10))
+
+# Repositories one bulk import may link; their metadata is one GraphQL query
+BULK_IMPORT_MAX_REPOSITORIES = int(os.getenv('BULK_IMPORT_MAX_REPOSITORIES', 50))
+
+# Generate each repository's assessment in the background as soon as its
+# analysis completes, instead of when the candidate first opens it
+ASSESSMENT_PREWARM = os.getenv('ASSESSMENT_PREWARM', 'true').lower() == 'true'
+ASSESSMENT_PREWARM_WORKERS = int(os.getenv('ASSESSMENT_PREWARM_WORKERS', 2))
+
+# Times unparseable model output is sent back to be reformatted before the
+# review or file summary fails
+STRUCTURED_OUTPUT_REFORMAT_ATTEMPTS = int(os.getenv('STRUCTURED_OUTPUT_REFORMAT_ATTEMPTS', 1))
+
+# Assessments have ASSESSMENT_QUESTION_COUNT questions. The question bank
+# serves one without an LLM call once it holds at least
+# ASSESSMENT_BANK_MIN_PROJECT_QUESTIONS questions about the analyzed commit
+ASSESSMENT_QUESTION_COUNT = int(os.getenv('ASSESSMENT_QUESTION_COUNT', 5))
+ASSESSMENT_BANK_MIN_PROJECT_QUESTIONS = int(os.getenv('ASSESSMENT_BANK_MIN_PROJECT_QUESTIONS', 2))
+
+# Server-sent progress streams (served under ASGI only): how often they check
+# for changes, how often they send a keep-alive, when they end so the client
+# reconnects, and how long the token that opens one stays valid
+PROGRESS_STREAM_POLL_INTERVAL = float(os.getenv('PROGRESS_STREAM_POLL_INTERVAL', 1))
+PROGRESS_STREAM_KEEPALIVE = int(os.getenv('PROGRESS_STREAM_KEEPALIVE', 15))
+PROGRESS_STREAM_MAX_SECONDS = int(os.getenv('PROGRESS_STREAM_MAX_SECONDS', 15 * 60))
+PROGRESS_STREAM_TOKEN_SECONDS = int(os.getenv('PROGRESS_STREAM_TOKEN_SECONDS', 60))
+
 # Add these settings for JWT
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(days=1),
@@ -167,6 +340,65 @@ CLONED_REPOS_DIR = os.path.join(BASE_DIR, 'cloned')
 if not os.path.exists(CLONED_REPOS_DIR):
     os.makedirs(CLONED_REPOS_DIR)
 
+# Workspaces (per owner/repo/commit checkouts under CLONED_REPOS_DIR) are
+# evicted least-recently-used first once they exceed this many bytes.
+# WORKSPACE_GC_ON_STARTUP cleans up after crashed clones when runserver
+# starts; deployments run `manage.py maintain_workspaces` periodically
+WORKSPACE_QUOTA_BYTES = int(os.getenv('WORKSPACE_QUOTA_BYTES', 20 * 1024 ** 3))
+WORKSPACE_STAGING_MAX_AGE = int(os.getenv('WORKSPACE_STAGING_MAX_AGE', 6 * 60 * 60))
+WORKSPACE_GC_ON_STARTUP = os.getenv('WORKSPACE_GC_ON_STARTUP', 'true').lower() == 'true'
+
+# Per-repository lock files that keep worker processes from analyzing the
+# same repository at once, and how long a request waits for the lock
+ANALYSIS_LOCK_DIR = os.path.join(BASE_DIR, 'locks')
+ANALYSIS_LOCK_TIMEOUT = int(os.getenv('ANALYSIS_LOCK_TIMEOUT', 60 * 60))
+
+# Paging for the lazy file tree endpoint
+FILE_TREE_PAGE_SIZE = int(os.getenv('FILE_TREE_PAGE_SIZE', 200))
+FILE_TREE_MAX_PAGE_SIZE = int(os.getenv('FILE_TREE_MAX_PAGE_SIZE', 1000))
+
+# Largest body the file content endpoint will send; longer files are truncated
+FILE_CONTENT_MAX_BYTES = int(os.getenv('FILE_CONTENT_MAX_BYTES', 2 * 1024 * 1024))
+
+# Serve browsed files from git objects through pooled `git cat-file` processes
+# instead of the working tree, so repositories do not need a checkout
+REPO_READER_USE_GIT_OBJECTS = os.getenv('REPO_READER_USE_GIT_OBJECTS', 'true').lower() == 'true'
+GIT_CAT_FILE_POOL_SIZE = int(os.getenv('GIT_CAT_FILE_POOL_SIZE', 32))
+
+# Clone strategy: shallow, blob-less partial clones and sparse checkouts that
+# skip vendored and binary paths. GIT_CLONE_DEPTH=0 fetches full history and
+# shares one object cache between all clones via alternates; the cache stops
+# taking new packs past GIT_OBJECT_CACHE_QUOTA_BYTES (0 = no quota)
+GIT_CLONE_DEPTH = int(os.getenv('GIT_CLONE_DEPTH', 1))
+GIT_CLONE_FILTER = os.getenv('GIT_CLONE_FILTER', 'blob:none')
+GIT_SHARED_OBJECT_CACHE = os.getenv('GIT_SHARED_OBJECT_CACHE', 'true').lower() == 'true'
+GIT_OBJECT_CACHE_DIR = os.path.join(BASE_DIR, 'git-cache', 'objects.git')
+GIT_OBJECT_CACHE_QUOTA_BYTES = int(os.getenv('GIT_OBJECT_CACHE_QUOTA_BYTES', 5 * 1024 ** 3))
+GIT_SPARSE_EXCLUDES = [
+    'node_modules/',
+    'bower_components/',
+    'vendor/',
+    'third_party/',
+    'dist/',
+    'build/',
+    '*.min.js',
+    '*.min.css',
+    '*.map',
+    '*.png', '*.jpg', '*.jpeg', '*.gif', '*.bmp', '*.ico', '*.webp',
+    '*.pdf', '*.zip', '*.tar', '*.gz', '*.7z', '*.rar',
+    '*.jar', '*.war', '*.class', '*.exe', '*.dll', '*.so', '*.dylib', '*.bin',
+    '*.woff', '*.woff2', '*.ttf', '*.eot', '*.otf',
+    '*.mp3', '*.mp4', '*.mov', '*.avi', '*.wav',
+    '*.psd', '*.sqlite3', '*.db', '*.pkl', '*.h5', '*.onnx', '*.pt',
+]
+
+# Bare mirror per remote URL; repeat analyses fetch into it and check out
+# worktrees from it. Mirrors without worktrees are evicted LRU over the quota
+GIT_MIRROR_CACHE = os.getenv('GIT_MIRROR_CACHE', 'true').lower() == 'true'
+GIT_MIRROR_DIR = os.path.join(BASE_DIR, 'git-cache', 'mirrors')
+GIT_MIRROR_QUOTA_BYTES = int(os.getenv('GIT_MIRROR_QUOTA_BYTES', 10 * 1024 ** 3))
+GIT_MIRROR_MAINTENANCE_INTERVAL = int(os.getenv('GIT_MIRROR_MAINTENANCE_INTERVAL', 6 * 60 * 60))
+
 # Email settings
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'  # For development
 # For production, use SMTP:
@@ -10,11 +10,18 @@ urlpatterns = [
     path('api/github/callback/', views.github_callback, name='github-callback'),
     path('api/candidate/profile/', views.candidate_profile, name='candidate-profile'),
     path('api/github/repositories/', views.github_repositories, name='github-repositories'),
+    path('api/github/rate-limit/', views.github_rate_limit, name='github-rate-limit'),
+    path('api/github/webhook/', views.github_webhook, name='github-webhook'),
     path('api/repositories/add/', views.add_repository, name='add-repository'),
+    path('api/repositories/bulk-add/', views.bulk_add_repositories, name='bulk-add-repositories'),
     path('api/repositories/', views.get_linked_repositories, name='get-repositories'),
     path('api/repositories/<str:repo_id>/', views.get_repository, name='get-repository'),
     path('api/repositories/<str:repo_id>/delete/', views.delete_repository, name='delete-repository'),
     path('api/repositories/<str:repo_id>/summary/', views.get_repo_summary, name='repository-summary'),
+    path('api/repositories/<str:repo_id>/progress/', views.get_analysis_progress, name='analysis-progress'),
+    path('api/repositories/<str:repo_id>/progress/stream-token/', views.issue_stream_token, name='analysis-progress-stream-token'),
+    path('api/repositories/<str:repo_id>/progress/stream/', views.stream_analysis_progress, name='analysis-progress-stream'),
+    path('api/repositories/<str:repo_id>/cancel/', views.cancel_repository_analysis, name='cancel-analysis'),
     path('api/repositories/<str:repo_id>/assessment/', views.get_assessment, name='get-assessment'),
     path('api/repositories/<str:repo_id>/assessment/generate/', views.generate_assessment, name='generate-assessment'),
     path('api/assessment/<str:assessment_id>/submit/', views.submit_assessment, name='submit-assessment'),
@@ -29,6 +36,7 @@ urlpatterns = [
     
 
     path('api/repositories/<str:repo_id>/files/', views.get_repository_files, name='repository-files'),
+    path('api/repositories/<str:repo_id>/files/tree/', views.get_directory_listing, name='repository-directory'),
     path('api/repositories/<str:repo_id>/files/content/', views.get_file_content, name='file-content'),
     path('api/repositories/<str:repo_id>/files/summary/', views.get_file_summary, name='file-summary'),
     path('api/employer/candidates/<str:candidate_id>/contact/', views.contact_candidate, name='contact-candidate'),
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 
 application = get_wsgi_application()
+
+# With ANALYSIS_QUEUE=local the web process runs, and recovers, the analysis queue
+from api.services.analysis_runner import start_queue_poller  # noqa: E402
+
+start_queue_poller()
@@ -64,12 +64,12 @@ export default function Dashboard() {
     if (!pollingProjects.has(projectId)) {
       setPollingProjects(prev => new Set(prev).add(projectId));
       
-      repositoryService.startPolling(
+      repositoryService.subscribeToAnalysis(
         projectId,
         (updatedRepo) => {
           setProjects(prev => 
             prev.map(repo => 
-              repo.id === projectId ? updatedRepo : repo
+              repo.id === projectId ? { ...repo, ...updatedRepo } : repo
             )
           );
           
@@ -34,7 +34,7 @@ export interface Project {
   repo_url: string;
   description: string;
   languages: string[];
-  analysis_status: 'pending' | 'analyzing' | 'complete' | 'failed';
+  analysis_status: 'pending' | 'analyzing' | 'complete' | 'failed' | 'cancelled';
   analysis_results?: any;
   assessment?: any;
 }
@@ -9,11 +9,27 @@ export interface LinkedRepository {
   repo_url: string;
   description: string;
   languages: string[];
-  analysis_status: 'pending' | 'analyzing' | 'complete' | 'failed';
+  analysis_status: 'pending' | 'analyzing' | 'complete' | 'failed' | 'cancelled';
   analysis_results?: any;
+  analysis_progress?: AnalysisProgress;
   assessment_score?: number;
 }
 
+export interface AnalysisStage {
+  status: 'pending' | 'running' | 'complete' | 'failed' | 'skipped';
+  started_at?: string;
+  finished_at?: string;
+  result?: any;
+  error?: string;
+}
+
+export interface AnalysisProgress {
+  mode?: 'quick' | 'full';
+  started_at?: string;
+  updated_at?: string;
+  stages?: Record<string, AnalysisStage>;
+}
+
 export interface FileNode {
   name: string;
   path: string;
@@ -23,6 +39,16 @@ export interface FileNode {
   extension?: string;
   size?: number;
   content?: string;
+  child_count?: number;
+}
+
+export interface DirectoryPage {
+  path: string;
+  items: FileNode[];
+  page: number;
+  page_size: number;
+  total: number;
+  has_more: boolean;
 }
 
 export interface FileSummary {
@@ -42,6 +68,27 @@ export const repositoryService = {
     return response.data;
   },
 
+  async bulkAddRepositories(fullNames: string[]): Promise<{
+    created: LinkedRepository[];
+    skipped: { full_name: string; reason: string }[];
+  }> {
+    const response = await axios.post(
+      `${API_URL}/repositories/bulk-add/`,
+      { full_names: fullNames },
+      { headers: getAuthHeader() }
+    );
+    return response.data;
+  },
+
+  async cancelAnalysis(repoId: string): Promise<LinkedRepository> {
+    const response = await axios.post(
+      `${API_URL}/repositories/${repoId}/cancel/`,
+      {},
+      { headers: getAuthHeader() }
+    );
+    return response.data;
+  },
+
   // async getFileContent(repoId: string, filePath: string): Promise<string[]> {
   //   const response = await axios.get(
   //     `${API_URL}/repositories/${repoId}/file/${filePath}/`,
@@ -101,6 +148,86 @@ export const repositoryService = {
     return () => clearInterval(pollInterval);
   },
 
+  // Follow an analysis by polling, or over server-sent events when
+  // VITE_PROGRESS_STREAM is set because the API is served under ASGI
+  subscribeToAnalysis(repoId: string, onUpdate: (repo: Partial<LinkedRepository>) => void): () => void {
+    if (import.meta.env.VITE_PROGRESS_STREAM !== 'true' || typeof EventSource === 'undefined') {
+      return this.startPolling(repoId, onUpdate);
+    }
+
+    let source: EventSource | null = null;
+    let stopPolling: (() => void) | null = null;
+    let stopped = false;
+
+    const fallBackToPolling = () => {
+      source?.close();
+      if (!stopped && !stopPolling) {
+        stopPolling = this.startPolling(repoId, onUpdate);
+      }
+    };
+
+    // Stream tokens are short-lived, so every connection asks for a new one
+    // rather than letting EventSource reconnect with an expired URL
+    const open = async () => {
+      let token: string;
+      try {
+        const response = await axios.post(
+          `${API_URL}/repositories/${repoId}/progress/stream-token/`,
+          {},
+          { headers: getAuthHeader() }
+        );
+        token = response.data.token;
+      } catch (error) {
+        console.error('Could not open the progress stream:', error);
+        fallBackToPolling();
+        return;
+      }
+      if (stopped) {
+        return;
+      }
+
+      const stream = new EventSource(
+        `${API_URL}/repositories/${repoId}/progress/stream/?token=${encodeURIComponent(token)}`
+      );
+      source = stream;
+      let received = false;
+
+      stream.addEventListener('progress', (event) => {
+        received = true;
+        onUpdate(JSON.parse((event as MessageEvent).data));
+      });
+
+      stream.addEventListener('done', async () => {
+        stream.close();
+        try {
+          // The stream only carries progress; fetch the finished results once
+          onUpdate(await this.pollAnalysisStatus(repoId));
+        } catch (error) {
+          console.error('Failed to fetch analysis results:', error);
+        }
+      });
+
+      stream.onerror = () => {
+        stream.close();
+        // A stream that worked was closed by the server's time limit; one
+        // that never did is unavailable here and polling takes over
+        if (received) {
+          open();
+        } else {
+          fallBackToPolling();
+        }
+      };
+    };
+    open();
+
+    // Return cleanup function
+    return () => {
+      stopped = true;
+      source?.close();
+      stopPolling?.();
+    };
+  },
+
   async getFileStructure(id: string): Promise<FileNode[]> {
     try {
       const response = await axios.get(
@@ -114,13 +241,24 @@ export const repositoryService = {
     }
   },
 
+  async getDirectory(repoId: string, dirPath: string = '', page: number = 1): Promise<DirectoryPage> {
+    const response = await axios.get(
+      `${API_URL}/repositories/${repoId}/files/tree/`,
+      {
+        headers: getAuthHeader(),
+        params: { path: dirPath, page }
+      }
+    );
+    return response.data;
+  },
+
   async getFileContent(repoId: string, filePath: string): Promise<string> {
     try {
       const response = await axios.get(
         `${API_URL}/repositories/${repoId}/files/content/?path=${encodeURIComponent(filePath)}`,
-        { headers: getAuthHeader() }
+        { headers: getAuthHeader(), responseType: 'text' }
       );
-      return response.data.content;
+      return response.data;
     } catch (error) {
       console.error(`Error fetching file content for ${filePath}:`, error);
       return '';